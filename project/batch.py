@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+from contextlib import nullcontext
+from itertools import islice, zip_longest
+from urllib.parse import urlparse
+
+from metrics import ERRORS, record_crawl, timed
+from streaming import read_body_async
+
+#default limits for a batch, both can be overridden per request
+MAX_CONCURRENCY = 20
+PER_HOST_CONCURRENCY = 4
+#highest max_concurrency a request may ask for, the shared client's pool is sized for it
+MAX_CONCURRENCY_LIMIT = int(os.environ.get("MAX_CONCURRENCY_LIMIT", "100"))
+if MAX_CONCURRENCY_LIMIT < MAX_CONCURRENCY:
+    raise ValueError(f"MAX_CONCURRENCY_LIMIT must be at least {MAX_CONCURRENCY}")
+
+
+#crawler (lxml) and httpx are imported when a batch runs, a scoring process only reads the limits above
+
+
+def create_http_client(max_connections: int = MAX_CONCURRENCY):
+    #one pooled keep-alive httpx client shared by every batch
+    import httpx
+    from crawler import FETCH_TIMEOUT, HEADERS
+    return httpx.AsyncClient(
+        headers=HEADERS,
+        timeout=FETCH_TIMEOUT,
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_connections),
+    )
+
+
+class BatchCrawler:
+    def __init__(self, client, max_concurrency: int = MAX_CONCURRENCY,
+                 per_host_concurrency: int = PER_HOST_CONCURRENCY, pool=None, cache=None,
+                 include_timings: bool = False, scheduler=None):
+        from crawler import SCHEDULER
+        if max_concurrency < 1 or per_host_concurrency < 1:
+            raise ValueError("max_concurrency and per_host_concurrency must be at least 1")
+        #httpx.AsyncClient, see create_http_client
+        self.client = client
+        #PolitenessScheduler, per-host pacing is shared with every other crawl in the process
+        self.scheduler = scheduler or SCHEDULER
+        #ExtractionPool for process based extraction, None extracts in a thread
+        self.pool = pool
+        #HtmlCache for conditional re-fetch and reuse of unchanged pages
+        self.cache = cache
+        #keep the per-stage timings in each result, and count the page's elements for them. The stages are
+        #always timed and recorded in the metrics, the element count only when asked for
+        self.include_timings = include_timings
+        self.max_concurrency = max_concurrency
+        self.global_limit = asyncio.Semaphore(max_concurrency)
+        self.per_host_concurrency = per_host_concurrency
+        self.host_limits = {}
+
+    def host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self.host_limits[host]
+
+    def page_slot(self):
+        #with a process pool, a page holds one of the pool's slots from before its fetch until it is extracted
+        return self.pool.slots if self.pool is not None else nullcontext()
+
+    async def fetch(self, url: str, headers: dict = None):
+        #network wait happens on the event loop, no worker thread is held
+        from crawler import ProductCrawler
+        crawler = ProductCrawler(url)
+        #a global slot is only held while the request is on the wire, not while the host makes us wait
+        async with self.host_limit(url):
+            with timed("fetch"):
+                start = time.time()
+                crawler.response, _ = await self.scheduler.fetch_async(
+                    self.client, url, headers=headers, limit=self.global_limit, stream=True)
+                #streamed up to the size cap, non-html bodies are not read at all
+                crawler.html, crawler.fetch_info = await read_body_async(crawler.response)
+        return crawler, int((time.time() - start) * 1000)
+
+    async def crawl_page(self, url: str) -> dict:
+        #the extracted page, or a result with "error" when it could not be extracted. Fetch failures
+        #(robots.txt, connection errors) are raised
+        async with self.page_slot():
+            entry = await asyncio.to_thread(self.cache.get, url) if self.cache else None
+            crawler, load_time = await self.fetch(url, self.cache.conditional_headers(entry) if self.cache else None)
+            if self.cache is not None:
+                result = await asyncio.to_thread(self.cache.reuse, entry, crawler, load_time)
+                if result is not None:
+                    return result
+            #extraction is CPU bound, keep it off the event loop
+            if self.pool is not None:
+                result = await self.pool.extract(crawler, load_time, self.include_timings)
+            else:
+                result = await asyncio.to_thread(crawler.extract, load_time, timings=True,
+                                                 count_nodes=self.include_timings)
+            record_crawl(result, self.include_timings)
+            if self.cache is not None and "error" not in result:
+                await asyncio.to_thread(self.cache.put, crawler, result)
+            return result
+
+    async def crawl(self, url: str) -> dict:
+        #crawl_page with every failure turned into an error result, one bad page does not stop a batch
+        try:
+            return await self.crawl_page(url)
+        except Exception as e:
+            ERRORS.inc("crawl")
+            return {"error": str(e), "url": url}
+
+    async def survey(self, crawler, load_time: int) -> dict:
+        #page type and links of a fetched page, see ProductCrawler.survey. Fetched inside page_slot()
+        if self.pool is not None:
+            return await self.pool.survey(crawler, load_time)
+        return await asyncio.to_thread(crawler.survey, load_time)
+
+    async def crawl_all(self, urls):
+        #yields (url, result) as each page completes, not in request order. At most max_concurrency pages are
+        #in flight, from the start of their fetch until they are extracted and handed over, so a batch holds
+        #that many bodies at most and slow extraction (or a slow consumer) slows fetching down
+        pending = iter(interleave_hosts(dict.fromkeys(urls)))
+        running = set()
+
+        async def crawl_one(url):
+            return url, await self.crawl(url)
+
+        try:
+            while True:
+                for url in islice(pending, self.max_concurrency - len(running)):
+                    running.add(asyncio.ensure_future(crawl_one(url)))
+                if not running:
+                    return
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in running:
+                task.cancel()
+
+
+def interleave_hosts(urls):
+    #round robin over the hosts, so the pages in flight are not all waiting for one host
+    by_host = {}
+    for url in urls:
+        by_host.setdefault(urlparse(url).netloc, []).append(url)
+    return [url for group in zip_longest(*by_host.values()) for url in group if url is not None]
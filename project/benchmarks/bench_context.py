@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawl_store import CrawlStore
+from crawler import ProductCrawler
+from llm_context import CONTEXT_TOKENIZER, ContextCache, LLMContextBuilder, token_counter
+from pages import CORPUS
+from score_cache import ScoreCache
+
+#==========================================================================
+# LLM context excerpts per page shape: the character cut the builder used
+# to make (a whitespace pass over the whole text, 600 + 1200 characters)
+# against the ranked excerpt at a token budget, with the tokens each one
+# comes to. Then bulk(): contexts of --crawls stored crawls with an empty
+# cache, and again once they are memoized
+#==========================================================================
+
+
+def char_excerpt(crawl, limit=1200):
+    #the excerpt before token budgets, kept here for the comparison
+    text = re.sub(r"\s+", " ", crawl.get("clean_text", "")).strip()
+    content = crawl.get("content", {})
+    sections = [text[:600]] if text else []
+    if content.get("features"):
+        sections.append("Key features: " + ".".join(content["features"][:6]))
+    if content.get("specifications"):
+        sections.append("Specifications: " + ". ".join(
+            f"{k}: {v}" for k, v in list(content["specifications"].items())[:5]))
+    combined = " ".join(sections)
+    if len(combined) > limit:
+        truncated = combined[:limit]
+        combined = truncated[:truncated.rfind(".") + 1] if "." in truncated else truncated
+    return combined
+
+
+def timed(func, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return value, samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="character vs token budgeted context excerpts, bulk contexts")
+    parser.add_argument("--budget", type=int, default=300)
+    parser.add_argument("--crawls", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    count = token_counter()
+    results = {name: json.loads(json.dumps(ProductCrawler.from_html("https://x/p", build()).extract(0)))
+               for name, build in CORPUS.items()}
+
+    print(f"tokenizer {CONTEXT_TOKENIZER}, budget {args.budget} tokens")
+    print(f"{'page':<14}{'text KB':>9}{'chars ms':>10}{'tokens':>8}{'ranked ms':>11}{'tokens':>8}")
+    for name, result in results.items():
+        old, old_seconds = timed(lambda: char_excerpt(result), args.repeat)
+        builder = LLMContextBuilder(result, {}, args.budget)
+        new, new_seconds = timed(builder.get_excerpt, args.repeat)
+        print(f"{name:<14}{len(result['clean_text']) / 1024:>9.1f}{old_seconds * 1000:>10.2f}{count(old):>8}"
+              f"{new_seconds * 1000:>11.2f}{count(new):>8}")
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = CrawlStore(os.path.join(folder, "crawls.sqlite"))
+        shapes = list(results.values())
+        for i in range(args.crawls):
+            result = shapes[i % len(shapes)]
+            result["page_info"]["url"] = f"https://shop.example.com/p/{i}"
+            store.save(result)
+        cache = ContextCache(os.path.join(folder, "contexts.sqlite"),
+                             ScoreCache(os.path.join(folder, "scores.sqlite")))
+        built, cold = timed(lambda: sum(1 for _ in cache.bulk(store, budget=args.budget)))
+        _, warm = timed(lambda: sum(1 for _ in cache.bulk(store, budget=args.budget)))
+        print(f"\nbulk {built} crawls: empty cache {cold / built * 1000:.1f} ms per crawl, "
+              f"memoized {warm / built * 1000:.1f} ms per crawl")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar_export import ColumnarExporter, open_dataset
+from crawl_store import CrawlStore
+from crawler import ProductCrawler
+from pages import CORPUS
+from score_cache import ScoreCache
+
+#==========================================================================
+# Loading crawl history for analysis: the legacy layout (one indented json
+# file per crawl, json.load each) vs the columnar export (one read of the
+# typed crawls dataset, texts only when asked for). Crawls are synthetic
+# pages spread over --domains hosts and --days dates, all scored; a second
+# export run checks that appends only write the new crawls
+#==========================================================================
+
+
+def build(folder, count, domains, days, start_id=0):
+    store = CrawlStore(os.path.join(folder, "crawls.sqlite"))
+    scores = ScoreCache(os.path.join(folder, "scores.sqlite"))
+    shapes = [build_page() for build_page in CORPUS.values()]
+    results = [ProductCrawler.from_html("https://x/p", html).extract(0) for html in shapes]
+    first_day = datetime(2026, 1, 1)
+    for i in range(start_id, start_id + count):
+        result = json.loads(json.dumps(results[i % len(results)]))
+        result.pop("timings", None)
+        url = f"https://shop{i % domains}.example.com/p/{i}"
+        result["page_info"].update(url=url, final_url=url,
+                                  crawl_timestamp=(first_day + timedelta(days=i % days, seconds=i)).isoformat())
+        crawl_id = store.save(result)
+        result["crawl_id"] = crawl_id
+        score = scores.score(result)
+        store.set_score(crawl_id, score)
+        #the layout analysts load today
+        with open(os.path.join(folder, f"crawl_{crawl_id}.json"), "w", encoding="utf-8") as f:
+            json.dump({**result, "score": score}, f, indent=2, ensure_ascii=False)
+    return store, scores
+
+
+def timed(func):
+    start = time.perf_counter()
+    value = func()
+    return value, time.perf_counter() - start
+
+
+def load_json_files(folder):
+    crawls = []
+    for path in glob.glob(os.path.join(folder, "crawl_*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            crawls.append(json.load(f))
+    return crawls
+
+
+def folder_mb(folder, pattern):
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(folder, pattern), recursive=True)) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="json files vs columnar export load times")
+    parser.add_argument("--crawls", type=int, default=2000)
+    parser.add_argument("--domains", type=int, default=5)
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--format", default="parquet", choices=("parquet", "arrow"))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        store, scores = build(folder, args.crawls, args.domains, args.days)
+        out = os.path.join(folder, "export")
+        first, export_seconds = timed(ColumnarExporter(store, scores, out, args.format).run)
+        crawls, json_seconds = timed(lambda: load_json_files(folder))
+        table, crawls_seconds = timed(lambda: open_dataset(out).to_table())
+        texts, texts_seconds = timed(lambda: open_dataset(out, "texts").to_table())
+        extension = "parquet" if args.format == "parquet" else "arrow"
+        print(f"{len(crawls)} crawls, {args.domains} domains x {args.days} days")
+        print(f"json files        {folder_mb(folder, 'crawl_*.json'):>8.1f} MB  load {json_seconds:>7.2f} s")
+        print(f"crawls dataset    {folder_mb(out, f'crawls/**/*.{extension}'):>8.1f} MB  load {crawls_seconds:>7.2f} s"
+              f"  ({table.num_rows} rows x {table.num_columns} columns)")
+        print(f"texts dataset     {folder_mb(out, f'texts/**/*.{extension}'):>8.1f} MB  load {texts_seconds:>7.2f} s")
+        print(f"first export      {first['exported']} crawls in {export_seconds:.2f} s")
+
+        build(folder, args.crawls // 10, args.domains, args.days, start_id=args.crawls)
+        second, append_seconds = timed(ColumnarExporter(store, scores, out, args.format).run)
+        rows = open_dataset(out).count_rows()
+        print(f"append            {second['exported']} crawls in {append_seconds:.2f} s, {rows} rows in total")
+
+
+if __name__ == "__main__":
+    main()
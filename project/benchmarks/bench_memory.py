@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#==========================================================================
+# Peak RSS of one crawl of an oversized page, with and without the body
+# size cap. Every crawl runs in a fresh process so ru_maxrss belongs to that
+# crawl alone; the stub host streams the page in chunks, like a slow origin
+# would. "pdf" is a large non-html body that should not be read at all
+#==========================================================================
+ROW = ("<tr><td>Feature {i}</td><td>Breathable mesh upper with cushioned sole and reinforced heel "
+       "&amp; toe</td></tr>\n")
+HEAD = ('<html><head><meta charset="utf-8"><title>Huge catalogue</title>'
+        '<script type="application/ld+json">{"@type": "Product", "name": "Huge", "offers": '
+        '{"price": "10", "priceCurrency": "USD"}}</script></head><body><h1>Huge catalogue</h1><table>\n')
+
+
+def stub_host(size_mb):
+    rows = "".join(ROW.format(i=i) for i in range(1000)).encode()
+    repeats = max(1, int(size_mb * 1024 * 1024 / len(rows)))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/robots.txt":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            content_type = "application/pdf" if self.path == "/pdf" else "text/html"
+            length = len(HEAD) + repeats * len(rows)
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(length))
+            self.end_headers()
+            try:
+                self.wfile.write(HEAD.encode())
+                for _ in range(repeats):
+                    self.wfile.write(rows)
+            except (BrokenPipeError, ConnectionResetError):
+                #the crawler hung up at its size cap
+                pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def child(url, mode):
+    #MAX_PAGE_MB is read from the environment at import
+    from batch import BatchCrawler, create_http_client
+    from crawler import ProductCrawler
+
+    async def crawl_async():
+        async with create_http_client() as client:
+            return await BatchCrawler(client).crawl(url)
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    result = asyncio.run(crawl_async()) if mode == "async" else ProductCrawler(url).build()
+    seconds = time.perf_counter() - start
+    info = result.get("page_info", {})
+    print(json.dumps({
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "import_mb": baseline / 1024,
+        "seconds": seconds,
+        "bytes": info.get("bytes_downloaded"),
+        "truncated": info.get("truncated"),
+        "error": result.get("error"),
+    }))
+
+
+def measure(url, mode, cap_mb):
+    env = {**os.environ, "MAX_PAGE_MB": str(cap_mb), "RESPECT_ROBOTS": "0"}
+    output = subprocess.run([sys.executable, __file__, "--child", url, "--mode", mode],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="peak memory of crawling oversized pages")
+    parser.add_argument("--size-mb", type=float, default=40, help="size of the served page")
+    parser.add_argument("--caps", default="5,1000", help="comma separated MAX_PAGE_MB values")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="sync", choices=("sync", "async"))
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child, args.mode)
+
+    server = stub_host(args.size_mb)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"page: {args.size_mb:.0f} MB")
+    print(f"{'path':<6}{'mode':<7}{'cap MB':>8}{'read MB':>9}{'truncated':>11}"
+          f"{'imports MB':>12}{'peak MB':>9}{'seconds':>9}  error")
+    for path in ("/page", "/pdf"):
+        for mode in ("sync", "async"):
+            for cap in args.caps.split(","):
+                row = measure(base + path, mode, float(cap))
+                read = (row["bytes"] or 0) / 1024 / 1024
+                print(f"{path:<6}{mode:<7}{float(cap):>8.0f}{read:>9.1f}{str(row['truncated']):>11}"
+                      f"{row['import_mb']:>12.0f}{row['peak_mb']:>9.0f}{row['seconds']:>9.2f}  {row['error'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import argparse
+import os
+import re
+import sys
+import time
+from urllib.parse import urljoin, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import extruct
+from bs4 import BeautifulSoup
+from readability import Document
+
+from crawler import ProductCrawler, page_structure
+from pages import load_pages
+
+#==========================================================================
+# The same extraction stages, as ProductCrawler.extract() times them, run
+# by the old pipeline and by the single-parse one. The old side is the
+# BeautifulSoup code the crawler used to have, kept here for the
+# comparison: one soup per page, extruct for every syntax, and a second
+# soup plus readability for the clean text. Fingerprinting, the price
+# fallback and page classification only exist on the new side and are
+# left out of both. The new side's clean_text runs in the configured
+# CONTENT_EXTRACTION mode: the text is the old one in "always" mode, in
+# "adaptive" mode list_heavy loses its title, nav and footer text (see
+# tests/test_extraction.py)
+#==========================================================================
+URL = "https://shop.example.com/p/runner"
+STAGES = ("parse", "metadata", "schema", "structure", "links", "trust", "clean_text")
+TRUST_KEYWORDS = {
+    "has_return_policy": ["return policy", "returns"],
+    "has_refund_policy": ["refund policy", "refunds"],
+    "has_warranty_info": ["warranty"],
+    "has_shipping_info": ["shipping", "delivery"],
+    "has_cancellation_policy": ["cancellation"],
+    "mentions_secure_payment": ["secure payment", "100% secure", "ssl"],
+    "has_cod_option": ["cash on delivery", "cod"],
+    "mentions_reviews": ["review", "ratings"],
+    "mentions_testimonials": ["testimonial"],
+    "official_store_claim": ["official store", "authorized seller"],
+}
+
+
+class LegacyExtraction:
+    #the old extractors, one method per stage
+    def __init__(self, html):
+        self.html = html
+        self.soup = None
+
+    def parse(self):
+        self.soup = BeautifulSoup(self.html, "lxml")
+
+    def metadata(self):
+        title = self.soup.title.string.strip() if self.soup.title and self.soup.title.string else ""
+        meta_tag = self.soup.find("meta", attrs={"name": "description"})
+        canonical_tag = self.soup.find("link", rel="canonical")
+        meta_desc = meta_tag.get("content", " ") if meta_tag else ""
+        return title, meta_desc, canonical_tag.get("href", "") if canonical_tag else ""
+
+    def schema(self):
+        schema_data = extruct.extract(self.html, base_url=URL).get("json-ld", [])
+        return [item for item in schema_data if isinstance(item, dict) and item.get("@type") == "Product"]
+
+    def structure(self):
+        headings = [{"level": f"h{level}", "text": h.get_text(strip=True)}
+                    for level in range(1, 7) for h in self.soup.find_all(f"h{level}")]
+        features = []
+        for ul in self.soup.find_all("ul"):
+            if ul.find_parent(["nav", "footer", "header"]):
+                continue
+            items = [text for text in (li.get_text(strip=True) for li in ul.find_all("li"))
+                     if len(text) > 10 and text.lower() not in ("home", "about", "contact")]
+            if 2 <= len(items) <= 20:
+                features.extend(items)
+        specs = {}
+        for table in self.soup.find_all("table"):
+            rows = table.find_all("tr")
+            if table.find_parent(["nav", "footer"]) or len(rows) < 2:
+                continue
+            for row in rows:
+                cols = row.find_all(["td", "th"])
+                if len(cols) == 2:
+                    key, value = cols[0].get_text(strip=True), cols[1].get_text(strip=True)
+                    if 2 <= len(key) <= 100 and 2 <= len(value) <= 300:
+                        specs.setdefault(key, value)
+        return headings, list(dict.fromkeys(features))[:20], specs
+
+    def links(self):
+        internal, external = {}, {}
+        base_domain = urlparse(URL).netloc
+        for a in self.soup.find_all("a", href=True):
+            href = a["href"].strip()
+            if href.startswith(("#", "javascript", "mailto:", "tel:")):
+                continue
+            link = urljoin(URL, href)
+            parsed = urlparse(link)
+            if not parsed.scheme.startswith("http"):
+                continue
+            internal_link = parsed.netloc == base_domain or parsed.netloc.endswith("." + base_domain)
+            (internal if internal_link else external).setdefault(link, a.get_text(strip=True))
+        return internal, external
+
+    def trust(self):
+        text = self.soup.get_text(" ", strip=True).lower()
+        links = [a.get_text(strip=True).lower() for a in self.soup.find_all("a")]
+        trust = {key: any(keyword in text for keyword in keywords) for key, keywords in TRUST_KEYWORDS.items()}
+        trust["has_contact_page"] = any("contact" in link for link in links)
+        trust["has_about_page"] = any("about" in link for link in links)
+        trust["mentions_phone"] = bool(re.search(r"\+?\d[\d\s-]{8,}", text))
+        trust["mentions_email"] = bool(re.search(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", text))
+        return trust
+
+    def clean_text(self):
+        soup = BeautifulSoup(self.html, "lxml")
+        for tag in soup(["script", "style", "noscript"]):
+            tag.decompose()
+        raw_text = soup.get_text(separator=" ", strip=True)
+        readable_text = BeautifulSoup(Document(self.html).summary(), "lxml").get_text(separator=" ", strip=True)
+        final_text = readable_text if len(readable_text) > len(raw_text) * 0.6 else raw_text
+        final_text = " ".join(final_text.split())
+        return final_text, len(final_text.split())
+
+
+class SingleParseExtraction:
+    #ProductCrawler's extractors over one shared lxml tree, grouped as extract() groups them
+    def __init__(self, html):
+        self.crawler = ProductCrawler(URL)
+        self.crawler.html = html
+
+    def parse(self):
+        self.crawler.parse()
+
+    def metadata(self):
+        return self.crawler.extract_metadata()
+
+    def schema(self):
+        return self.crawler.parse_product_schema(self.crawler.extract_schema())
+
+    def structure(self):
+        structure = page_structure(self.crawler.tree)
+        return (self.crawler.extract_headings(structure), self.crawler.extract_features(structure),
+                self.crawler.extract_specifications(structure))
+
+    def links(self):
+        return self.crawler.extract_links()
+
+    def trust(self):
+        return self.crawler.detect_trust_signal()
+
+    def clean_text(self):
+        return self.crawler.extract_clean_text()
+
+
+def stage_times(pipeline, html, repeat):
+    #best of repeat runs per stage, in ms. Every run starts from a fresh parse
+    best = dict.fromkeys(STAGES, float("inf"))
+    for _ in range(repeat):
+        extraction = pipeline(html)
+        for stage in STAGES:
+            start = time.perf_counter()
+            getattr(extraction, stage)()
+            best[stage] = min(best[stage], (time.perf_counter() - start) * 1000)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="old vs single-parse extraction, stage by stage")
+    parser.add_argument("pages", nargs="*", help="saved product pages (.html) as glob patterns")
+    parser.add_argument("--no-synthetic", action="store_true", help="only the saved pages")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    pages = load_pages(args.pages, corpus=not args.no_synthetic)
+
+    totals = {"legacy": dict.fromkeys(STAGES, 0.0), "single": dict.fromkeys(STAGES, 0.0)}
+    print(f"{'page':<24}{'KB':>8}{'legacy ms':>12}{'single-parse ms':>17}{'speed-up':>10}")
+    for name, html in pages.items():
+        legacy = stage_times(LegacyExtraction, html, args.repeat)
+        single = stage_times(SingleParseExtraction, html, args.repeat)
+        for stage in STAGES:
+            totals["legacy"][stage] += legacy[stage]
+            totals["single"][stage] += single[stage]
+        legacy_ms, single_ms = sum(legacy.values()), sum(single.values())
+        print(f"{name:<24}{len(html) / 1024:>8.0f}{legacy_ms:>12.1f}{single_ms:>17.1f}{legacy_ms / single_ms:>9.1f}x")
+
+    print(f"\n{'stage, all pages':<24}{'':>8}{'legacy ms':>12}{'single-parse ms':>17}{'speed-up':>10}")
+    for stage in STAGES:
+        legacy_ms, single_ms = totals["legacy"][stage], totals["single"][stage]
+        print(f"{stage:<24}{'':>8}{legacy_ms:>12.1f}{single_ms:>17.1f}{legacy_ms / max(single_ms, 1e-6):>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
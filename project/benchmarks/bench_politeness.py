@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch import BatchCrawler, create_http_client
+from crawler import HEADERS
+from politeness import PolitenessScheduler
+
+#==========================================================================
+# Politeness scheduler against local stub hosts: a "strict" host answers
+# 429 + Retry-After whenever it sees more than --limit requests a second
+# (and 503 once per /flaky page), a "fast" host never throttles. Reports
+# throughput per host, how many 429s were needed and the failed pages
+#==========================================================================
+PAGE = "<html><head><title>{path}</title></head><body><h1>{path}</h1><p>stub page</p></body></html>"
+
+
+def stub_host(limit=None, robots=""):
+    log = []
+    seen = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body=b"", headers=()):
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/robots.txt":
+                return self.reply(200, robots.encode()) if robots else self.reply(404)
+            now = time.monotonic()
+            recent = sum(1 for t, _ in log if now - t < 1.0)
+            if limit and recent >= limit:
+                log.append((now, 429))
+                return self.reply(429, b"slow down", [("Retry-After", "1")])
+            if self.path.startswith("/flaky") and self.path not in seen:
+                seen.add(self.path)
+                log.append((now, 503))
+                return self.reply(503)
+            log.append((now, 200))
+            self.reply(200, PAGE.format(path=self.path).encode())
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.log = log
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def crawl(urls, rate, concurrency, per_host):
+    scheduler = PolitenessScheduler(HEADERS["User-Agent"], rate=rate)
+    async with create_http_client(concurrency) as client:
+        batch = BatchCrawler(client, concurrency, per_host, scheduler=scheduler)
+        done = {}
+        async for url, result in batch.crawl_all(urls):
+            done[url] = (result, time.monotonic())
+        return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="per-host politeness against throttling stub servers")
+    parser.add_argument("--pages", type=int, default=30, help="pages per host")
+    parser.add_argument("--limit", type=int, default=2, help="requests per second the strict host allows")
+    parser.add_argument("--rate", type=float, default=4, help="starting per-host rate of the scheduler")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--per-host", type=int, default=4)
+    args = parser.parse_args()
+
+    strict = stub_host(limit=args.limit, robots="User-agent: *\nDisallow: /private\n")
+    fast = stub_host()
+    hosts = {"strict": strict, "fast": fast}
+    urls = {name: [f"http://127.0.0.1:{server.server_address[1]}/p{i}" for i in range(args.pages)]
+            for name, server in hosts.items()}
+    urls["strict"] += [f"http://127.0.0.1:{strict.server_address[1]}/{path}" for path in ("flaky1", "private/x")]
+
+    start = time.monotonic()
+    done = asyncio.run(crawl([url for host in urls.values() for url in host], args.rate,
+                             args.concurrency, args.per_host))
+    print(f"{'host':<8}{'pages':>7}{'failed':>8}{'429s':>7}{'503s':>7}{'seconds':>9}{'pages/sec':>11}")
+    for name, server in hosts.items():
+        results = [done[url] for url in urls[name]]
+        failed = [result.get("error") for result, _ in results if "error" in result]
+        seconds = max(finished for _, finished in results) - start
+        statuses = [status for _, status in server.log]
+        print(f"{name:<8}{len(results):>7}{len(failed):>8}{statuses.count(429):>7}{statuses.count(503):>7}"
+              f"{seconds:>9.1f}{(len(results) - len(failed)) / seconds:>11.2f}")
+        for error in failed:
+            print(f"    {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler import ProductCrawler
+from extraction_pool import ExtractionPool
+from pages import CORPUS
+
+#==========================================================================
+# Batch extraction throughput by number of worker processes.
+# Fetching is left out, only the CPU bound part is measured
+#==========================================================================
+URL = "https://shop.example.com/p/runner"
+
+
+async def run_batch(pool, pages):
+    crawlers = [ProductCrawler.from_html(URL, html) for html in pages]
+    await asyncio.gather(*(pool.extract(crawler, 0) for crawler in crawlers))
+
+
+async def measure(workers, pages):
+    pool = ExtractionPool(workers)
+    try:
+        await pool.start()
+        start = time.perf_counter()
+        await run_batch(pool, pages)
+        return len(pages) / (time.perf_counter() - start)
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="extraction pool throughput benchmark")
+    parser.add_argument("--pages", type=int, default=200, help="pages per batch")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--shape", default="typical", choices=sorted(CORPUS))
+    args = parser.parse_args()
+
+    pages = [CORPUS[args.shape]()] * args.pages
+    single = None
+    print(f"{'workers':>8}{'pages/sec':>12}{'scaling':>10}")
+    counts = sorted({2 ** i for i in range(args.max_workers.bit_length()) if 2 ** i <= args.max_workers}
+                    | {args.max_workers})
+    for workers in counts:
+        rate = asyncio.run(measure(workers, pages))
+        single = single or rate
+        print(f"{workers:>8}{rate:>12.1f}{rate / single:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT)
+
+#==========================================================================
+# Response size and latency of the crawl, score and context endpoints,
+# full results against fields= projections, and the cost of the encoding
+# itself: FastAPI's jsonable_encoder + json (what every endpoint paid
+# before) against orjson. Batch crawls compare the time to the first
+# result of the NDJSON stream with the buffered response. Pages come from
+# a local stub host, the app runs under uvicorn in an empty data folder
+#==========================================================================
+PROJECTIONS = {
+    "crawl": "product,page_info.url,page_info.title,page_info.page_type",
+    "score": "final_score,ai_readiness_pct,readiness_band",
+    "context": "ai_visibility_summary,weak_areas",
+}
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return value, samples[len(samples) // 2] * 1000
+
+
+def start_app(app):
+    import uvicorn
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="response size and latency with and without projections")
+    parser.add_argument("--pages", nargs="*", default=["typical", "huge", "link_heavy"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=20, help="urls per batch crawl")
+    args = parser.parse_args()
+
+    os.environ.setdefault("RESPECT_ROBOTS", "0")
+    os.environ.setdefault("HOST_RATE", "1000")
+    os.environ.setdefault("HOST_BURST", "1000")
+    import httpx
+    from fastapi.encoders import jsonable_encoder
+    from bench_suite import serve
+    from pages import CORPUS
+    from serialization import dumps_bytes
+
+    server = serve({name: CORPUS[name]() for name in args.pages})
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["DATA_FOLDER"] = tempfile.mkdtemp()
+    import main as app_main
+    app_server, app_url = start_app(app_main.app)
+    client = httpx.Client(base_url=app_url, timeout=600)
+
+    print(f"{'page':<12}{'endpoint':<9}{'full KB':>9}{'fields KB':>11}{'full ms':>9}{'fields ms':>11}"
+          f"{'json ms':>9}{'orjson ms':>11}")
+    for name in args.pages:
+        url = f"{base}/{name}"
+        crawl_id = client.post("/crawl_product", json={"url": url}).json()["crawl_id"]
+        calls = {
+            "crawl": lambda fields: client.post("/crawl_product", json={"url": url, "fields": fields}),
+            "score": lambda fields: client.post("/score_product", json={"crawl_id": crawl_id, "fields": fields}),
+            "context": lambda fields: client.post("/geo_context", json={"crawl_id": crawl_id, "fields": fields}),
+        }
+        for endpoint, call in calls.items():
+            full, full_ms = timed(lambda: call(None), args.repeat)
+            projected, fields_ms = timed(lambda: call(PROJECTIONS[endpoint]), args.repeat)
+            body = full.json()
+            _, json_ms = timed(lambda: json.dumps(jsonable_encoder(body)).encode("utf-8"), args.repeat)
+            _, orjson_ms = timed(lambda: dumps_bytes(body), args.repeat)
+            print(f"{name:<12}{endpoint:<9}{len(full.content) / 1024:>9.1f}{len(projected.content) / 1024:>11.1f}"
+                  f"{full_ms:>9.1f}{fields_ms:>11.1f}{json_ms:>9.2f}{orjson_ms:>11.2f}")
+        #what the crawl used to be written to disk as, against the compact stored row
+        data = calls["crawl"](None).json()["data"]
+        indented = len(json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"))
+        print(f"{name:<12}stored as indent=2 json {indented / 1024:.1f} KB, compact {len(dumps_bytes(data)) / 1024:.1f} KB")
+
+    #distinct urls per run, neither run is served from the html cache
+    urls = [f"{base}/{args.pages[i % len(args.pages)]}?run=buffered&n={i}" for i in range(args.batch)]
+    start = time.perf_counter()
+    buffered = client.post("/crawl_batch", json={"urls": urls})
+    buffered_ms = (time.perf_counter() - start) * 1000
+    urls = [url.replace("run=buffered", "run=stream") for url in urls]
+    start = time.perf_counter()
+    first_ms, lines = None, 0
+    with client.stream("POST", "/crawl_batch", json={"urls": urls, "stream": True}) as response:
+        for line in response.iter_lines():
+            if line:
+                lines += 1
+                first_ms = first_ms or (time.perf_counter() - start) * 1000
+    stream_ms = (time.perf_counter() - start) * 1000
+    print(f"\nbatch of {args.batch}: buffered {buffered_ms:.0f} ms ({len(buffered.content) / 1024:.1f} KB), "
+          f"stream first line {first_ms:.0f} ms, last {stream_ms:.0f} ms ({lines} lines)")
+    app_server.should_exit = True
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bulk_scoring import BulkScoringEngine
+from scoring import AIScoringEngine
+
+#==========================================================================
+# compute_score() one record at a time vs BulkScoringEngine.
+# Every bulk result is checked against compute_score() first
+#==========================================================================
+TRUST_SIGNALS = ("has_return_policy", "has_warranty_info", "has_shipping_info", "mentions_secure_payment",
+                 "has_contact_page", "mentions_reviews", "uses_https")
+
+
+def random_record(rng):
+    text = lambda: rng.choice(("", "Acme", "Acme Runner", "Acme Runner Shoe Model"))
+    return {
+        "product": {"name": text(), "brand": text(), "sku": text(), "currency": text(),
+                    "availability": text(), "price": rng.choice((None, "", "1999", "19.99", "₹ 1,999"))},
+        "content": {
+            "word_count": rng.randint(0, 3000),
+            "headings": [{"level": rng.choice(("h1", "h2", "h3"))} for _ in range(rng.randint(0, 12))],
+            "features": ["feature"] * rng.randint(0, 10),
+            "specifications": {f"spec {i}": "value" for i in range(rng.randint(0, 12))},
+        },
+        "trust_signals": {signal: rng.random() < 0.5 for signal in TRUST_SIGNALS},
+        "schema_data": rng.choice(([], [{"@type": "Product"}], [{"@type": "Organization"}])),
+    }
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bulk scoring throughput benchmark")
+    parser.add_argument("--records", type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    records = [random_record(rng) for _ in range(args.records)]
+
+    single, single_time = timed(lambda: [AIScoringEngine(r).compute_score() for r in records])
+    bulk, bulk_time = timed(lambda: BulkScoringEngine(records).compute_scores())
+    _, arrays_time = timed(lambda: BulkScoringEngine(records).compute_arrays())
+    if bulk != single:
+        raise SystemExit("bulk scores differ from compute_score()")
+
+    print(f"{'mode':<34}{'records/sec':>14}{'speed-up':>10}")
+    for mode, seconds in (("compute_score() per record", single_time),
+                          ("BulkScoringEngine.compute_scores", bulk_time),
+                          ("BulkScoringEngine.compute_arrays", arrays_time)):
+        print(f"{mode:<34}{args.records / seconds:>14.0f}{single_time / seconds:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
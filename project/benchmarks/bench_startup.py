@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#==========================================================================
+# Cold start of the API per SERVICE_ROLE: time to import main (what an
+# autoscaled instance pays before it can answer), RSS afterwards, and which
+# heavy crawl dependencies got loaded. Each run is a fresh interpreter with an
+# empty data folder, the median of --runs is reported
+#==========================================================================
+HEAVY = ("extruct", "readability", "bs4", "requests", "numpy", "lxml", "lxml.html", "httpx", "multiprocessing",
+         "concurrent.futures.process")
+
+CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, {project!r})
+start = time.perf_counter()
+import main
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "loaded": [name for name in {heavy!r} if name in sys.modules],
+    "endpoints": len(main.app.openapi()["paths"]),
+}}))
+"""
+
+
+def measure(role, runs):
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as folder:
+            output = subprocess.run([sys.executable, "-c", CHILD.format(project=PROJECT, heavy=HEAVY)],
+                                    cwd=folder, env={**os.environ, "SERVICE_ROLE": role, "DATA_FOLDER": folder},
+                                    capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    samples.sort(key=lambda sample: sample["seconds"])
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API import time and memory per service role")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    print(f"{'role':<9}{'import s':>9}{'rss MB':>8}{'endpoints':>11}  heavy modules loaded")
+    for role in ("all", "crawl", "scoring"):
+        row = measure(role, args.runs)
+        print(f"{role:<9}{row['seconds']:>9.3f}{row['rss_mb']:>8.0f}{row['endpoints']:>11}  "
+              f"{', '.join(row['loaded']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
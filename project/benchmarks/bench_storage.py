@@ -0,0 +1,102 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization
+from crawl_store import LARGE_FIELDS, SCORING_FIELDS, CrawlStore
+from crawler import ProductCrawler
+from pages import CORPUS
+
+#==========================================================================
+# Bytes on disk per crawl and load times: the legacy layout (one indented
+# json file per crawl) against the store with each STORAGE_COMPRESSION.
+# Loads are timed for the whole crawl, for what scoring reads (the row
+# plus schema_data) and for the row alone. The last run stores plain json
+# rows and migrates them with compact(), as an existing database would be
+#==========================================================================
+CODECS = ("none", "zlib", "zstd")
+
+
+def crawls(count):
+    shapes = [build_page() for build_page in CORPUS.values()]
+    results = [ProductCrawler.from_html("https://x/p", html).extract(0) for html in shapes]
+    for i in range(count):
+        result = json.loads(json.dumps(results[i % len(results)]))
+        result["page_info"]["url"] = f"https://shop.example.com/p/{i}"
+        yield result
+
+
+def timed(func):
+    start = time.perf_counter()
+    value = func()
+    return value, time.perf_counter() - start
+
+
+def store_size(path):
+    #the database with its write-ahead log, if there is one
+    return sum(os.path.getsize(name) for name in glob.glob(path + "*"))
+
+
+def load_all(store, ids, fields):
+    return [store.get(crawl_id, fields) for crawl_id in ids]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stored crawl size and load time per compression")
+    parser.add_argument("--crawls", type=int, default=500)
+    args = parser.parse_args()
+    codecs = [codec for codec in CODECS if codec != "zstd" or serialization.zstandard is not None]
+    results = list(crawls(args.crawls))
+
+    with tempfile.TemporaryDirectory() as folder:
+        for i, result in enumerate(results):
+            with open(os.path.join(folder, f"crawl_{i}.json"), "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+        paths = glob.glob(os.path.join(folder, "crawl_*.json"))
+        legacy = sum(os.path.getsize(path) for path in paths)
+
+        def load_files():
+            loaded = []
+            for path in paths:
+                with open(path, "r", encoding="utf-8") as f:
+                    loaded.append(json.load(f))
+            return loaded
+
+        _, legacy_seconds = timed(load_files)
+        print(f"{args.crawls} crawls")
+        print(f"{'layout':<14}{'KB/crawl':>10}{'full ms':>10}{'scoring ms':>12}{'row ms':>9}")
+        print(f"{'json files':<14}{legacy / args.crawls / 1024:>10.1f}{legacy_seconds * 1000:>10.0f}"
+              f"{'-':>12}{'-':>9}")
+        for codec in codecs:
+            serialization.STORAGE_COMPRESSION = codec
+            path = os.path.join(folder, f"{codec}.sqlite")
+            store = CrawlStore(path)
+            ids = [store.save(result) for result in results]
+            store.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            _, full = timed(lambda: load_all(store, ids, LARGE_FIELDS))
+            _, scoring = timed(lambda: load_all(store, ids, SCORING_FIELDS))
+            _, row = timed(lambda: load_all(store, ids, ()))
+            print(f"{codec:<14}{store_size(path) / args.crawls / 1024:>10.1f}{full * 1000:>10.0f}"
+                  f"{scoring * 1000:>12.0f}{row * 1000:>9.0f}")
+
+        #an existing database: plain json rows, compressed in place and vacuumed
+        serialization.STORAGE_COMPRESSION = "none"
+        path = os.path.join(folder, "migrated.sqlite")
+        store = CrawlStore(path)
+        for result in results:
+            store.save(result)
+        serialization.STORAGE_COMPRESSION = codecs[-1]
+        stats, seconds = timed(store.compact)
+        store.vacuum()
+        print(f"\ncompact with {codecs[-1]}: {stats['sections']} sections, {stats['bytes_before'] / 1e6:.1f} -> "
+              f"{stats['bytes_after'] / 1e6:.1f} MB in {seconds:.2f} s, file {store_size(path) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
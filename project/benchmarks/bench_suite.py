@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler import CONTENT_EXTRACTION_MODES, ProductCrawler
+from llm_context import LLMContextBuilder
+from pages import load_pages, save_corpus
+from scoring import AIScoringEngine
+
+#==========================================================================
+# Offline benchmark suite: every extraction method, build(), scoring and
+# the LLM context per corpus page, with latency percentiles, throughput
+# and peak memory. Results can be saved as a JSON baseline and later runs
+# compared against it, regressions make the run exit with status 1
+#==========================================================================
+URL = "https://shop.example.com/p/runner"
+DEFAULT_TOLERANCE = 0.25
+#differences below this are timer noise, never a regression
+MIN_REGRESSION_MS = 0.05
+
+
+def serve(pages):
+    #local stub server, GET /<page name> returns that page
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        #headers and body go out as separate writes, Nagle would add a delayed-ACK wait to each page
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            #the query string only makes distinct urls of one page
+            html = pages.get(self.path.split("?")[0].lstrip("/"))
+            body = (html or "not found").encode("utf-8")
+            self.send_response(200 if html is not None else 404)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def operations(name, html, base_url):
+    #operation name -> zero argument callable, extraction methods share one parsed crawler
+    crawler = ProductCrawler.from_html(URL, html)
+    crawler.parse()
+    schema_data = crawler.extract_schema()
+    clean_text, _ = crawler.extract_clean_text()
+
+    def build():
+        if base_url:
+            return ProductCrawler(f"{base_url}/{name}").build()
+        return ProductCrawler.from_html(URL, html).extract(0)
+
+    result = build()
+    score = AIScoringEngine(result).compute_score()
+    return {
+        "parse": lambda: ProductCrawler.from_html(URL, html).parse(),
+        "extract_metadata": crawler.extract_metadata,
+        "extract_schema": crawler.extract_schema,
+        "parse_product_schema": lambda: crawler.parse_product_schema(schema_data),
+        "extract_headings": crawler.extract_headings,
+        "extract_features": crawler.extract_features,
+        "extract_specifications": crawler.extract_specifications,
+        "extract_links": crawler.extract_links,
+        "detect_trust_signal": crawler.detect_trust_signal,
+        "extract_clean_text": crawler.extract_clean_text,
+        #every CONTENT_EXTRACTION mode, whatever the configured one is
+        **{f"clean_text_{mode}": (lambda mode=mode: crawler.extract_clean_text(mode))
+           for mode in CONTENT_EXTRACTION_MODES},
+        "extract_price_fallback": lambda: crawler.extract_price_fallback(clean_text),
+        "build": build,
+        "compute_score": lambda: AIScoringEngine(result).compute_score(),
+        "build_context": lambda: LLMContextBuilder(result, score).build_context(),
+    }
+
+
+def clean_text_summary(ops, html):
+    #latency the adaptive mode saves over always running readability, and the text it kept
+    crawler = ProductCrawler.from_html(URL, html)
+    crawler.parse()
+    crawler.extract_clean_text("adaptive")
+    always, adaptive = ops["clean_text_always"]["p50_ms"], ops["clean_text_adaptive"]["p50_ms"]
+    saved = always - adaptive
+    return (f"adaptive clean_text: {crawler.clean_text_source}, saves {saved:.2f} ms "
+            f"({saved / always * 100 if always else 0:.0f}%) over always")
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def measure(func, repeat):
+    func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    #peak memory is taken in its own run, tracemalloc would distort the timings
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 4),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 4),
+        "per_sec": round(len(samples) / sum(samples), 2),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    #(page, operation, metric, baseline, current) for everything slower or bigger than the tolerance
+    regressions = []
+    for page, ops in results.items():
+        for op, current in ops.items():
+            before = baseline.get(page, {}).get(op)
+            if before is None:
+                continue
+            for metric in ("p50_ms", "p99_ms"):
+                if (current[metric] > before[metric] * (1 + tolerance)
+                        and current[metric] - before[metric] > MIN_REGRESSION_MS):
+                    regressions.append((page, op, metric, before[metric], current[metric]))
+            if current["peak_kb"] > before["peak_kb"] * (1 + tolerance) + 1:
+                regressions.append((page, op, "peak_kb", before["peak_kb"], current["peak_kb"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="crawler and scoring benchmark suite")
+    parser.add_argument("pages", nargs="*", help="saved product pages (.html) to add to the corpus")
+    parser.add_argument("--no-synthetic", action="store_true", help="only benchmark the given pages")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--only", nargs="*", help="page names to run")
+    parser.add_argument("--serve", action="store_true", help="fetch pages from a local stub server in build()")
+    parser.add_argument("--save-corpus", metavar="DIR", help="write the synthetic corpus as .html fixtures and exit")
+    parser.add_argument("--save", metavar="FILE", help="write the results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="flag regressions against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed slow-down before a regression is flagged (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    if args.save_corpus:
+        save_corpus(args.save_corpus)
+        print(f"corpus written to {args.save_corpus}")
+        return 0
+
+    pages = load_pages(args.pages, corpus=not args.no_synthetic)
+    if args.only:
+        pages = {name: html for name, html in pages.items() if name in args.only}
+    server = serve(pages) if args.serve else None
+    base_url = f"http://127.0.0.1:{server.server_address[1]}" if server else None
+
+    results = {}
+    try:
+        for name, html in pages.items():
+            print(f"\n{name} ({len(html) / 1024:.0f} KB)")
+            print(f"{'operation':<26}{'p50 ms':>10}{'p99 ms':>10}{'per sec':>11}{'peak KB':>11}")
+            results[name] = {}
+            for op, func in operations(name, html, base_url).items():
+                stats = results[name][op] = measure(func, args.repeat)
+                print(f"{op:<26}{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+                      f"{stats['per_sec']:>11.1f}{stats['peak_kb']:>11.1f}")
+            print(clean_text_summary(results[name], html))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.utcnow().isoformat(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "repeat": args.repeat,
+                "served": bool(args.serve),
+                "results": results,
+            }, f, indent=2)
+        print(f"\nbaseline written to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("served") != bool(args.serve):
+            print("\nwarning: the baseline was taken with a different --serve setting, build() is not comparable")
+        regressions = compare(results, saved["results"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for page, op, metric, before, current in regressions:
+                print(f"  {page:<20}{op:<26}{metric:<9}{before:>10.2f} -> {current:.2f}")
+            return 1
+        print(f"\nno regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler import ProductCrawler, node_text
+from pages import CORPUS
+
+#==========================================================================
+# detect_trust_signal against the scans it replaced: one any() per
+# signal over a list of link texts and two unanchored regexes over the
+# whole lowercased page text
+#==========================================================================
+URL = "https://shop.example.com/p/runner"
+
+
+def legacy_trust_signal(crawler):
+    text = node_text(crawler.tree, " ").lower()
+    links = [node_text(a).lower() for a in crawler.tree.iter("a")]
+
+    def contains_keywords(source, keywords):
+        return any(keyword in source for keyword in keywords)
+
+    return {
+        "has_return_policy": contains_keywords(text, ["return policy", "returns"]),
+        "has_refund_policy": contains_keywords(text, ["refund policy", "refunds"]),
+        "has_warranty_info": contains_keywords(text, ["warranty"]),
+        "has_shipping_info": contains_keywords(text, ["shipping", "delivery"]),
+        "has_cancellation_policy": contains_keywords(text, ["cancellation"]),
+        "uses_https": crawler.url.startswith("https"),
+        "mentions_secure_payment": contains_keywords(text, ["secure payment", "100% secure", "ssl"]),
+        "has_cod_option": contains_keywords(text, ["cash on delivery", "cod"]),
+        "has_contact_page": any("contact" in link for link in links),
+        "has_about_page": any("about" in link for link in links),
+        "mentions_phone": bool(re.search(r"\+?\d[\d\s-]{8,}", text)),
+        "mentions_email": bool(re.search(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", text)),
+        "mentions_reviews": contains_keywords(text, ["review", "ratings"]),
+        "mentions_testimonials": contains_keywords(text, ["testimonial"]),
+        "official_store_claim": contains_keywords(text, ["official store", "authorized seller"]),
+    }
+
+
+def best_of(func, crawler, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(crawler)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="trust signal detection micro-benchmark")
+    parser.add_argument("pages", nargs="*", help="saved product pages (.html), defaults to the synthetic corpus")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    pages = {name: build() for name, build in CORPUS.items()}
+    for pattern in args.pages:
+        for path in glob.glob(pattern):
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                pages[os.path.basename(path)] = f.read()
+
+    print(f"{'page':<24}{'text KB':>9}{'legacy ms':>12}{'matcher ms':>12}{'speed-up':>10}")
+    for name, html in pages.items():
+        crawler = ProductCrawler.from_html(URL, html)
+        crawler.parse()
+        if legacy_trust_signal(crawler) != crawler.detect_trust_signal():
+            print(f"{name}: results differ from the legacy detector")
+        size = len(node_text(crawler.tree, " ")) / 1024
+        legacy = best_of(legacy_trust_signal, crawler, args.repeat)
+        current = best_of(ProductCrawler.detect_trust_signal, crawler, args.repeat)
+        print(f"{name:<24}{size:>9.0f}{legacy:>12.2f}{current:>12.2f}{legacy / current:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
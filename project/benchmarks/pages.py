@@ -0,0 +1,99 @@
+import glob
+import json
+import os
+import random
+
+#==========================================================================
+# Synthetic product pages for the benchmarks.
+# Saved real pages can be benchmarked too, these only make sure every
+# shape we care about (huge, table heavy, link heavy, json-ld heavy) exists
+#==========================================================================
+WORDS = ("cotton", "premium", "fit", "durable", "wireless", "battery", "return",
+         "warranty", "shipping", "delivery", "review", "secure", "colour",
+         "size", "material", "design", "comfort", "everyday", "lightweight")
+
+
+def _sentence(rng, n=12):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def _product_jsonld(i):
+    return {
+        "@context": "https://schema.org",
+        "@type": "Product",
+        "name": f"Acme Runner Shoe Model {i}",
+        "brand": {"@type": "Brand", "name": "Acme"},
+        "sku": f"ACM-{i:05d}",
+        "offers": {"@type": "Offer", "price": "1999.00", "priceCurrency": "INR",
+                   "availability": "https://schema.org/InStock"},
+        "aggregateRating": {"@type": "AggregateRating", "ratingValue": "4.4", "reviewCount": "312"},
+    }
+
+
+def product_page(paragraphs=20, list_items=8, spec_rows=10, links=40, jsonld_blocks=1,
+                 extra_body="", seed=0):
+    rng = random.Random(seed)
+    out = ["<html><head><title>Acme Runner Shoe | Acme Store</title>",
+           '<meta name="description" content="Lightweight running shoe.">',
+           '<link rel="canonical" href="https://shop.example.com/p/runner">',
+           "<style>body{font-family:sans-serif}</style>"]
+    for i in range(jsonld_blocks):
+        out.append('<script type="application/ld+json">%s</script>' % json.dumps(_product_jsonld(i)))
+    out.append("</head><body>")
+    out.append('<header><nav><ul><li><a href="/">Home</a></li><li><a href="/about">About us</a></li>'
+               '<li><a href="/contact">Contact</a></li></ul></nav></header>')
+    out.append('<main><h1>Acme Runner Shoe</h1><div class="price">₹ 1,999.00</div>')
+    for p in range(paragraphs):
+        if p % 5 == 0:
+            out.append(f"<h2>Section {p}</h2>")
+        out.append(f"<p>{_sentence(rng, 40)}</p>")
+    out.append("<h3>Key features</h3><ul>")
+    for i in range(list_items):
+        out.append(f"<li>{_sentence(rng, 6)} #{i}</li>")
+    out.append("</ul><h3>Specifications</h3><table>")
+    for i in range(spec_rows):
+        out.append(f"<tr><th>Spec {i}</th><td>{_sentence(rng, 3)}</td></tr>")
+    out.append("</table><div class='related'>")
+    for i in range(links):
+        href = f"/p/item-{i}" if i % 4 else f"https://partner{i}.example.org/x"
+        out.append(f'<a href="{href}">Related product {i}</a> ')
+    out.append("</div>")
+    out.append(extra_body)
+    out.append("<script>window.dataLayer=[];</script></main>")
+    out.append("<footer><p>Secure payment. Cash on delivery available. Call +91 98765 43210 "
+               "or write to care@example.com. 30 day return policy.</p>"
+               "<table><tr><td>Footer</td><td>table</td></tr><tr><td>ignored</td><td>rows</td></tr></table>"
+               "</footer></body></html>")
+    return "".join(out)
+
+
+# name -> html, the shapes the benchmarks report on
+CORPUS = {
+    "small": lambda: product_page(paragraphs=4, list_items=4, spec_rows=3, links=10),
+    "typical": lambda: product_page(),
+    "huge": lambda: product_page(paragraphs=2000, list_items=20, spec_rows=20, links=300),
+    "table_heavy": lambda: product_page(spec_rows=2000),
+    "link_heavy": lambda: product_page(links=5000),
+    "jsonld_heavy": lambda: product_page(jsonld_blocks=200),
+    "list_heavy": lambda: product_page(list_items=15, extra_body="".join(
+        "<ul>%s</ul>" % "".join(f"<li>List {u} item number {i}</li>" for i in range(12))
+        for u in range(400))),
+}
+
+
+def save_corpus(folder):
+    #freezes the synthetic corpus as .html fixtures, so later runs measure byte-identical pages
+    os.makedirs(folder, exist_ok=True)
+    for name, build in CORPUS.items():
+        with open(os.path.join(folder, name + ".html"), "w", encoding="utf-8") as f:
+            f.write(build())
+
+
+def load_pages(patterns=(), corpus=True):
+    #name -> html for the synthetic corpus plus any saved pages matching the glob patterns
+    pages = {name: build() for name, build in CORPUS.items()} if corpus else {}
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                pages[os.path.basename(path)] = f.read()
+    return pages
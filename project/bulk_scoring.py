@@ -0,0 +1,107 @@
+from typing import Iterable, List
+
+import numpy as np
+
+from scoring import CompiledRules, get_rules
+
+
+class BulkScoringEngine:
+    #AIScoringEngine.compute_score() for many crawls at once, driven by the same compiled rules
+    def __init__(self, records: Iterable[dict], rules: CompiledRules = None):
+        self.rules = rules or get_rules()
+        self.records = list(records)
+        self.n = len(self.records)
+        #feature extraction is the only per-record python loop
+        rows = [self.rules.features_of(record) for record in self.records]
+        self.features = np.array(rows, dtype=np.float64).reshape(self.n, len(self.rules.extractors))
+
+    def points(self, check) -> np.ndarray:
+        #the threshold table lookup for every record
+        if check.options:
+            return np.select([self.features[:, feature] != 0 for feature, _ in check.options],
+                             [points for _, points in check.options], default=0)
+        counts = np.searchsorted(check.thresholds, self.features[:, check.feature],
+                                 side="left" if check.strict else "right")
+        return np.asarray(check.table)[counts]
+
+    def included(self, check) -> np.ndarray:
+        if check.only_if is None:
+            return np.ones(self.n, dtype=bool)
+        return self.features[:, check.only_if] != 0
+
+    # ------------------------------------------------------------------
+    #  MASTER COMPUTE
+    # ------------------------------------------------------------------
+    def compute_arrays(self) -> dict:
+        sections = {}
+        for section in self.rules.sections:
+            breakdown = {check.key: self.points(check) * self.included(check) for check in section.checks}
+            sections[section.name] = (np.minimum(sum(breakdown.values()), section.max), section.max, breakdown)
+        penalties = {check.key: self.points(check) for check in self.rules.penalties}
+
+        raw_total = sum(score for score, _, _ in sections.values())
+        penalty_total = sum(penalties.values())
+        max_score = self.rules.max_possible
+        final_score = np.maximum(0, raw_total + penalty_total)
+        #rounded the way compute_score() rounds, the band is picked from the rounded value
+        percentage = np.array([round(p, 2) for p in (final_score / max_score * 100).tolist()])
+        return {
+            "sections": sections,
+            "penalties": penalties,
+            "penalty_total": penalty_total,
+            "raw_score": raw_total,
+            "final_score": final_score,
+            "max_possible": max_score,
+            "ai_readiness_pct": percentage,
+            "readiness_band": self.points_for_band(percentage),
+        }
+
+    def points_for_band(self, percentage: np.ndarray) -> np.ndarray:
+        band = self.rules.band_check
+        return np.asarray(band.table, dtype=object)[np.searchsorted(band.thresholds, percentage, side="right")]
+
+    def compute_scores(self) -> List[dict]:
+        #one compute_score() shaped dict per record, built column-wise
+        arrays = self.compute_arrays()
+        columns = []
+        for section in self.rules.sections:
+            score, _, breakdown = arrays["sections"][section.name]
+            keys = list(breakdown)
+            rows = [dict(zip(keys, row)) for row in zip(*(v.tolist() for v in breakdown.values()))]
+            #checks with only_if are left out of the breakdown where the condition fails
+            for check in section.checks:
+                if check.only_if is not None:
+                    for breakdown_row, keep in zip(rows, self.included(check).tolist()):
+                        if not keep:
+                            del breakdown_row[check.key]
+            columns.append((section, score.tolist(), rows))
+        penalty_keys = list(arrays["penalties"])
+        penalties = [{k: v for k, v in zip(penalty_keys, row) if v}
+                     for row in zip(*(v.tolist() for v in arrays["penalties"].values()))]
+        max_score = arrays["max_possible"]
+
+        results = []
+        for i, (penalty, penalty_total, raw_total, final_score, percentage, band) in enumerate(zip(
+                penalties, arrays["penalty_total"].tolist(), arrays["raw_score"].tolist(),
+                arrays["final_score"].tolist(), arrays["ai_readiness_pct"].tolist(),
+                arrays["readiness_band"].tolist())):
+            score = {section.score_key: scores[i] for section, scores, _ in columns}
+            score.update({
+                "penalties":             penalty,
+                "penalty_total":         penalty_total,
+
+                "raw_score":             raw_total,
+                "final_score":           final_score,
+                "max_possible":          max_score,
+                "ai_readiness_pct":      percentage,
+
+                "readiness_band":        band,
+
+                "breakdowns": {section.name: rows[i] for section, _, rows in columns}
+            })
+            results.append(score)
+        return results
+
+
+def score_many(records: Iterable[dict], rules: CompiledRules = None) -> List[dict]:
+    return BulkScoringEngine(records, rules).compute_scores()
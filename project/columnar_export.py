@@ -0,0 +1,337 @@
+import argparse
+import json
+import os
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from crawl_store import CrawlStore
+from score_cache import ScoreCache, crawl_content_hash
+
+#==========================================================================
+# Columnar export of stored crawls and their scores for analytics.
+# Two datasets under the output folder, both hive partitioned by
+# domain=<host>/date=<YYYY-MM-DD> and joined on crawl_id:
+#   crawls/  one typed row per crawl: page_info, product, content counts,
+#            trust flags, section scores, penalties and check breakdowns
+#   texts/   clean_text, headings, features, specifications, schema_data
+#            and links, kept apart so the numeric table stays small
+# Every run appends new part files for crawls stored since the last run
+# (_export_state.json). Score and trust columns follow the scoring rules,
+# so part files can differ in columns: open_dataset() reads them all with
+# one unified schema, open_dataset(folder).to_table().to_pandas()
+#==========================================================================
+STATE_FILE = "_export_state.json"
+#crawls read from the store per query
+READ_BATCH = 500
+#buffered rows (or clean_text bytes) written out before more are read
+FLUSH_ROWS = 50000
+FLUSH_TEXT_BYTES = 256 * 1024 * 1024
+
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+CRAWL_SCHEMA = pa.schema([
+    ("crawl_id", pa.int64()),
+    ("url", pa.string()),
+    ("final_url", pa.string()),
+    ("canonical_url", pa.string()),
+    ("crawl_timestamp", pa.timestamp("us")),
+    ("status_code", pa.int16()),
+    ("page_type", pa.string()),
+    ("title", pa.string()),
+    ("meta_description", pa.string()),
+    ("https", pa.bool_()),
+    ("load_time_ms", pa.int32()),
+    ("content_hash", pa.string()),
+    ("simhash", pa.string()),
+    ("truncated", pa.bool_()),
+    ("bytes_downloaded", pa.int64()),
+    ("encoding", pa.string()),
+    ("content_extraction", pa.string()),
+    ("clean_text_source", pa.string()),
+    ("product_name", pa.string()),
+    ("product_brand", pa.string()),
+    ("product_sku", pa.string()),
+    ("product_price", pa.float64()),
+    ("product_price_text", pa.string()),
+    ("product_currency", pa.string()),
+    ("product_availability", pa.string()),
+    ("product_rating", pa.float64()),
+    ("product_review_count", pa.int64()),
+    ("word_count", pa.int32()),
+    ("heading_count", pa.int32()),
+    ("feature_count", pa.int32()),
+    ("specification_count", pa.int32()),
+    ("internal_link_count", pa.int32()),
+    ("external_link_count", pa.int32()),
+    ("schema_item_count", pa.int32()),
+    ("rules_version", pa.string()),
+    ("final_score", pa.float64()),
+    ("raw_score", pa.float64()),
+    ("penalty_total", pa.float64()),
+    ("max_possible", pa.float64()),
+    ("ai_readiness_pct", pa.float64()),
+    ("readiness_band", pa.string()),
+])
+
+TEXT_SCHEMA = pa.schema([
+    ("crawl_id", pa.int64()),
+    ("url", pa.string()),
+    ("clean_text", pa.large_string()),
+    ("headings", pa.list_(pa.struct([("level", pa.string()), ("text", pa.string()), ("position", pa.int64())]))),
+    ("features", pa.list_(pa.string())),
+    #values may be strings or lists, kept as json
+    ("specifications_json", pa.string()),
+    ("schema_data_json", pa.large_string()),
+    ("links_json", pa.large_string()),
+])
+
+#score keys that are not a section score
+SCORE_TOTALS = ("penalties", "penalty_total", "raw_score", "final_score", "max_possible", "ai_readiness_pct",
+                "readiness_band", "breakdowns")
+
+
+def to_float(value) -> Optional[float]:
+    #prices and ratings come as numbers or text like "1,999.00" or "₹ 2,499"
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER.search(str(value).replace(",", ""))
+    return float(match.group()) if match else None
+
+
+def to_int(value) -> Optional[int]:
+    number = to_float(value)
+    return int(number) if number is not None else None
+
+
+def to_timestamp(value) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def column_name(*parts: str) -> str:
+    return "_".join(re.sub(r"\W+", "_", part).strip("_").lower() for part in parts)
+
+
+def crawl_row(crawl: dict, score: Optional[dict], rules_version: Optional[str]) -> dict:
+    page = crawl.get("page_info", {})
+    product = crawl.get("product", {})
+    content = crawl.get("content", {})
+    links = crawl.get("links") or {}
+    row = {
+        "crawl_id": crawl.get("crawl_id"),
+        "url": page.get("url"),
+        "final_url": page.get("final_url"),
+        "canonical_url": page.get("canonical_url"),
+        "crawl_timestamp": to_timestamp(page.get("crawl_timestamp")),
+        "status_code": page.get("status_code"),
+        "page_type": page.get("page_type"),
+        "title": page.get("title"),
+        "meta_description": page.get("meta_description"),
+        "https": page.get("https"),
+        "load_time_ms": page.get("load_time_ms"),
+        "content_hash": page.get("content_hash"),
+        "simhash": page.get("simhash"),
+        "truncated": page.get("truncated"),
+        "bytes_downloaded": page.get("bytes_downloaded"),
+        "encoding": page.get("encoding"),
+        "content_extraction": page.get("content_extraction"),
+        "clean_text_source": page.get("clean_text_source"),
+        "product_name": product.get("name"),
+        "product_brand": product.get("brand"),
+        "product_sku": str(product["sku"]) if product.get("sku") is not None else None,
+        "product_price": to_float(product.get("price")),
+        "product_price_text": str(product["price"]) if product.get("price") is not None else None,
+        "product_currency": product.get("currency"),
+        "product_availability": product.get("availability"),
+        "product_rating": to_float(product.get("rating")),
+        "product_review_count": to_int(product.get("review_count")),
+        "word_count": content.get("word_count"),
+        "heading_count": len(content.get("headings") or []),
+        "feature_count": len(content.get("features") or []),
+        "specification_count": len(content.get("specifications") or {}),
+        "internal_link_count": len(links.get("internal") or []) if "links" in crawl else None,
+        "external_link_count": len(links.get("external") or []) if "links" in crawl else None,
+        "schema_item_count": len(crawl["schema_data"]) if "schema_data" in crawl else None,
+    }
+    for name, flag in (crawl.get("trust_signals") or {}).items():
+        row[column_name("trust", name)] = bool(flag)
+    if score is not None:
+        row["rules_version"] = rules_version
+        for key in SCORE_TOTALS[1:-1]:
+            row[key] = score.get(key)
+        #section scores under their own keys (schema_score, ...)
+        for key, value in score.items():
+            if key not in SCORE_TOTALS:
+                row[column_name(key)] = value
+        for name, value in (score.get("penalties") or {}).items():
+            row[column_name("penalty", name)] = value
+        for section, checks in (score.get("breakdowns") or {}).items():
+            for check, points in (checks or {}).items():
+                row[column_name("breakdown", section, check)] = points
+    return row
+
+
+def text_row(crawl: dict) -> dict:
+    content = crawl.get("content", {})
+    return {
+        "crawl_id": crawl.get("crawl_id"),
+        "url": crawl.get("page_info", {}).get("url"),
+        "clean_text": crawl.get("clean_text"),
+        "headings": [{"level": h.get("level"), "text": h.get("text"), "position": h.get("position")}
+                     for h in content.get("headings") or []],
+        "features": [str(feature) for feature in content.get("features") or []],
+        "specifications_json": json.dumps(content.get("specifications") or {}, ensure_ascii=False),
+        "schema_data_json": json.dumps(crawl.get("schema_data") or [], ensure_ascii=False),
+        "links_json": json.dumps(crawl.get("links") or {}, ensure_ascii=False),
+    }
+
+
+def crawl_schema(rows: List[dict]) -> pa.Schema:
+    #fixed columns typed up front, trust flags and score columns follow the data (rules can change)
+    fields = list(CRAWL_SCHEMA)
+    flags = {}
+    for row in rows:
+        for key, value in row.items():
+            if key not in CRAWL_SCHEMA.names and value is not None:
+                flags[key] = flags.get(key, True) and isinstance(value, bool)
+    for key in sorted(flags):
+        fields.append(pa.field(key, pa.bool_() if flags[key] else pa.float64()))
+    return pa.schema(fields)
+
+
+def open_dataset(folder: str, name: str = "crawls"):
+    #all part files of one dataset ("crawls" or "texts") with domain and date columns from the partitions
+    import pyarrow.dataset as ds
+    with open(os.path.join(folder, STATE_FILE), "r", encoding="utf-8") as f:
+        file_format = "ipc" if json.load(f).get("format") == "arrow" else "parquet"
+    partitioning = ds.partitioning(pa.schema([("domain", pa.string()), ("date", pa.string())]), flavor="hive")
+    path = os.path.join(folder, name)
+    dataset = ds.dataset(path, format=file_format, partitioning=partitioning)
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in dataset.get_fragments()]
+                              + [partitioning.schema])
+    return ds.dataset(path, format=file_format, partitioning=partitioning, schema=schema)
+
+
+class ColumnarExporter:
+    #writes crawls stored after the last export as new part files, one per partition per flush
+    def __init__(self, store: CrawlStore, scores: ScoreCache, folder: str, file_format: str = "parquet",
+                 compute_scores: bool = False):
+        self.store = store
+        self.scores = scores
+        self.folder = folder
+        self.file_format = file_format
+        #score crawls that were never scored, otherwise their score columns stay empty
+        self.compute_scores = compute_scores
+        self.state_path = os.path.join(folder, STATE_FILE)
+        self.state = self.load_state()
+        self.crawl_rows: Dict[tuple, List[dict]] = {}
+        self.text_rows: Dict[tuple, List[dict]] = {}
+        self.buffered = 0
+        self.buffered_text = 0
+
+    def load_state(self) -> dict:
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"last_crawl_id": 0, "parts": 0, "rows": 0, "format": self.file_format}
+
+    def save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def score_of(self, crawl: dict):
+        rules_version = self.scores.rules_version()
+        score = self.scores.get(crawl_content_hash(crawl), rules_version)
+        if score is None and self.compute_scores and crawl.get("page_info", {}).get("page_type") == "PRODUCT":
+            score = self.scores.score(crawl)
+        return score, rules_version
+
+    def run(self) -> dict:
+        if self.state["format"] != self.file_format:
+            raise ValueError(f"{self.folder} holds a {self.state['format']} export, not {self.file_format}")
+        os.makedirs(self.folder, exist_ok=True)
+        start = time.perf_counter()
+        exported = 0
+        last_id = self.state["last_crawl_id"]
+        while True:
+            crawls = self.store.crawls_after(last_id, READ_BATCH)
+            if not crawls:
+                break
+            for crawl in crawls:
+                self.add(crawl)
+                last_id = crawl["crawl_id"]
+            exported += len(crawls)
+            if self.buffered >= FLUSH_ROWS or self.buffered_text >= FLUSH_TEXT_BYTES:
+                self.flush(last_id)
+        self.flush(last_id)
+        return {"exported": exported, "last_crawl_id": last_id, "seconds": round(time.perf_counter() - start, 2)}
+
+    def add(self, crawl: dict):
+        page = crawl.get("page_info", {})
+        url = page.get("url", "")
+        partition = (url.split("/")[2] if url.count("/") >= 2 else "", (page.get("crawl_timestamp") or "")[:10])
+        score, rules_version = self.score_of(crawl)
+        self.crawl_rows.setdefault(partition, []).append(crawl_row(crawl, score, rules_version))
+        self.text_rows.setdefault(partition, []).append(text_row(crawl))
+        self.buffered += 1
+        self.buffered_text += len(crawl.get("clean_text") or "")
+
+    def flush(self, last_id: int):
+        #part files first, then the state: a crash in between re-exports at most the unflushed crawls
+        part = self.state["parts"]
+        #one schema for every file of a flush
+        schema = crawl_schema([row for rows in self.crawl_rows.values() for row in rows])
+        for partition, rows in self.crawl_rows.items():
+            self.write("crawls", partition, part, pa.Table.from_pylist(rows, schema=schema))
+            self.write("texts", partition, part, pa.Table.from_pylist(self.text_rows[partition], schema=TEXT_SCHEMA))
+            self.state["rows"] += len(rows)
+        if self.crawl_rows:
+            self.state["parts"] = part + 1
+        self.state["last_crawl_id"] = last_id
+        self.save_state()
+        self.crawl_rows, self.text_rows = {}, {}
+        self.buffered = self.buffered_text = 0
+
+    def write(self, dataset: str, partition: tuple, part: int, table: pa.Table):
+        domain, date = partition
+        folder = os.path.join(self.folder, dataset, f"domain={quote(domain or 'unknown', safe='')}",
+                              f"date={date or 'unknown'}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"part-{part:06d}.{'parquet' if self.file_format == 'parquet' else 'arrow'}")
+        tmp_path = path + ".tmp"
+        if self.file_format == "parquet":
+            pq.write_table(table, tmp_path, compression="zstd")
+        else:
+            with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    #python columnar_export.py --data data --out data/export [--format arrow] [--score]
+    parser = argparse.ArgumentParser(description="export stored crawls and scores to Parquet or Arrow IPC")
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--out", help="export folder, defaults to <data>/export")
+    parser.add_argument("--format", default="parquet", choices=("parquet", "arrow"))
+    parser.add_argument("--score", action="store_true", help="score product crawls that have no cached score")
+    parser.add_argument("--import-json", action="store_true",
+                        help="import legacy crawl json files from the data folder into the store first")
+    args = parser.parse_args()
+    crawl_store = CrawlStore(os.path.join(args.data, "crawls.sqlite"))
+    if args.import_json:
+        print(f"imported {crawl_store.import_json_files(args.data)} crawl files")
+    exporter = ColumnarExporter(crawl_store, ScoreCache(os.path.join(args.data, "scores.sqlite")),
+                                args.out or os.path.join(args.data, "export"), args.format, args.score)
+    print(exporter.run())
@@ -0,0 +1,297 @@
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from metrics import timed
+from serialization import MIN_COMPRESS_BYTES, pack, unpack
+
+#stored apart from the crawl row and only loaded when asked for
+LARGE_FIELDS = ("clean_text", "schema_data", "links")
+#what AIScoringEngine reads besides the crawl row
+SCORING_FIELDS = ("schema_data",)
+#what the LLM context builder reads besides the crawl row
+CONTEXT_FIELDS = SCORING_FIELDS + ("clean_text",)
+#columns after url or domain in the history indexes
+HISTORY_INDEX = "crawl_timestamp, final_score, ai_readiness_pct, rules_version"
+HISTORY_COLUMNS = ("crawl_id", "url", "crawl_timestamp", "final_score", "ai_readiness_pct", "rules_version")
+
+
+class CrawlStore:
+    #crawl results in SQLite, indexed on url, domain, timestamp and score
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS crawls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                domain TEXT NOT NULL,
+                crawl_timestamp TEXT NOT NULL,
+                content_hash TEXT,
+                page_type TEXT,
+                final_score REAL,
+                ai_readiness_pct REAL,
+                rules_version TEXT,
+                source_file TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS crawl_fields (
+                crawl_id INTEGER NOT NULL REFERENCES crawls (id),
+                name TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (crawl_id, name)
+            );
+            CREATE INDEX IF NOT EXISTS crawls_timestamp ON crawls (crawl_timestamp);
+            CREATE INDEX IF NOT EXISTS crawls_final_score ON crawls (final_score);
+            CREATE INDEX IF NOT EXISTS crawls_source_file ON crawls (source_file);
+        """)
+        #crawls tables created before score history
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(crawls)")]
+        if "rules_version" not in columns:
+            self.db.execute("ALTER TABLE crawls ADD COLUMN rules_version TEXT")
+        #url and domain indexes carry the score columns, a score history is read from the index alone
+        self.db.executescript(f"""
+            DROP INDEX IF EXISTS crawls_url;
+            DROP INDEX IF EXISTS crawls_domain;
+            CREATE INDEX IF NOT EXISTS crawls_url_history ON crawls (url, {HISTORY_INDEX});
+            CREATE INDEX IF NOT EXISTS crawls_domain_history ON crawls (domain, {HISTORY_INDEX}, url);
+        """)
+        self.db.commit()
+
+    def save(self, result: dict, source_file: str = None) -> int:
+        page = result.get("page_info", {})
+        url = page.get("url", "")
+        #everything but the large fields goes into the crawl row itself
+        data = {k: v for k, v in result.items() if k not in LARGE_FIELDS}
+        with timed("store_save"), self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO crawls (url, domain, crawl_timestamp, content_hash, page_type, source_file, data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, urlparse(url).netloc, page.get("crawl_timestamp", ""), page.get("content_hash"),
+                 page.get("page_type"), source_file, pack(data)))
+            crawl_id = cursor.lastrowid
+            self.db.executemany(
+                "INSERT INTO crawl_fields (crawl_id, name, value) VALUES (?, ?, ?)",
+                [(crawl_id, name, pack(result[name]))
+                 for name in LARGE_FIELDS if name in result])
+            self.db.commit()
+        return crawl_id
+
+    def set_score(self, crawl_id: int, score: dict, rules_version: str = None):
+        with self.lock:
+            self.db.execute("UPDATE crawls SET final_score = ?, ai_readiness_pct = ?, rules_version = ?"
+                            " WHERE id = ?",
+                            (score.get("final_score"), score.get("ai_readiness_pct"), rules_version, crawl_id))
+            self.db.commit()
+
+    def get(self, crawl_id: int, fields: Iterable[str] = LARGE_FIELDS) -> Optional[dict]:
+        #fields picks which large fields are loaded with the crawl
+        with self.lock:
+            row = self.db.execute("SELECT id, data FROM crawls WHERE id = ?", (crawl_id,)).fetchone()
+            if row is None:
+                return None
+            return self._load(row, fields)
+
+    def latest(self, url: str, fields: Iterable[str] = LARGE_FIELDS) -> Optional[dict]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT id, data FROM crawls WHERE url = ? ORDER BY crawl_timestamp DESC, id DESC LIMIT 1",
+                (url,)).fetchone()
+            if row is None:
+                return None
+            return self._load(row, fields)
+
+    def find_by_file(self, source_file: str, fields: Iterable[str] = LARGE_FIELDS) -> Optional[dict]:
+        #crawls imported from the old one-json-file-per-crawl layout
+        with self.lock:
+            row = self.db.execute("SELECT id, data FROM crawls WHERE source_file = ? LIMIT 1",
+                                  (source_file,)).fetchone()
+            if row is None:
+                return None
+            return self._load(row, fields)
+
+    def load_field(self, crawl_id: int, name: str):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM crawl_fields WHERE crawl_id = ? AND name = ?",
+                                  (crawl_id, name)).fetchone()
+        return unpack(row[0]) if row else None
+
+    def list_crawls(self, url: str = None, domain: str = None, since: str = None, until: str = None,
+                    min_score: float = None, max_score: float = None, limit: int = 100) -> List[dict]:
+        #index only listing, no crawl data is decoded
+        clauses, params = [], []
+        for clause, value in (("url = ?", url), ("domain = ?", domain), ("crawl_timestamp >= ?", since),
+                              ("crawl_timestamp <= ?", until), ("final_score >= ?", min_score),
+                              ("final_score <= ?", max_score)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, url, domain, crawl_timestamp, content_hash, page_type, final_score, ai_readiness_pct"
+                f" FROM crawls {where} ORDER BY crawl_timestamp DESC, id DESC LIMIT ?",
+                (*params, limit)).fetchall()
+        keys = ("crawl_id", "url", "domain", "crawl_timestamp", "content_hash", "page_type",
+                "final_score", "ai_readiness_pct")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def score_series(self, url: str = None, domain: str = None, since: str = None, until: str = None,
+                     limit: int = 1000) -> List[dict]:
+        #the last `limit` crawls of a url or domain with their stored scores, oldest first
+        column, where, params = self._history_where(url, domain, since, until)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT id, url, {HISTORY_INDEX} FROM crawls INDEXED BY crawls_{column}_history"
+                f" WHERE {where} ORDER BY crawl_timestamp DESC LIMIT ?",
+                (*params, limit)).fetchall()
+        return [dict(zip(HISTORY_COLUMNS, row)) for row in reversed(rows)]
+
+    def daily_scores(self, url: str = None, domain: str = None, since: str = None,
+                     until: str = None) -> List[dict]:
+        #per day aggregates of stored scores, for series too long to list crawl by crawl
+        column, where, params = self._history_where(url, domain, since, until)
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT substr(crawl_timestamp, 1, 10) AS day, COUNT(*), COUNT(final_score), AVG(final_score),"
+                " MIN(final_score), MAX(final_score), AVG(ai_readiness_pct)"
+                f" FROM crawls INDEXED BY crawls_{column}_history WHERE {where}"
+                " GROUP BY day ORDER BY day", params).fetchall()
+        keys = ("date", "crawls", "scored", "avg_score", "min_score", "max_score", "avg_readiness_pct")
+        return [dict(zip(keys, row)) for row in rows]
+
+    @staticmethod
+    def _history_where(url, domain, since, until):
+        column, value = ("url", url) if url is not None else ("domain", domain)
+        clauses, params = [f"{column} = ?"], [value]
+        for clause, bound in (("crawl_timestamp >= ?", since), ("crawl_timestamp <= ?", until)):
+            if bound is not None:
+                clauses.append(clause)
+                params.append(bound)
+        return column, " AND ".join(clauses), params
+
+    def crawl_at(self, url: str, timestamp: str) -> Optional[int]:
+        #id of the crawl a url had at timestamp: its latest one before, or else its first one after
+        with self.lock:
+            row = self.db.execute(
+                "SELECT id FROM crawls WHERE url = ? AND crawl_timestamp <= ?"
+                " ORDER BY crawl_timestamp DESC, id DESC LIMIT 1", (url, timestamp)).fetchone()
+            if row is None:
+                row = self.db.execute(
+                    "SELECT id FROM crawls WHERE url = ? AND crawl_timestamp > ?"
+                    " ORDER BY crawl_timestamp, id LIMIT 1", (url, timestamp)).fetchone()
+        return row[0] if row else None
+
+    def crawls_after(self, after_id: int = 0, limit: int = 500, fields: Iterable[str] = LARGE_FIELDS) -> List[dict]:
+        #stored crawls in id order, for exports that continue where the last one stopped
+        with self.lock:
+            rows = self.db.execute("SELECT id, data FROM crawls WHERE id > ? ORDER BY id LIMIT ?",
+                                   (after_id, limit)).fetchall()
+            return [self._load(row, fields) for row in rows]
+
+    def crawl_urls(self, before_id: int = None, limit: int = 500) -> List[Tuple[int, str]]:
+        #(crawl id, url) pages, newest first, for walking the whole store
+        with self.lock:
+            return self.db.execute("SELECT id, url FROM crawls WHERE id < ? ORDER BY id DESC LIMIT ?",
+                                   (before_id if before_id is not None else 1 << 62, limit)).fetchall()
+
+    def _load(self, row, fields) -> dict:
+        with timed("store_load"):
+            return self._decode(row, fields)
+
+    def _decode(self, row, fields) -> dict:
+        crawl_id, data = row
+        crawl = unpack(data)
+        crawl["crawl_id"] = crawl_id
+        fields = list(fields)
+        if fields:
+            placeholders = ",".join("?" * len(fields))
+            for name, value in self.db.execute(
+                    f"SELECT name, value FROM crawl_fields WHERE crawl_id = ? AND name IN ({placeholders})",
+                    (crawl_id, *fields)):
+                crawl[name] = unpack(value)
+        return crawl
+
+    def import_json_files(self, folder: str) -> int:
+        #moves the one-json-file-per-crawl history into the store, skipping files already imported
+        imported = 0
+        for path in sorted(glob.glob(os.path.join(folder, "*.json"))):
+            filename = os.path.basename(path)
+            if self.has_file(filename):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            if "page_info" not in result:
+                continue
+            self.save(result, source_file=filename)
+            imported += 1
+        return imported
+
+    def has_file(self, filename: str) -> bool:
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM crawls WHERE source_file = ? LIMIT 1",
+                                   (filename,)).fetchone() is not None
+
+    def compact(self, batch: int = 500) -> dict:
+        #compresses the sections of crawls stored before compression (json text rows)
+        stats = {"sections": 0, "bytes_before": 0, "bytes_after": 0}
+        for table, column in (("crawls", "data"), ("crawl_fields", "value")):
+            last = 0
+            while True:
+                with self.lock:
+                    rows = self.db.execute(
+                        f"SELECT rowid, {column} FROM {table} WHERE rowid > ? AND typeof({column}) = 'text'"
+                        f" AND length(CAST({column} AS BLOB)) >= ? ORDER BY rowid LIMIT ?",
+                        (last, MIN_COMPRESS_BYTES, batch)).fetchall()
+                if not rows:
+                    break
+                packed = [(pack(unpack(value)), rowid) for rowid, value in rows]
+                with self.lock:
+                    self.db.executemany(f"UPDATE {table} SET {column} = ? WHERE rowid = ?", packed)
+                    self.db.commit()
+                stats["sections"] += len(rows)
+                stats["bytes_before"] += sum(len(value.encode("utf-8")) for _, value in rows)
+                stats["bytes_after"] += sum(len(value if isinstance(value, bytes) else value.encode("utf-8"))
+                                            for value, _ in packed)
+                last = rows[-1][0]
+        return stats
+
+    def vacuum(self):
+        #gives the space freed by compact() back to the disk, rewrites the whole database
+        with self.lock:
+            self.db.execute("VACUUM")
+            #in wal mode the rewritten pages sit in the log until a checkpoint
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+if __name__ == "__main__":
+    #python crawl_store.py <data folder> [--vacuum] [--remove-imported]
+    #imports the one-json-file-per-crawl history and compresses crawls stored uncompressed
+    parser = argparse.ArgumentParser(description="migrate crawl json files and old rows to the compressed store")
+    parser.add_argument("data", nargs="?", default="data")
+    parser.add_argument("--vacuum", action="store_true", help="shrink the database file after compressing")
+    parser.add_argument("--remove-imported", action="store_true",
+                        help="delete crawl json files that are in the store")
+    args = parser.parse_args()
+    path = os.path.join(args.data, "crawls.sqlite")
+    store = CrawlStore(path)
+    print(f"imported {store.import_json_files(args.data)} crawl files")
+    compacted = store.compact()
+    print(f"compressed {compacted['sections']} sections: {compacted['bytes_before']} -> "
+          f"{compacted['bytes_after']} bytes")
+    if args.remove_imported:
+        removed = [name for name in glob.glob(os.path.join(args.data, "*.json"))
+                   if store.has_file(os.path.basename(name))]
+        for name in removed:
+            os.remove(name)
+        print(f"removed {len(removed)} imported files")
+    if args.vacuum:
+        store.vacuum()
+    print(f"{path}: {os.path.getsize(path)} bytes")
@@ -1,11 +1,349 @@
 from datetime import datetime
-import requests
+import json
+import os
 import re
-from bs4 import BeautifulSoup
-import extruct
+import copy
+import hashlib
+import lxml.html
 import time
+from functools import lru_cache
+from typing import NamedTuple
 from urllib.parse import urljoin, urlparse
-from readability import Document
+from metrics import NoTimings, Timings, timed
+from near_duplicates import fingerprint_hex, page_fingerprint
+from politeness import PolitenessScheduler
+from schema_org import schema_types
+from streaming import read_body
+from trust_signals import keyword_matcher, mentions_email, mentions_phone, page_language
+
+#utf-8 round trip like readability's own parser, so one tree serves both.
+#huge_tree keeps very deep pages from being cut short
+UTF8_PARSER = lxml.html.HTMLParser(encoding="utf-8", huge_tree=True)
+
+#text inside these tags is not page text (BeautifulSoup's get_text skips it too)
+NON_TEXT_TAGS = frozenset(["script", "style", "template"])
+NON_CONTENT_TAGS = NON_TEXT_TAGS | {"noscript"}
+
+
+def parse_html(html: str):
+    #the raw html is parsed exactly once per page, everything else reads this tree
+    if not html or not html.strip():
+        html = "<html></html>"
+    return lxml.html.document_fromstring(html.encode("utf-8", "replace"), parser=UTF8_PARSER)
+
+
+def content_hash(html: str) -> str:
+    #identifies the exact body a crawl was extracted from
+    return hashlib.sha256(html.encode("utf-8", "replace")).hexdigest()
+
+
+def node_text(node, separator: str = "", skip=NON_TEXT_TAGS) -> str:
+    #equivalent of BeautifulSoup get_text(separator, strip=True) for an lxml node
+    if not len(node):
+        #leaves (most list items and table cells) have their own text only
+        if not isinstance(node.tag, str) or node.tag in skip:
+            return ""
+        return node.text.strip() if node.text else ""
+    parts = []
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            item = item.strip()
+            if item:
+                parts.append(item)
+            continue
+        #comments and processing instructions only contribute their tail
+        if not isinstance(item.tag, str) or item.tag in skip:
+            continue
+        if item.text:
+            text = item.text.strip()
+            if text:
+                parts.append(text)
+        for child in reversed(item):
+            if child.tail:
+                stack.append(child.tail)
+            stack.append(child)
+    return separator.join(parts)
+
+
+#clean_text extraction. always: readability on every page, never: the raw page text, adaptive: a
+#main content block is scored on the parsed tree and readability only runs when that is inconclusive.
+#always gives the old extractor's text on every benchmark page. adaptive differs where readability's
+#article is too short and the raw page text is kept, but a main block holds most of it: adaptive keeps
+#the block, without title, nav and footer (list_heavy in benchmarks/pages.py)
+CONTENT_EXTRACTION_MODES = ("always", "never", "adaptive")
+CONTENT_EXTRACTION = os.environ.get("CONTENT_EXTRACTION", "adaptive")
+if CONTENT_EXTRACTION not in CONTENT_EXTRACTION_MODES:
+    raise ValueError(f"CONTENT_EXTRACTION must be always, never or adaptive, not {CONTENT_EXTRACTION!r}")
+#readability's article replaces the raw text when it keeps more than this share of it
+READABLE_SHARE = 0.6
+#adaptive: a main block with at least this share of the page text is the article, one with less than
+#RAW_SHARE (or mostly link text) means readability would be thrown away, in between readability decides
+MAIN_BLOCK_SHARE = 0.8
+RAW_SHARE = 0.3
+MAX_LINK_DENSITY = 0.5
+#the elements readability scores as paragraphs, shorter ones are ignored like it does
+PARAGRAPH_TAGS = ("p", "pre", "td")
+MIN_PARAGRAPH_CHARS = 25
+#best scored blocks whose link density is checked
+MAIN_BLOCK_CANDIDATES = 3
+#siblings of the main block that belong to it, readability's thresholds
+SIBLING_MIN_SCORE = 10
+SIBLING_SCORE_SHARE = 0.2
+SIBLING_MIN_CHARS = 80
+SIBLING_MAX_LINK_DENSITY = 0.25
+
+
+def link_density(node, text: str) -> float:
+    links = sum(len(node_text(link)) for link in node.iter("a"))
+    return links / max(1, len(text))
+
+
+def main_block(tree):
+    #readability's candidate scoring without its cleaning passes: every paragraph scores its parent,
+    #and half of that its grandparent, the best block after scaling by link density wins, together
+    #with the siblings readability would append to it.
+    #returns (block text, link density), ("", 0) for pages without paragraphs
+    scores = {}
+    for paragraph in tree.iter(*PARAGRAPH_TAGS):
+        text = node_text(paragraph, " ")
+        parent = paragraph.getparent()
+        if len(text) < MIN_PARAGRAPH_CHARS or parent is None:
+            continue
+        score = 1 + text.count(",") + min(len(text) / 100, 3)
+        scores[parent] = scores.get(parent, 0) + score
+        grandparent = parent.getparent()
+        if grandparent is not None:
+            scores[grandparent] = scores.get(grandparent, 0) + score / 2
+    best, best_score = None, 0.0
+    for block in sorted(scores, key=scores.get, reverse=True)[:MAIN_BLOCK_CANDIDATES]:
+        text = node_text(block, " ", skip=NON_CONTENT_TAGS)
+        score = scores[block] * (1 - link_density(block, text))
+        if score > best_score:
+            best, best_score = block, score
+    if best is None:
+        return "", 0.0
+    parent = best.getparent()
+    blocks = [best] if parent is None else [sibling for sibling in parent if sibling is best
+                                           or is_content_sibling(sibling, scores, best_score)]
+    texts = [node_text(block, " ", skip=NON_CONTENT_TAGS) for block in blocks]
+    text = " ".join(text for text in texts if text)
+    return text, sum(link_density(block, text) for block in blocks)
+
+
+def is_content_sibling(node, scores: dict, best_score: float) -> bool:
+    #readability's rule: a well scored block, or a long paragraph with few links
+    if not isinstance(node.tag, str):
+        return False
+    if scores.get(node, 0) >= max(SIBLING_MIN_SCORE, best_score * SIBLING_SCORE_SHARE):
+        return True
+    if node.tag != "p":
+        return False
+    text = node_text(node, " ")
+    return len(text) > SIBLING_MIN_CHARS and link_density(node, text) < SIBLING_MAX_LINK_DENSITY
+
+
+#==========================================================================
+# Page structure in one pass: headings, feature lists and spec tables in
+# document order, from a single tag-filtered iteration of the tree. Being
+# inside nav/header/footer is tracked with a stack of the containers open
+# at that point, each with the walk position of its last structural
+# descendant, instead of looking up the ancestors of every list and table.
+# Lists and tables own their direct items and rows only, a nested list
+# or table is a candidate of its own and its text is not counted again
+#==========================================================================
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+LIST_TAGS = frozenset(["ul", "ol"])
+#page chrome: features are never taken from it, specifications not from nav or footer
+CHROME_TAGS = ("nav", "header", "footer")
+SPEC_CHROME_TAGS = frozenset(["nav", "footer"])
+STRUCTURE_TAGS = HEADING_TAGS + ("ul", "table") + CHROME_TAGS
+#row groups a table row can sit in
+ROW_GROUP_TAGS = ("thead", "tbody", "tfoot")
+#list item text leaves out nested lists, they are read as lists of their own
+LIST_ITEM_SKIP = NON_TEXT_TAGS | LIST_TAGS
+MAX_FEATURES = 20
+
+
+class PageStructure(NamedTuple):
+    #(position, element) of every heading, position counts headings, lists and tables in document order
+    headings: list
+    #feature list and spec table candidates in document order, outside the chrome they are skipped in
+    lists: list
+    tables: list
+
+
+def page_structure(tree) -> PageStructure:
+    headings, lists, tables = [], [], []
+    #(walk index of the container's last structural descendant, tag) of the chrome containers open
+    chrome = []
+    position = 0
+    for index, element in enumerate(tree.iter(*STRUCTURE_TAGS)):
+        while chrome and chrome[-1][0] < index:
+            chrome.pop()
+        tag = element.tag
+        if tag in CHROME_TAGS:
+            #its descendants are the next ones in the walk
+            chrome.append((index + sum(1 for _ in element.iter(*STRUCTURE_TAGS)) - 1, tag))
+            continue
+        if tag == "ul":
+            if not chrome:
+                lists.append(element)
+        elif tag == "table":
+            if not any(open_tag in SPEC_CHROME_TAGS for _, open_tag in chrome):
+                tables.append(element)
+        else:
+            headings.append((position, element))
+        position += 1
+    return PageStructure(headings, lists, tables)
+
+
+def table_rows(table) -> list:
+    #the table's own rows, directly in it or in its row groups, not those of tables nested in cells
+    rows = []
+    for child in table.iterchildren("tr", *ROW_GROUP_TAGS):
+        if child.tag == "tr":
+            rows.append(child)
+        else:
+            rows.extend(child.iterchildren("tr"))
+    return rows
+
+
+#structured data syntaxes read per page. json-ld is read straight from the tree, any other
+#(microdata, opengraph, rdfa, microformat, dublincore) goes through extruct
+SCHEMA_SYNTAXES = [name.strip() for name in os.environ.get("SCHEMA_SYNTAXES", "json-ld").split(",") if name.strip()]
+
+#leading html or js comment lines that break json-ld blocks, like extruct strips them
+JSON_LD_COMMENT_LINE = re.compile(r"^\s*(//.*|<!--.*-->)", re.M)
+#how deep parse_product_schema looks for a Product inside other nodes
+MAX_SCHEMA_DEPTH = 6
+
+
+def flatten_json_ld(data):
+    #top-level nodes of a json-ld block: lists unrolled, @graph containers replaced by their nodes
+    if isinstance(data, list):
+        for item in data:
+            yield from flatten_json_ld(item)
+    elif isinstance(data, dict):
+        graph = data.get("@graph")
+        if isinstance(graph, (list, dict)):
+            yield from flatten_json_ld(graph)
+            rest = {k: v for k, v in data.items() if k not in ("@graph", "@context")}
+            if rest:
+                yield rest
+        elif data:
+            yield data
+
+
+def json_ld_items(tree) -> list:
+    #every application/ld+json script of the page, a block that does not parse is skipped
+    items = []
+    for script in tree.iter("script"):
+        if (script.get("type") or "").split(";")[0].strip().lower() != "application/ld+json":
+            continue
+        text = script.text or ""
+        try:
+            data = json.loads(text, strict=False)
+        except ValueError:
+            try:
+                #comments and trailing commas, jstyleson comes with extruct
+                import jstyleson
+                data = jstyleson.loads(JSON_LD_COMMENT_LINE.sub("", text), strict=False)
+            except (ImportError, ValueError):
+                continue
+        items.extend(flatten_json_ld(data))
+    return items
+
+
+def nested_products(items, depth: int = MAX_SCHEMA_DEPTH):
+    #Product nodes inside other nodes (mainEntity, itemOffered, hasVariant...), shallowest first
+    level = [value for item in items if isinstance(item, dict) for value in item.values()]
+    for _ in range(depth):
+        next_level = []
+        for value in level:
+            for node in (value if isinstance(value, list) else [value]):
+                if not isinstance(node, dict):
+                    continue
+                if "Product" in schema_types(node):
+                    yield node
+                else:
+                    next_level.extend(node.values())
+        level = next_level
+
+
+def primary_offer(offers):
+    #a single offer, or the first priced one of a list. None when there is no offer at all
+    if isinstance(offers, dict):
+        return offers
+    if isinstance(offers, list):
+        candidates = [offer for offer in offers if isinstance(offer, dict)]
+        return next((offer for offer in candidates if offer_field(offer, "price") is not None),
+                    candidates[0] if candidates else None)
+    return None
+
+
+def offer_field(offer: dict, name: str):
+    #price and priceCurrency, from an AggregateOffer's lowPrice or a priceSpecification when missing
+    value = offer.get(name)
+    if value is None and name == "price":
+        value = offer.get("lowPrice")
+    if value is None:
+        spec = offer.get("priceSpecification")
+        if isinstance(spec, list):
+            spec = next((item for item in spec if isinstance(item, dict)), None)
+        if isinstance(spec, dict):
+            value = spec.get(name)
+    return value
+
+
+def classify_page(product_data: dict) -> str:
+    return "PRODUCT" if product_data.get("name") else "UNKNOWN"
+
+
+#telling which all browser it can work on
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
+}
+FETCH_TIMEOUT = 15
+#per-host rate limits, robots.txt and retries, shared by every fetch in the process
+SCHEDULER = PolitenessScheduler(HEADERS["User-Agent"])
+
+@lru_cache(maxsize=None)
+def http_session():
+    #keep-alive connections are reused across crawls instead of a new TCP/TLS handshake each time.
+    #requests, extruct and readability are imported on first use: processes that never crawl
+    #(scoring role, API processes with an extraction pool) do not pay for them at startup
+    import requests
+    return requests.Session()
+
+
+class FetchedResponse(NamedTuple):
+    #the parts of a response extract() needs, for pages fetched elsewhere
+    url: str
+    status_code: int
+
+
+@lru_cache(maxsize=None)
+def readable_document():
+    from readability import Document
+
+    class ReadableDocument(Document):
+        #keeps the cleaned article tree so its text can be read without re-parsing the summary
+        article = None
+
+        def _parse(self, input):
+            #readability mutates what it is given, and may parse twice per summary
+            if isinstance(input, lxml.html.HtmlElement):
+                input = copy.deepcopy(input)
+            return super()._parse(input)
+
+        def get_clean_html(self):
+            self.article = self.html
+            return super().get_clean_html()
+
+    return ReadableDocument
+
 
 class ProductCrawler:
     def __init__(self,url:str):
@@ -13,42 +351,69 @@ class ProductCrawler:
         self.url=url
         self.response=None
         self.html=None
-        self.soup=None
+        self.tree=None
+        #size, encoding and truncation of the streamed body, see streaming.BodyReader
+        self.fetch_info={}
+        #the mode extract_clean_text ran with and which text it kept: readability, main_block or raw
+        self.content_extraction=None
+        self.clean_text_source=None
+
+    @classmethod
+    def from_html(cls,url:str,html:str,status_code:int=200,final_url:str=None,fetch_info:dict=None):
+        #crawler for html that was already downloaded (async fetcher, worker processes)
+        crawler=cls(url)
+        crawler.response=FetchedResponse(final_url or url,status_code)
+        crawler.html=html
+        crawler.fetch_info=fetch_info or {}
+        return crawler
         
-    def fetch(self):
-        start=time.time()
-        #telling which all browser it can work on
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
-        }
-        self.response=requests.get(self.url,headers=headers,timeout=15)
-        load_time=int((time.time()-start)*1000)
-        #store html in self.html
-        self.html=self.response.text
-        #Parse the HTML content using the lxml parser and store the parsed object in self.soup
-        self.soup=BeautifulSoup(self.html,"lxml")
-        return load_time
+    def fetch(self,extra_headers:dict=None):
+        #extra_headers carries conditional GET headers from the html cache
+        headers={**HEADERS,**(extra_headers or {})}
+        with timed("fetch"):
+            start=time.time()
+            self.response,_=SCHEDULER.fetch(http_session(),self.url,headers=headers,timeout=FETCH_TIMEOUT,stream=True)
+            #store html in self.html, read up to the size cap
+            self.html,self.fetch_info=read_body(self.response)
+        return int((time.time()-start)*1000)
+
+    def parse(self):
+        #Parse the HTML content once and share the tree with every extractor
+        self.tree=parse_html(self.html)
+        return self.tree
     
     def extract_metadata(self):
-        title = self.soup.title.string.strip() if self.soup.title else ""
+        title_tag = next(self.tree.iter("title"), None)
+        title = node_text(title_tag) if title_tag is not None else ""
         #initialising the metadata
          #it is getting metadata
         meta_desc=""
         #storing meta tags
         #it is getting metadata link
-        meta_tag=self.soup.find("meta",attrs={"name":"description"})
-        if meta_tag:
-            meta_desc=meta_tag.get("content"," ")
+        for meta_tag in self.tree.iter("meta"):
+            if meta_tag.get("name")=="description":
+                meta_desc=meta_tag.get("content"," ")
+                break
             #fteching canonical urls
         canonical=""
-        canonical_tag=self.soup.find("link",rel="canonical")
-        if canonical_tag:
-            canonical=canonical_tag.get("href", "")
+        for canonical_tag in self.tree.iter("link"):
+            rel=canonical_tag.get("rel") or ""
+            if rel=="canonical" or "canonical" in rel.split():
+                canonical=canonical_tag.get("href", "")
+                break
         return title,meta_desc,canonical
         
     def extract_schema(self):
-            data=extruct.extract(self.html, base_url=self.url)
-            return data.get("json-ld",[])
+            #json-ld read from the shared tree, no extruct run unless other syntaxes are configured
+            schema_data=json_ld_items(self.tree) if "json-ld" in SCHEMA_SYNTAXES else []
+            syntaxes=[name for name in SCHEMA_SYNTAXES if name!="json-ld"]
+            if syntaxes:
+                import extruct
+                #uniform gives every syntax the json-ld shape (@type, properties as keys)
+                data=extruct.extract(self.tree, base_url=self.url, syntaxes=syntaxes, uniform=True)
+                for name in syntaxes:
+                    schema_data.extend(item for item in data.get(name,[]) if isinstance(item,dict))
+            return schema_data
         
     def parse_product_schema(self,schema_data):
             product_data = {
@@ -61,28 +426,32 @@ class ProductCrawler:
             "rating": None,
             "review_count": None
             }
-            for item in schema_data:
-                if isinstance(item, dict) and item.get("@type") == "Product":
-                    product_data["name"] = item.get("name", "")
-                    # brand extraction
-                    brand = item.get("brand")
-                    if isinstance(brand, dict):
-                        product_data["brand"] = brand.get("name", "")
-                    elif isinstance(brand, str):
-                        product_data["brand"] = brand
-                    product_data["sku"] = item.get("sku", "")
-                        #offer extraction
-                    offers = item.get("offers", {})
-                    if isinstance(offers, dict):
-                            product_data["price"] = offers.get("price")
-                            product_data["currency"] = offers.get("priceCurrency", "")
-                            product_data["availability"] = offers.get("availability", "")
-                        #rating extraction
-                    rating = item.get("aggregateRating", {})
-                    if isinstance(rating, dict):
-                            product_data["rating"] = rating.get("ratingValue")
-                            product_data["review_count"] = rating.get("reviewCount")
-                            
+            products = [item for item in schema_data if isinstance(item, dict) and "Product" in schema_types(item)]
+            if not products:
+                #ItemPage mainEntity, Offer itemOffered, ProductGroup hasVariant...
+                nested = next(nested_products(schema_data), None)
+                products = [nested] if nested is not None else []
+            for item in products:
+                product_data["name"] = item.get("name", "")
+                # brand extraction
+                brand = item.get("brand")
+                if isinstance(brand, dict):
+                    product_data["brand"] = brand.get("name", "")
+                elif isinstance(brand, str):
+                    product_data["brand"] = brand
+                product_data["sku"] = item.get("sku", "")
+                    #offer extraction
+                offer = primary_offer(item.get("offers", {}))
+                if offer is not None:
+                        product_data["price"] = offer_field(offer, "price")
+                        product_data["currency"] = offer_field(offer, "priceCurrency") or ""
+                        product_data["availability"] = offer.get("availability", "")
+                    #rating extraction
+                rating = item.get("aggregateRating", {})
+                if isinstance(rating, dict):
+                        product_data["rating"] = rating.get("ratingValue")
+                        product_data["review_count"] = rating.get("reviewCount")
+                        
             return product_data
     #price extraction startegy
     def extract_price_fallback(self,text):
@@ -94,58 +463,53 @@ class ProductCrawler:
                 return match.group()
             return None
         
-    #extracting heading
-    def extract_headings(self):
-            #initializing heading
-            headings=[]
-            #till leve 7
-            for level in range(1,7):
-                tag = f"h{level}"
-                for h in self.soup.find_all(tag):
-                    headings.append({
-                        "level":tag,
-                        "text":h.get_text(strip=True)
-                    })
-            return headings
+    #extracting heading, in document order
+    def extract_headings(self,structure:PageStructure=None):
+            structure=structure or page_structure(self.tree)
+            return [{
+                "level":h.tag,
+                "text":node_text(h),
+                "position":position
+            } for position,h in structure.headings]
         
-    def extract_features(self):
-            features = []
-            for ul in self.soup.find_all("ul"):
-                # Skip nav or footer sections
-                if ul.find_parent(["nav", "footer", "header"]):
-                    continue
+    def extract_features(self,structure:PageStructure=None):
+            structure=structure or page_structure(self.tree)
+            #nav, header and footer lists are not candidates
+            seen = set()
+            clean_features = []
+            for ul in structure.lists:
                 items = []
-                for li in ul.find_all("li"):
-                    text = li.get_text(strip=True)
+                for li in ul.iterchildren("li"):
+                    text = node_text(li, skip=LIST_ITEM_SKIP)
                      # Filter junk
                     if len(text) > 10 and not text.lower() in ["home", "about", "contact"]:
                         items.append(text)
-                if 2 <= len(items) <= 20:
-                        features.extend(items)
-            # Remove duplicates while preserving order
-            seen = set()
-            clean_features = []
-            for f in features:
+                if not 2 <= len(items) <= 20:
+                    continue
+                # Remove duplicates while preserving order
+                for f in items:
                     if f not in seen:
                         seen.add(f)
                         clean_features.append(f)
-            return clean_features[:20]
+                #later lists cannot change the first MAX_FEATURES
+                if len(clean_features) >= MAX_FEATURES:
+                    break
+            return clean_features[:MAX_FEATURES]
                 
-    def extract_specifications(self):
+    def extract_specifications(self,structure:PageStructure=None):
+            structure=structure or page_structure(self.tree)
             specs = {}
-            for table in self.soup.find_all("table"):
-                #skip tables in nav, footer
-                if table.find_parent(["nav", "footer"]):
-                    continue
-                rows = table.find_all("tr")
+            #nav and footer tables are not candidates
+            for table in structure.tables:
+                rows = table_rows(table)
                 #skip small tables
                 if len(rows) < 2:
                     continue
                 for row in rows:
-                    cols = row.find_all(["td", "th"])
+                    cols = list(row.iterchildren("td", "th"))
                     if len(cols) == 2:
-                        key = cols[0].get_text(strip=True)
-                        value = cols[1].get_text(strip=True)
+                        key = node_text(cols[0])
+                        value = node_text(cols[1])
                         if len(key) < 2 or len(value) < 2:
                             continue
                         if len(key) > 100 or len(value) > 300:
@@ -165,8 +529,11 @@ class ProductCrawler:
             base_domain=urlparse(self.url).netloc
             seen_internal=set()
             seen_external=set()
-            for a in self.soup.find_all("a",href=True):
-                href=a["href"].strip()
+            for a in self.tree.iter("a"):
+                href=a.get("href")
+                if href is None:
+                    continue
+                href=href.strip()
                 #now to skip junks
                 if href.startswith("#"):
                     continue
@@ -176,14 +543,16 @@ class ProductCrawler:
                     continue
                 if href.startswith("tel:"):
                     continue
-                #getting absolute url
-                link=urljoin(self.url,href)
-                #breaking that url
-                parsed=urlparse(link)
+                #getting absolute url and breaking it, a malformed one (broken IPv6 literal) is skipped
+                try:
+                    link=urljoin(self.url,href)
+                    parsed=urlparse(link)
+                except ValueError:
+                    continue
                 if not parsed.scheme.startswith("http"):
                     continue
                 domain=parsed.netloc
-                anchor_text=a.get_text(strip=True)
+                anchor_text=node_text(a)
                 link_data = {
                     "url": link,
                     "anchor_text": anchor_text
@@ -200,86 +569,146 @@ class ProductCrawler:
             return internal,external
     
     def detect_trust_signal(self):
-        text=self.soup.get_text(" ",strip=True).lower()
-        links=[a.get_text(strip=True).lower() for a in self.soup.find_all("a")]
-        def contains_keywords(source,keywords):
-            return any(keyword in source for keyword in keywords)
+        text=node_text(self.tree," ").lower()
+        #link texts joined once, a keyword cannot span the newline between two links
+        links="\n".join(node_text(a) for a in self.tree.iter("a")).lower()
+        language=page_language(self.tree.get("lang"))
+        found=keyword_matcher("text",language).match(text)
+        found.update(keyword_matcher("links",language).match(links))
         
         trust = {
-            "has_return_policy": contains_keywords(text, ["return policy", "returns"]),
-        "has_refund_policy": contains_keywords(text, ["refund policy", "refunds"]),
-        "has_warranty_info": contains_keywords(text, ["warranty"]),
-        "has_shipping_info": contains_keywords(text, ["shipping", "delivery"]),
-        "has_cancellation_policy": contains_keywords(text, ["cancellation"]),
+            "has_return_policy": found["has_return_policy"],
+        "has_refund_policy": found["has_refund_policy"],
+        "has_warranty_info": found["has_warranty_info"],
+        "has_shipping_info": found["has_shipping_info"],
+        "has_cancellation_policy": found["has_cancellation_policy"],
 
         # Security signals
         "uses_https": self.url.startswith("https"),
-        "mentions_secure_payment": contains_keywords(text, ["secure payment", "100% secure", "ssl"]),
-        "has_cod_option": contains_keywords(text, ["cash on delivery", "cod"]),
+        "mentions_secure_payment": found["mentions_secure_payment"],
+        "has_cod_option": found["has_cod_option"],
 
         # Business identity
-        "has_contact_page": any("contact" in link for link in links),
-        "has_about_page": any("about" in link for link in links),
-        "mentions_phone": bool(re.search(r"\+?\d[\d\s-]{8,}", text)),
-        "mentions_email": bool(re.search(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", text)),
+        "has_contact_page": found["has_contact_page"],
+        "has_about_page": found["has_about_page"],
+        "mentions_phone": mentions_phone(text),
+        "mentions_email": mentions_email(text),
 
         # Social proof
-        "mentions_reviews": contains_keywords(text, ["review", "ratings"]),
-        "mentions_testimonials": contains_keywords(text, ["testimonial"]),
+        "mentions_reviews": found["mentions_reviews"],
+        "mentions_testimonials": found["mentions_testimonials"],
 
         # Brand legitimacy
-        "official_store_claim": contains_keywords(text, ["official store", "authorized seller"])
+        "official_store_claim": found["official_store_claim"]
     }
         return trust
     
-    def extract_clean_text(self):
+    def extract_clean_text(self,mode:str=None):
+        #mode: one of CONTENT_EXTRACTION_MODES, the configured one by default
+        mode=mode or CONTENT_EXTRACTION
+        self.content_extraction = mode
          # Raw cleaned version
-        soup = BeautifulSoup(self.html, "lxml")
-        for tag in soup(["script", "style", "noscript"]):
-            tag.decompose()
-        raw_text = soup.get_text(separator=" ", strip=True)
-            # Readability version
-        doc = Document(self.html)
-        readable_html = doc.summary()
-        readable_soup = BeautifulSoup(readable_html, "lxml")
-        readable_text = readable_soup.get_text(separator=" ", strip=True)
-            
+        raw_text = node_text(self.tree, " ", skip=NON_CONTENT_TAGS)
+        final_text = raw_text
+        self.clean_text_source = "raw"
+        run_readability = mode == "always"
+        if mode == "adaptive":
+            block_text, density = main_block(self.tree)
+            share = len(block_text) / max(1, len(raw_text))
+            if share >= MAIN_BLOCK_SHARE and density <= MAX_LINK_DENSITY:
+                final_text = block_text
+                self.clean_text_source = "main_block"
+            #a page without a dominant block or with mostly link text keeps its raw text, like
+            #readability's article would be thrown away for it
+            run_readability = RAW_SHARE <= share < MAIN_BLOCK_SHARE and density <= MAX_LINK_DENSITY
+        if run_readability:
+            # Readability version, run on a copy of the shared tree
+            doc = readable_document()(self.tree)
+            doc.summary()
+            readable_text = node_text(doc.article, " ")
             # Choose longer one (more content preserved)
-        if len(readable_text) > len(raw_text) * 0.6:
+            if len(readable_text) > len(raw_text) * READABLE_SHARE:
                 final_text = readable_text
-        else:
-                final_text = raw_text
+                self.clean_text_source = "readability"
         final_text = " ".join(final_text.split())
         return final_text, len(final_text.split())
             
-    def build(self):
-        load_time=self.fetch()
+    def fetch_error(self):
         if self.response.status_code!=200:
             return{
                 "error": f"Failed to fetch page. Status code: {self.response.status_code}",
             "url": self.url
             }
-            
-        title,meta_desc,canonical=self.extract_metadata()
-        schema_data=self.extract_schema()
-        product_data=self.parse_product_schema(schema_data)
+        #non-html bodies are not downloaded at all
+        if self.fetch_info.get("rejected"):
+            return {"error": self.fetch_info["rejected"], "url": self.url}
+        return None
+
+    def survey(self,load_time):
+        #site crawls: page type and internal links of every page, full extraction only for product pages
+        error=self.fetch_error()
+        if error:
+            return error
+        if self.tree is None:
+            self.parse()
+        page_type=classify_page(self.parse_product_schema(self.extract_schema()))
+        if page_type=="PRODUCT":
+            result=self.extract(load_time,timings=True)
+            internal_links=result["links"]["internal"]
+        else:
+            result=None
+            internal_links,_=self.extract_links()
+        return {
+            "page_type": page_type,
+            "links": [link["url"] for link in internal_links],
+            "result": result
+        }
+
+    def build(self):
+        load_time=self.fetch()
+        return self.extract(load_time)
+
+    def extract(self,load_time,timings:bool=False,count_nodes:bool=False):
+        #runs every extractor on an already fetched response. timings: time each stage into the result's
+        #"timings" with the page size for the API process to record, count_nodes: and the element count,
+        #one more walk of the whole tree. A plain extraction pays for neither
+        error=self.fetch_error()
+        if error:
+            return error
+
+        timer=Timings() if timings else NoTimings()
+        with timer.stage("parse"):
+            if self.tree is None:
+                self.parse()
+        with timer.stage("metadata"):
+            title,meta_desc,canonical=self.extract_metadata()
+        with timer.stage("schema"):
+            schema_data=self.extract_schema()
+            product_data=self.parse_product_schema(schema_data)
         
-        headings=self.extract_headings()
-        feature_data=self.extract_features()
-        specs_data=self.extract_specifications()
-        internal_links, external_links = self.extract_links()
-        trust=self.detect_trust_signal()
-        clean_text, word_count = self.extract_clean_text()
+        with timer.stage("structure"):
+            structure=page_structure(self.tree)
+            headings=self.extract_headings(structure)
+            feature_data=self.extract_features(structure)
+            specs_data=self.extract_specifications(structure)
+        with timer.stage("links"):
+            internal_links, external_links = self.extract_links()
+        with timer.stage("trust"):
+            trust=self.detect_trust_signal()
+        with timer.stage("clean_text"):
+            clean_text, word_count = self.extract_clean_text()
         #price fallback
         if not product_data.get("price"):
             fallback_price=self.extract_price_fallback(clean_text)
             product_data["price"]=fallback_price
+        with timer.stage("fingerprint"):
+            fingerprint=page_fingerprint(clean_text,product_data)
         # Basic page classification
-        page_type = "PRODUCT" if product_data.get("name") else "UNKNOWN"
-        return {
+        page_type = classify_page(product_data)
+        result = {
             "page_info": {
                 "url": self.url,
-                "final_url": self.response.url,
+                "final_url": str(self.response.url),
                 "status_code": self.response.status_code,
                 "canonical_url": canonical,
                 "title": title,
@@ -287,7 +716,17 @@ class ProductCrawler:
                 "https": self.url.startswith("https"),
                 "load_time_ms": load_time,
                 "page_type": page_type,
-                "crawl_timestamp": datetime.utcnow().isoformat()
+                "crawl_timestamp": datetime.utcnow().isoformat(),
+                "content_hash": content_hash(self.html),
+                #SimHash of clean_text and product, near-duplicate variants differ in a few bits
+                "simhash": fingerprint_hex(fingerprint),
+                #a body over the size cap is extracted from its first MAX_PAGE_BYTES
+                "truncated": self.fetch_info.get("truncated",False),
+                "bytes_downloaded": self.fetch_info.get("bytes"),
+                "encoding": self.fetch_info.get("encoding"),
+                #the extraction mode clean_text was taken with and the text it kept: readability, main_block or raw
+                "content_extraction": self.content_extraction,
+                "clean_text_source": self.clean_text_source
         },
         "product": product_data,
         "content": {
@@ -302,5 +741,10 @@ class ProductCrawler:
             "external": external_links
         },
         "trust_signals": trust,
-        "clean_text": clean_text  
-    }
\ No newline at end of file
+        "clean_text": clean_text
+        }
+        if timings:
+            result["timings"]={**timer.stages,"page_bytes":len(self.html.encode("utf-8","replace"))}
+            if count_nodes:
+                result["timings"]["page_nodes"]=sum(1 for _ in self.tree.iter())
+        return result
\ No newline at end of file
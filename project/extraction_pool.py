@@ -0,0 +1,71 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from crawler import ProductCrawler
+
+#0 keeps extraction in the API process (threads), otherwise the number of worker processes
+EXTRACTION_WORKERS = int(os.environ.get("EXTRACTION_WORKERS", "0"))
+
+#pages per worker being fetched for the pool, queued in it or extracted, before more fetches have to wait
+PAGES_PER_WORKER = int(os.environ.get("PAGES_PER_WORKER", "4"))
+
+WARMUP_HTML = (
+    "<html><head><title>warmup</title>"
+    '<script type="application/ld+json">{"@type": "Product", "name": "warmup"}</script>'
+    "</head><body><h1>warmup</h1><p>warming the extraction worker up.</p></body></html>"
+)
+
+
+def warm_worker():
+    #first extraction pays for lazy imports and lxml/readability setup, do it before real work
+    ProductCrawler.from_html("https://warmup.invalid/", WARMUP_HTML).extract(0)
+
+
+def extract_page(url: str, html: str, status_code: int, final_url: str, fetch_info: dict, load_time: int,
+                 count_nodes: bool = False) -> dict:
+    #always timed, the API process records the timings
+    crawler = ProductCrawler.from_html(url, html, status_code, final_url, fetch_info)
+    return crawler.extract(load_time, timings=True, count_nodes=count_nodes)
+
+
+def survey_page(url: str, html: str, status_code: int, final_url: str, fetch_info: dict, load_time: int) -> dict:
+    return ProductCrawler.from_html(url, html, status_code, final_url, fetch_info).survey(load_time)
+
+
+class ExtractionPool:
+    def __init__(self, workers: int = EXTRACTION_WORKERS, pages_per_worker: int = PAGES_PER_WORKER):
+        self.workers = workers
+        #spawn, the API process has event loop and client threads that must not be forked
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_worker,
+        )
+        #backpressure: a page takes a slot before it is fetched and gives it back once extracted (see
+        #BatchCrawler.page_slot), so the downloaded bodies waiting for the pool and the fetch rate are bounded
+        #by what the workers get through
+        self.slots = asyncio.Semaphore(workers * pages_per_worker)
+
+    async def start(self):
+        #submit one job per worker so every process is spawned and warmed up front
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, os.getpid) for _ in range(self.workers)))
+
+    async def extract(self, crawler: ProductCrawler, load_time: int, count_nodes: bool = False) -> dict:
+        return await self.run(extract_page, crawler, load_time, count_nodes)
+
+    async def survey(self, crawler: ProductCrawler, load_time: int) -> dict:
+        return await self.run(survey_page, crawler, load_time)
+
+    async def run(self, func, crawler: ProductCrawler, load_time: int, *args) -> dict:
+        #the caller holds one of self.slots since before the page was fetched
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, func, crawler.url, crawler.html,
+            crawler.response.status_code, str(crawler.response.url), crawler.fetch_info, load_time, *args,
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
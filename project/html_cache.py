@@ -0,0 +1,194 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from crawler import content_hash
+from metrics import count_cache, timed
+
+#entries older than this are dropped and the page is fetched unconditionally
+HTML_CACHE_TTL = int(os.environ.get("HTML_CACHE_TTL", str(7 * 24 * 3600)))
+#total size of stored bodies before least recently used entries are evicted
+HTML_CACHE_MAX_BYTES = int(os.environ.get("HTML_CACHE_MAX_MB", "1024")) * 1024 * 1024
+#seconds between sweeps for expired entries, puts in between only check the size budget
+HTML_CACHE_EXPIRE_INTERVAL = 300
+#entries deleted per query by expiry and eviction
+HTML_CACHE_EVICT_BATCH = 200
+
+
+class CacheEntry(NamedTuple):
+    url: str
+    body_hash: str
+    etag: str
+    last_modified: str
+    fetched_at: float
+    result: str
+
+
+class HtmlCache:
+    #raw html stored once per body hash, with a url index holding validators and the extraction
+    def __init__(self, folder: str, ttl: int = HTML_CACHE_TTL, max_bytes: int = HTML_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.objects = os.path.join(folder, "objects")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(self.objects, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(folder, "index.sqlite"), check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                body_hash TEXT NOT NULL,
+                body_size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                result TEXT NOT NULL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_body_hash ON entries (body_hash)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_fetched_at ON entries (fetched_at)")
+        #one row per stored body, their sizes add up to the running total checked on every put
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS bodies (
+                body_hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            )""")
+        #caches written before the bodies table
+        self.db.execute("INSERT OR IGNORE INTO bodies SELECT body_hash, MAX(body_size) FROM entries GROUP BY body_hash")
+        self.db.commit()
+        self.stored_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+        self.last_expiry = 0.0
+
+    def object_path(self, body_hash: str) -> str:
+        return os.path.join(self.objects, body_hash[:2], body_hash + ".html.gz")
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT url, body_hash, etag, last_modified, fetched_at, result FROM entries WHERE url = ?",
+                (url,)).fetchone()
+            if row is None:
+                return None
+            entry = CacheEntry(*row)
+            if time.time() - entry.fetched_at > self.ttl:
+                self._delete(url, entry.body_hash)
+                self.db.commit()
+                return None
+            return entry
+
+    def load_html(self, entry: CacheEntry) -> Optional[str]:
+        path = self.object_path(entry.body_hash)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+
+    @staticmethod
+    def conditional_headers(entry: Optional[CacheEntry]) -> dict:
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def reuse(self, entry: Optional[CacheEntry], crawler, load_time: int) -> Optional[dict]:
+        #previous extraction when the server says 304 or sends back the same body
+        if entry is None:
+            count_cache("html", False)
+            return None
+        status = crawler.response.status_code
+        if status == 304:
+            cache_status = "not_modified"
+        elif status == 200 and content_hash(crawler.html) == entry.body_hash:
+            cache_status = "unchanged"
+        else:
+            count_cache("html", False)
+            return None
+        count_cache("html", True)
+        now = time.time()
+        with self.lock:
+            self.db.execute("UPDATE entries SET fetched_at = ?, last_access = ? WHERE url = ?",
+                            (now, now, entry.url))
+            self.db.commit()
+        result = json.loads(entry.result)
+        result["page_info"]["load_time_ms"] = load_time
+        result["page_info"]["crawl_timestamp"] = datetime.utcnow().isoformat()
+        result["page_info"]["cache_status"] = cache_status
+        return result
+
+    def put(self, crawler, result: dict):
+        with timed("html_cache_put"):
+            self._put(crawler, result)
+
+    def _put(self, crawler, result: dict):
+        #timings belong to one extraction and are not served again on reuse
+        result = {k: v for k, v in result.items() if k != "timings"}
+        body_hash = result["page_info"]["content_hash"]
+        path = self.object_path(body_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                f.write(crawler.html)
+            os.replace(tmp_path, path)
+        headers = crawler.response.headers
+        now = time.time()
+        with self.lock:
+            previous = self.db.execute("SELECT body_hash FROM entries WHERE url = ?", (crawler.url,)).fetchone()
+            size = os.path.getsize(path)
+            if self.db.execute("INSERT OR IGNORE INTO bodies VALUES (?, ?)", (body_hash, size)).rowcount:
+                self.stored_bytes += size
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (crawler.url, body_hash, size, headers.get("ETag"),
+                 headers.get("Last-Modified"), now, now, json.dumps(result, ensure_ascii=False)))
+            if previous and previous[0] != body_hash:
+                self._drop_object_if_unused(previous[0])
+            self._evict()
+            self.db.commit()
+
+    def _delete(self, url: str, body_hash: str):
+        self.db.execute("DELETE FROM entries WHERE url = ?", (url,))
+        self._drop_object_if_unused(body_hash)
+
+    def _drop_object_if_unused(self, body_hash: str):
+        #bodies are shared between urls serving identical html
+        if self.db.execute("SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1", (body_hash,)).fetchone():
+            return
+        row = self.db.execute("SELECT size FROM bodies WHERE body_hash = ?", (body_hash,)).fetchone()
+        if row is not None:
+            self.db.execute("DELETE FROM bodies WHERE body_hash = ?", (body_hash,))
+            self.stored_bytes -= row[0]
+        try:
+            os.remove(self.object_path(body_hash))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        #expired entries now and then, least recently used ones while over the size budget, a batch at a time
+        now = time.time()
+        if now - self.last_expiry >= HTML_CACHE_EXPIRE_INTERVAL:
+            self.last_expiry = now
+            while self._delete_batch("SELECT url, body_hash FROM entries WHERE fetched_at < ? LIMIT ?",
+                                     (now - self.ttl, HTML_CACHE_EVICT_BATCH)):
+                pass
+        while self.stored_bytes > self.max_bytes:
+            if not self._delete_batch("SELECT url, body_hash FROM entries ORDER BY last_access LIMIT ?",
+                                      (HTML_CACHE_EVICT_BATCH,), until_under_budget=True):
+                break
+
+    def _delete_batch(self, query: str, params: tuple, until_under_budget: bool = False) -> int:
+        rows = self.db.execute(query, params).fetchall()
+        for deleted, (url, body_hash) in enumerate(rows, 1):
+            self._delete(url, body_hash)
+            if until_under_budget and self.stored_bytes <= self.max_bytes:
+                return deleted
+        return len(rows)
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from politeness import backoff_delay
+
+#worker tasks running jobs at the same time
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+#queued jobs accepted before submissions are refused
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", "10000"))
+#finished jobs and their results are kept this long
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", str(7 * 24 * 3600)))
+#workers look at the queue at least this often, submissions wake them at once
+JOB_POLL_INTERVAL = 1.0
+CALLBACK_ATTEMPTS = 3
+#seconds a callback POST may take
+CALLBACK_TIMEOUT = 15
+
+JOB_KINDS = ("crawl", "score", "context")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    #persistent priority queue of crawl, score and context jobs in SQLite, identical pending jobs are merged
+    def __init__(self, path: str, max_queued: int = MAX_QUEUED_JOBS):
+        self.max_queued = max_queued
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL DEFAULT 'queued',
+                dedup_key TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS job_callbacks (
+                job_id INTEGER NOT NULL REFERENCES jobs (id),
+                url TEXT NOT NULL,
+                error TEXT,
+                PRIMARY KEY (job_id, url)
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_key ON jobs (dedup_key) WHERE state IN ('queued', 'running');
+            CREATE INDEX IF NOT EXISTS jobs_next ON jobs (state, priority DESC, id);
+            CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+        """)
+        self.db.commit()
+
+    def submit(self, kind: str, payload: dict, dedup_key: str, priority: int = 0,
+               callback_url: str = None) -> Tuple[int, bool]:
+        #(job id, True when an identical queued or running job was reused)
+        with self.lock:
+            row = self.db.execute("SELECT id FROM jobs WHERE dedup_key = ? AND state IN ('queued', 'running')",
+                                  (dedup_key,)).fetchone()
+            if row is not None:
+                job_id, existing = row[0], True
+                #a more urgent duplicate moves the queued job up
+                self.db.execute("UPDATE jobs SET priority = MAX(priority, ?) WHERE id = ?", (priority, job_id))
+            else:
+                queued = self.db.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+                if queued >= self.max_queued:
+                    raise QueueFull(f"Job queue is full ({queued} queued)")
+                job_id, existing = self.db.execute(
+                    "INSERT INTO jobs (kind, payload, priority, dedup_key, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (kind, json.dumps(payload), priority, dedup_key, time.time())).lastrowid, False
+            if callback_url:
+                self.db.execute("INSERT OR IGNORE INTO job_callbacks (job_id, url) VALUES (?, ?)",
+                                (job_id, callback_url))
+            self.db.commit()
+        return job_id, existing
+
+    def claim(self, kinds: Iterable[str] = JOB_KINDS) -> Optional[Tuple[int, str, dict]]:
+        #highest priority first, oldest first within a priority, among the kinds this process runs
+        kinds = tuple(kinds)
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT id, kind, payload FROM jobs WHERE state = 'queued' AND kind IN ({','.join('?' * len(kinds))})"
+                " ORDER BY priority DESC, id LIMIT 1", kinds).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE jobs SET state = 'running', started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (time.time(), row[0]))
+            self.db.commit()
+        return row[0], row[1], json.loads(row[2])
+
+    def finish(self, job_id: int, result: dict = None, error: str = None):
+        with self.lock:
+            self.db.execute("UPDATE jobs SET state = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                            ("failed" if error else "done", json.dumps(result) if result is not None else None,
+                             error, time.time(), job_id))
+            self.db.commit()
+
+    def requeue_running(self, kinds: Iterable[str] = JOB_KINDS) -> int:
+        #jobs that were running when the process stopped are run again
+        kinds = tuple(kinds)
+        with self.lock:
+            count = self.db.execute(
+                f"UPDATE jobs SET state = 'queued' WHERE state = 'running' AND kind IN ({','.join('?' * len(kinds))})",
+                kinds).rowcount
+            self.db.commit()
+        return count
+
+    def purge(self, retention: float = JOB_RETENTION) -> int:
+        with self.lock:
+            old = "SELECT id FROM jobs WHERE state IN ('done', 'failed') AND finished_at < ?"
+            cutoff = time.time() - retention
+            self.db.execute(f"DELETE FROM job_callbacks WHERE job_id IN ({old})", (cutoff,))
+            count = self.db.execute(f"DELETE FROM jobs WHERE id IN ({old})", (cutoff,)).rowcount
+            self.db.commit()
+        return count
+
+    def get(self, job_id: int) -> Optional[dict]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT id, kind, payload, priority, state, result, error, attempts, created_at, started_at,"
+                " finished_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            callbacks = self.db.execute("SELECT url, error FROM job_callbacks WHERE job_id = ?", (job_id,)).fetchall()
+        keys = ("job_id", "kind", "payload", "priority", "state", "result", "error", "attempts", "created_at",
+                "started_at", "finished_at")
+        job = dict(zip(keys, row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["callbacks"] = [{"url": url, "error": error} for url, error in callbacks]
+        if job["state"] == "queued":
+            job["position"] = self.position(job_id, job["priority"])
+        return job
+
+    def position(self, job_id: int, priority: int) -> int:
+        #jobs that will be claimed before this one
+        with self.lock:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'queued' AND (priority > ? OR (priority = ? AND id < ?))",
+                (priority, priority, job_id)).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def callbacks(self, job_id: int) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT url FROM job_callbacks WHERE job_id = ?", (job_id,))]
+
+    def callback_failed(self, job_id: int, url: str, error: str):
+        with self.lock:
+            self.db.execute("UPDATE job_callbacks SET error = ? WHERE job_id = ? AND url = ?", (error, job_id, url))
+            self.db.commit()
+
+
+class JobWorkers:
+    #asyncio workers taking jobs off the queue, handlers are async functions per job kind returning the result
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[dict], Awaitable[dict]]],
+                 concurrency: int = JOB_WORKERS, client=None):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = concurrency
+        #httpx client for callbacks, one of its own is opened on the first callback without it
+        self.client = client
+        self.own_client = False
+        self.wakeup = asyncio.Event()
+        self.tasks = []
+
+    def start(self):
+        #only kinds this process runs, a process of the other role may share the queue
+        self.queue.requeue_running(self.handlers)
+        self.queue.purge()
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.concurrency)]
+
+    def notify(self):
+        self.wakeup.set()
+
+    async def stop(self):
+        #running jobs stay 'running' in the queue and are requeued on the next start
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.own_client:
+            await self.client.aclose()
+            self.client, self.own_client = None, False
+
+    async def work(self):
+        while True:
+            job = await asyncio.to_thread(self.queue.claim, self.handlers)
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job_id, kind, payload = job
+            try:
+                result = await self.handlers[kind](payload)
+                error = result.get("error") if isinstance(result, dict) else None
+                await asyncio.to_thread(self.queue.finish, job_id, result, error)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await asyncio.to_thread(self.queue.finish, job_id, None, str(e) or type(e).__name__)
+            await self.send_callbacks(job_id)
+
+    async def send_callbacks(self, job_id: int):
+        urls = await asyncio.to_thread(self.queue.callbacks, job_id)
+        if not urls:
+            return
+        if self.client is None:
+            import httpx
+            self.client, self.own_client = httpx.AsyncClient(timeout=CALLBACK_TIMEOUT), True
+        job = await asyncio.to_thread(self.queue.get, job_id)
+        for url in urls:
+            error = None
+            for attempt in range(CALLBACK_ATTEMPTS):
+                try:
+                    response = await self.client.post(url, json=job)
+                    if response.status_code < 400:
+                        error = None
+                        break
+                    error = f"Callback returned status {response.status_code}"
+                except Exception as e:
+                    error = str(e) or type(e).__name__
+                #no wait after the last attempt, the failure is recorded at once
+                if attempt + 1 < CALLBACK_ATTEMPTS:
+                    await asyncio.sleep(backoff_delay(attempt))
+            if error:
+                await asyncio.to_thread(self.queue.callback_failed, job_id, url, error)
@@ -1,7 +1,148 @@
+import hashlib
+import json
+import math
+import os
 import re
-from typing import Dict, List
+import sqlite3
+import string
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from crawl_store import CONTEXT_FIELDS
+from metrics import count_cache, timed
+from score_cache import SCORING_INPUTS, ScoreCache
+from serialization import dumps, loads
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+#==========================================================================
+# Token counting for context budgets. "approx" needs nothing: a token per
+# word or punctuation mark, and one more per APPROX_CHARS_PER_TOKEN
+# characters of a long word, which errs high against BPE tokenizers so a
+# budget holds. "tiktoken" counts with TIKTOKEN_ENCODING when tiktoken is
+# installed. Other tokenizers are added with register_tokenizer
+#==========================================================================
+APPROX_CHARS_PER_TOKEN = 5
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+TIKTOKEN_ENCODING = os.environ.get("TIKTOKEN_ENCODING", "cl100k_base")
+
+
+def approx_tokens(text: str) -> int:
+    return sum(1 + (len(piece) - 1) // APPROX_CHARS_PER_TOKEN for piece in TOKEN_PATTERN.findall(text))
+
+
+def tiktoken_counter() -> Callable[[str], int]:
+    if tiktoken is None:
+        raise ValueError("the tiktoken tokenizer needs the tiktoken package")
+    encoding = tiktoken.get_encoding(TIKTOKEN_ENCODING)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+#tokenizer name -> factory of its count function, the factory runs on first use
+TOKENIZERS: Dict[str, Callable[[], Callable[[str], int]]] = {
+    "approx": lambda: approx_tokens,
+    "tiktoken": tiktoken_counter,
+}
+_counters: Dict[str, Callable[[str], int]] = {}
+
+
+def register_tokenizer(name: str, factory: Callable[[], Callable[[str], int]]):
+    #the tokenizer of the model the contexts are sent to, e.g. a local sentencepiece model
+    TOKENIZERS[name] = factory
+    _counters.pop(name, None)
+
+
+def token_counter(name: str = None) -> Callable[[str], int]:
+    name = name or CONTEXT_TOKENIZER
+    if name not in _counters:
+        if name not in TOKENIZERS:
+            raise ValueError(f"unknown tokenizer {name!r}, one of {', '.join(TOKENIZERS)}")
+        _counters[name] = TOKENIZERS[name]()
+    return _counters[name]
+
+
+CONTEXT_TOKENIZER = os.environ.get("CONTEXT_TOKENIZER", "approx")
+if CONTEXT_TOKENIZER == "tiktoken" and tiktoken is None:
+    raise ValueError("CONTEXT_TOKENIZER=tiktoken needs the tiktoken package")
+#tokens of the content excerpt, about the 1200 characters it used to be cut at
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "300"))
+if CONTEXT_TOKEN_BUDGET <= 0:
+    raise ValueError("CONTEXT_TOKEN_BUDGET must be positive")
+
+#==========================================================================
+# Excerpt ranking. Page text sentences are ranked by the product terms
+# they contain (name and brand weigh most, then features and
+# specifications, then title and description), per square root of their
+# length so long sentences do not win by size. Sentences without product
+# terms follow in page order. The best ones fill the text share of the
+# budget, features and specifications the rest, and any tokens left go
+# back to text. Chosen sentences keep their page order
+#==========================================================================
+EXCERPT_TEXT_SHARE = 0.5
+EXCERPT_FEATURES = 6
+EXCERPT_SPECS = 5
+#features and specifications that product terms are taken from, the first ones are the main ones
+TERM_ITEMS = 50
+#a budget with fewer tokens left than this takes no more sentences, nor does one after this many
+#sentences in a row that did not fit (each is tokenized to find out)
+MIN_SENTENCE_TOKENS = 4
+MAX_SKIPPED_SENTENCES = 25
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+TERM_PATTERN = re.compile(r"[^\W_]{3,}")
+#sentences are split into words with str.translate, several times faster than a regex over long pages
+WORD_SEPARATORS = str.maketrans({c: " " for c in string.punctuation})
+STOPWORDS = frozenset("the and for with this that from your you are our its has have was were will can not all "
+                      "any but more one out get also into than then them they".split())
+
+
+def product_terms(product: dict, content: dict, page: dict) -> Dict[str, int]:
+    #term -> weight, the highest of the fields it is found in
+    weights = {}
+
+    def add(text, weight):
+        for term in TERM_PATTERN.findall(str(text).lower()):
+            if term not in STOPWORDS and weights.get(term, 0) < weight:
+                weights[term] = weight
+
+    add(product.get("name") or "", 3)
+    add(product.get("brand") or "", 3)
+    for feature in content.get("features", [])[:TERM_ITEMS]:
+        add(feature, 2)
+    for key, value in list(content.get("specifications", {}).items())[:TERM_ITEMS]:
+        add(key, 2)
+        add(value, 2)
+    add(page.get("title") or "", 1)
+    add(page.get("meta_description") or "", 1)
+    return weights
+
+
+def term_sets(items: Iterable[str]) -> List[frozenset]:
+    return [frozenset(TERM_PATTERN.findall(str(item).lower())) for item in items]
+
+
+def rank_sentences(sentences: List[str], weights: Dict[str, int], listed: List[frozenset] = ()) -> List[int]:
+    #sentence indexes, most relevant first, page order among equals. Sentences that only repeat a
+    #listed feature or specification are left out, the excerpt lists those itself
+    scores = {}
+    for i, sentence in enumerate(sentences):
+        words = sentence.lower().translate(WORD_SEPARATORS).split()
+        terms = weights.keys() & words
+        if terms and all(len(word) < 3 or word in weights or word in STOPWORDS for word in words) and any(
+                terms <= item for item in listed):
+            continue
+        scores[i] = sum(weights[term] for term in terms) / math.sqrt(max(1, len(words)))
+    return sorted(scores, key=lambda i: -scores[i])
+
+
 class LLMContextBuilder:
-    def __init__(self, crawl_data=Dict, score_data=dict):
+    def __init__(self, crawl_data=Dict, score_data=dict, budget: int = None, tokenizer: str = None):
+        #budget: tokens of the content excerpt, tokenizer: name in TOKENIZERS
+        self.budget = budget or CONTEXT_TOKEN_BUDGET
+        self.count_tokens = token_counter(tokenizer)
         self.crawl=crawl_data
         self.product = crawl_data.get("product", {})
         self.score=score_data.get("ai_visibility_score", score_data)
@@ -32,39 +173,65 @@ class LLMContextBuilder:
         }
         return sorted(sections,key=sections.get)
     #==========================================================================
-    #extract short content
+    #extract short content, within the token budget
     #==========================================================================
-    def get_excerpt(self, limit:int=1200)->str:
-        sections=[]
-        #clean text
-        clean_text = self.crawl.get("clean_text", "")
-        clean_text = re.sub(r"\s+", " ", clean_text).strip()
-        if clean_text:
-            sections.append(clean_text[:600])
-        features=self.content.get("features",[])
-        #getting features
-        if features:
-            feature_block="Key features: "+".".join(features[:6])
-            sections.append(feature_block)
-        #getting specification: Top 5
-        specs = self.content.get("specifications", {})
-        if specs:
-            spec_items = list(specs.items())[:5]
-            spec_block = "Specifications: " + ". ".join(
-                [f"{k}: {v}" for k, v in spec_items]
-                )
-            sections.append(spec_block)
-        #combine all sections
-        combined=" ".join(sections)
-        #safe trimming
-        if len(combined) > limit:
-            truncated = combined[:limit]
-            last_period = truncated.rfind(".")
-            if last_period != -1:
-                combined = truncated[: last_period + 1]
-            else:
-                combined = truncated
+    def get_excerpt(self, budget: int = None) -> str:
+        budget = budget or self.budget
+        #clean text is whitespace-normalised by the crawler already
+        sentences = [s for s in SENTENCE_END.split(self.crawl.get("clean_text") or "") if s]
+        features = self.content.get("features", [])[:EXCERPT_FEATURES]
+        specs = [f"{k}: {v}" for k, v in list(self.content.get("specifications", {}).items())[:EXCERPT_SPECS]]
+        ranked = rank_sentences(sentences, product_terms(self.product, self.content, self.page),
+                                term_sets(features + specs))
+        chosen = {}
+        spent = self._take(sentences, ranked, chosen, int(budget * EXCERPT_TEXT_SHARE))
+        #getting features and specifications, as many as fit
+        blocks = []
+        for label, items in (("Key features: ", features), ("Specifications: ", specs)):
+            block, cost = self._block(label, items, budget - spent)
+            if block:
+                blocks.append(block)
+                spent += cost
+        #tokens left over go back to the page text
+        self._take(sentences, ranked, chosen, budget - spent)
+        text = " ".join(sentences[i] for i in sorted(chosen))
+        combined = " ".join(part for part in [text] + blocks if part)
+        #counting the parts apart can differ from counting the whole by a token or two
+        rank = None
+        while chosen and self.count_tokens(combined) > budget:
+            rank = rank or {i: position for position, i in enumerate(ranked)}
+            chosen.pop(max(chosen, key=rank.get))
+            text = " ".join(sentences[i] for i in sorted(chosen))
+            combined = " ".join(part for part in [text] + blocks if part)
         return combined
+
+    def _take(self, sentences: List[str], ranked: List[int], chosen: dict, budget: int) -> int:
+        #adds the best ranked sentences that fit budget to chosen (index -> tokens), returns the tokens used
+        spent = skipped = 0
+        for i in ranked:
+            if budget - spent < MIN_SENTENCE_TOKENS or skipped >= MAX_SKIPPED_SENTENCES:
+                break
+            if i in chosen:
+                continue
+            cost = self.count_tokens(sentences[i])
+            if cost <= budget - spent:
+                chosen[i] = cost
+                spent += cost
+                skipped = 0
+            else:
+                skipped += 1
+        return spent
+
+    def _block(self, label: str, items: List[str], budget: int) -> Tuple[str, int]:
+        #label and the first items that fit budget
+        block, cost = "", 0
+        for n in range(1, len(items) + 1):
+            candidate = label + ". ".join(str(item).rstrip(".") for item in items[:n]) + "."
+            candidate_cost = self.count_tokens(candidate)
+            if candidate_cost > budget:
+                break
+            block, cost = candidate, candidate_cost
+        return block, cost
     #==================================================================
     # For Building LLM Context
     #==================================================================
@@ -118,4 +285,99 @@ class LLMContextBuilder:
             "content_excerpt": self.get_excerpt()
         }
 
-        return context
\ No newline at end of file
+        return context
+
+
+#==========================================================================
+# Memoized contexts. A context is keyed by the crawl content it is built
+# from (the scoring inputs, page text and page identity), the scoring
+# rules version, the budget and the tokenizer, in memory in front of
+# SQLite like the score cache. A hit needs no scoring at all
+#==========================================================================
+CONTEXT_CACHE_MEMORY_SIZE = 1024
+#crawls loaded at a time by bulk()
+CONTEXT_BULK_BATCH = 100
+CONTEXT_PAGE_FIELDS = ("url", "title", "meta_description")
+
+
+def context_hash(crawl_data: dict) -> str:
+    inputs = {name: crawl_data.get(name) for name in SCORING_INPUTS + ("clean_text",)}
+    page = crawl_data.get("page_info", {})
+    inputs["page_info"] = {name: page.get(name) for name in CONTEXT_PAGE_FIELDS}
+    encoded = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ContextCache:
+    def __init__(self, path: str, scores: ScoreCache, memory_size: int = CONTEXT_CACHE_MEMORY_SIZE):
+        self.scores = scores
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS contexts (
+                content_hash TEXT NOT NULL,
+                rules_version TEXT NOT NULL,
+                tokenizer TEXT NOT NULL,
+                budget INTEGER NOT NULL,
+                context TEXT NOT NULL,
+                PRIMARY KEY (content_hash, rules_version, tokenizer, budget)
+            )""")
+        #contexts of older rules can never be hit again
+        self.db.execute("DELETE FROM contexts WHERE rules_version != ?", (self.scores.rules_version(),))
+        self.db.commit()
+
+    def context(self, crawl_data: dict, budget: int = None, tokenizer: str = None) -> dict:
+        key = (context_hash(crawl_data), self.scores.rules_version(), tokenizer or CONTEXT_TOKENIZER,
+               budget or CONTEXT_TOKEN_BUDGET)
+        with self.lock:
+            context = self.memory.get(key)
+            if context is None:
+                row = self.db.execute("SELECT context FROM contexts WHERE content_hash = ? AND rules_version = ?"
+                                      " AND tokenizer = ? AND budget = ?", key).fetchone()
+                context = loads(row[0]) if row else None
+            if context is not None:
+                self._remember(key, context)
+        count_cache("context", context is not None)
+        if context is not None:
+            return context
+        score = self.scores.score(crawl_data)
+        with timed("context"):
+            context = LLMContextBuilder(crawl_data, score, key[3], key[2]).build_context()
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO contexts VALUES (?, ?, ?, ?, ?)", (*key, dumps(context)))
+            self.db.commit()
+            self._remember(key, context)
+        return context
+
+    def bulk(self, store, crawl_ids: Iterable[int] = None, after_id: int = 0, limit: int = None,
+             budget: int = None, tokenizer: str = None,
+             batch: int = CONTEXT_BULK_BATCH) -> Iterator[Tuple[int, Optional[dict]]]:
+        #(crawl id, context) of the given crawls, or of every stored crawl after after_id in id order.
+        #Crawls are loaded batch at a time, so memory does not grow with the number of crawls.
+        #A crawl id that is not stored gives None
+        done = 0
+        if crawl_ids is not None:
+            for crawl_id in crawl_ids:
+                if limit is not None and done >= limit:
+                    return
+                crawl_data = store.get(crawl_id, CONTEXT_FIELDS)
+                done += 1
+                yield crawl_id, self.context(crawl_data, budget, tokenizer) if crawl_data else None
+            return
+        while limit is None or done < limit:
+            crawls = store.crawls_after(after_id, batch if limit is None else min(batch, limit - done),
+                                        CONTEXT_FIELDS)
+            if not crawls:
+                return
+            for crawl_data in crawls:
+                after_id = crawl_data["crawl_id"]
+                done += 1
+                yield after_id, self.context(crawl_data, budget, tokenizer)
+
+    def _remember(self, key: tuple, context: dict):
+        self.memory[key] = context
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
@@ -1,109 +1,622 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from crawler import ProductCrawler
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from batch import BatchCrawler, MAX_CONCURRENCY, MAX_CONCURRENCY_LIMIT, PER_HOST_CONCURRENCY, create_http_client
+from crawl_store import CONTEXT_FIELDS, CrawlStore, LARGE_FIELDS, SCORING_FIELDS
+from score_cache import ScoreCache
+from score_history import ScoreHistory
+from scoring import get_rules
+from metrics import ERRORS, render_metrics
+from politeness import RobotsDisallowed
+from site_crawl import SITE_MAX_DEPTH, SITE_MAX_PAGES, SiteCrawler, SiteFrontier, normalize_url
+from job_queue import JOB_KINDS, JobQueue, JobWorkers, QueueFull
+from near_duplicates import DUPLICATE_POLICIES, NearDuplicateIndex
+from anyio import from_thread
+from contextlib import asynccontextmanager
+import asyncio
 import json
 import os
-from datetime import datetime
-from urllib.parse import urlparse
-from scoring import AIScoringEngine
-from llm_context import LLMContextBuilder
+from llm_context import ContextCache
+from serialization import dumps_bytes, ndjson_line, parse_fields, project, top_level
+
+class FastJSONResponse(JSONResponse):
+    #compact orjson rendering. Endpoints with large payloads return it themselves, which also skips
+    #FastAPI's jsonable_encoder pass over the whole result
+    def render(self, content) -> bytes:
+        return dumps_bytes(content)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    #startup: the stores first, the extraction pool, job workers and site crawls use them
+    open_stores()
+    await start_extraction_pool()
+    await start_job_workers()
+    await resume_site_crawls()
+    try:
+        yield
+    finally:
+        await stop_background_work()
 
 #app title
-app = FastAPI(title="Product Crawler Webpage")
+app = FastAPI(title="Product Crawler Webpage", default_response_class=FastJSONResponse, lifespan=lifespan)
+
+#all, crawl or scoring. Stored crawls, jobs and metrics are served in every role, crawl and scoring
+#endpoints and jobs only in their own. The crawler, html cache and extraction pool are imported in
+#the crawl role only and httpx on first use, so a scoring process never loads lxml, httpx,
+#multiprocessing, extruct, readability or requests
+SERVICE_ROLE = os.environ.get("SERVICE_ROLE", "all")
+if SERVICE_ROLE not in ("all", "crawl", "scoring"):
+    raise ValueError(f"SERVICE_ROLE must be all, crawl or scoring, not {SERVICE_ROLE!r}")
+SERVES_CRAWLS = SERVICE_ROLE in ("all", "crawl")
+SERVES_SCORING = SERVICE_ROLE in ("all", "scoring")
+
+#endpoints of each role, included at the bottom
+crawl_routes = APIRouter()
+scoring_routes = APIRouter()
+
+#folder of the stores and caches, the data folder next to this file unless DATA_FOLDER names another
+DATA_FOLDER = os.environ.get("DATA_FOLDER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+#stores and caches, opened by open_stores on startup so importing the app touches no files
+html_cache = None
+crawl_store = None
+score_cache = None
+context_cache = None
+score_history = None
+site_frontier = None
+job_queue = None
+duplicate_index = None
+
+def open_stores():
+    global html_cache, crawl_store, score_cache, context_cache, score_history, site_frontier, job_queue
+    global duplicate_index
+    os.makedirs(DATA_FOLDER, exist_ok=True)
+
+    #raw html of every crawl, used for conditional re-fetch of unchanged pages
+    if SERVES_CRAWLS:
+        from html_cache import HtmlCache
+        html_cache = HtmlCache(os.path.join(DATA_FOLDER, "html_cache"))
+
+    #indexed store for crawl results, large fields are loaded only when needed
+    crawl_store = CrawlStore(os.path.join(DATA_FOLDER, "crawls.sqlite"))
+
+    #scores are computed once per crawl content and scoring rules version
+    score_cache = ScoreCache(os.path.join(DATA_FOLDER, "scores.sqlite"))
+
+    #LLM contexts per crawl content, scoring rules version and token budget
+    context_cache = ContextCache(os.path.join(DATA_FOLDER, "contexts.sqlite"), score_cache)
 
-#routing to data to data folder
-DATA_FOLDER="data"
+    #score time series and crawl diffs, read from the crawl store indexes
+    score_history = ScoreHistory(crawl_store, score_cache)
 
-#ensure data folder exists
-os.makedirs(DATA_FOLDER,exist_ok=True)
+    #frontier and checkpoint of site crawls
+    site_frontier = SiteFrontier(os.path.join(DATA_FOLDER, "sites.sqlite"))
+
+    #crawl, score and context jobs submitted through /jobs
+    job_queue = JobQueue(os.path.join(DATA_FOLDER, "jobs.sqlite"))
+
+    #SimHash of the latest crawl of every url, groups near-duplicate variants
+    duplicate_index = NearDuplicateIndex(os.path.join(DATA_FOLDER, "fingerprints.sqlite"))
 
 class CrawlRequest(BaseModel):
     
     url:str
+    #per-stage extraction timings and the page's element count in the result. The stages are always
+    #recorded in /metrics, the element count only for pages it was asked for
+    include_timings: bool = False
+    #comma separated fields of the result to return, dotted for nested ones ("product,page_info.url")
+    fields: Optional[str] = None
+
+class BatchCrawlRequest(BaseModel):
+    urls: List[str]
+    max_concurrency: int = Field(MAX_CONCURRENCY, ge=1, le=MAX_CONCURRENCY_LIMIT)
+    per_host_concurrency: int = Field(PER_HOST_CONCURRENCY, ge=1, le=MAX_CONCURRENCY_LIMIT)
+    include_timings: bool = False
+    #keep: store every page, skip: drop near-duplicates of stored pages, collapse: drop them but list them as variants
+    duplicates: str = "keep"
+    #projected result fields returned with every page, none by default
+    fields: Optional[str] = None
+    #NDJSON, one line per page as it completes and a last line with the totals
+    stream: bool = False
+
+class SiteCrawlRequest(BaseModel):
+    #seed url, sitemap.xml (or sitemap index) url, or both
+    url: Optional[str] = None
+    sitemap: Optional[str] = None
+    max_depth: int = SITE_MAX_DEPTH
+    max_pages: int = SITE_MAX_PAGES
+    max_concurrency: int = Field(MAX_CONCURRENCY, ge=1, le=MAX_CONCURRENCY_LIMIT)
+    per_host_concurrency: int = Field(PER_HOST_CONCURRENCY, ge=1, le=MAX_CONCURRENCY_LIMIT)
+    duplicates: str = "keep"
 
 class ScoreRequest(BaseModel):
-    filename: str
+    #one of: stored crawl id, url (latest crawl) or a legacy json filename
+    crawl_id: Optional[int] = None
+    url: Optional[str] = None
+    filename: Optional[str] = None
+    #comma separated fields of the score or context to return
+    fields: Optional[str] = None
+    #tokens of the context excerpt, CONTEXT_TOKEN_BUDGET by default
+    token_budget: Optional[int] = None
 
-    
-def generate_filename(url:str):
-    
-        parsed=urlparse(url)
-        
-        domain=parsed.netloc.replace(".","-")
-        
-        path=parsed.path.strip("/").replace("/","-")
-        
-        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-        
-        filename = f"{domain}-{path}-{timestamp}.json"
-        
-        return os.path.join(DATA_FOLDER, filename)
+class ContextBatchRequest(BaseModel):
+    #stored crawl ids, or every stored crawl after the crawl id `after` in id order
+    crawl_ids: Optional[List[int]] = None
+    after: int = 0
+    limit: Optional[int] = None
+    token_budget: Optional[int] = None
+    fields: Optional[str] = None
+
+class JobRequest(BaseModel):
+    #crawl jobs take url, score and context jobs the fields of ScoreRequest
+    kind: str
+    url: Optional[str] = None
+    crawl_id: Optional[int] = None
+    filename: Optional[str] = None
+    #higher runs first
+    priority: int = 0
+    #the finished job is POSTed here
+    callback_url: Optional[str] = None
+
+#shared pooled client for batch crawls, created on first use
+http_client = None
+
+def get_http_client():
+    global http_client
+    if http_client is None:
+        #pooled for the highest concurrency a request may ask for
+        http_client = create_http_client(MAX_CONCURRENCY_LIMIT)
+    return http_client
+
+#process pool for extraction, the API process then only does I/O
+extraction_pool = None
+
+#site crawls running in this process, by site id
+site_tasks = {}
+
+def start_site_crawl(site_id: int, max_concurrency: int = MAX_CONCURRENCY,
+                     per_host_concurrency: int = PER_HOST_CONCURRENCY):
+    batch = BatchCrawler(get_http_client(), max_concurrency, per_host_concurrency, pool=extraction_pool)
+    task = asyncio.create_task(SiteCrawler(batch, site_frontier, crawl_store, site_id, duplicate_index).run())
+    site_tasks[site_id] = task
+    task.add_done_callback(lambda _: site_tasks.pop(site_id, None))
+
+async def start_extraction_pool():
+    global extraction_pool
+    if not SERVES_CRAWLS:
+        return
+    from extraction_pool import EXTRACTION_WORKERS, ExtractionPool
+    if EXTRACTION_WORKERS > 0:
+        extraction_pool = ExtractionPool(EXTRACTION_WORKERS)
+        await extraction_pool.start()
+
+#background workers of the job queue
+job_workers = None
+
+async def start_job_workers():
+    global job_workers
+    #jobs of the other role stay queued for a process that serves it
+    handlers = {}
+    if SERVES_CRAWLS:
+        handlers["crawl"] = crawl_job
+    if SERVES_SCORING:
+        handlers["score"] = lambda payload: asyncio.to_thread(score_product, ScoreRequest(**payload))
+        handlers["context"] = lambda payload: asyncio.to_thread(geo_context, ScoreRequest(**payload))
+    #a scoring process opens a client for callbacks when the first one is sent
+    job_workers = JobWorkers(job_queue, handlers, client=get_http_client() if SERVES_CRAWLS else None)
+    job_workers.start()
+
+async def resume_site_crawls():
+    #site crawls interrupted by a restart continue from their checkpoint
+    if not SERVES_CRAWLS:
+        return
+    for site_id in site_frontier.sites_with_status("pending", "running"):
+        start_site_crawl(site_id)
+
+async def stop_background_work():
+    #shutdown: job workers and site crawls stop, then the http client and the extraction pool close
+    global http_client
+    if job_workers is not None:
+        await job_workers.stop()
+    for task in list(site_tasks.values()):
+        task.cancel()
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+    if extraction_pool is not None:
+        extraction_pool.shutdown()
+
+
+def load_crawl(request: ScoreRequest, fields=SCORING_FIELDS):
+    if request.crawl_id is not None:
+        crawl_data = crawl_store.get(request.crawl_id, fields)
+    elif request.url:
+        crawl_data = crawl_store.latest(request.url, fields)
+    elif request.filename:
+        crawl_data = crawl_store.find_by_file(request.filename, fields)
+        file_path = os.path.join(DATA_FOLDER, request.filename)
+        #files written before the crawl store and not imported yet
+        if crawl_data is None and os.path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                crawl_data = json.load(f)
+    else:
+        raise HTTPException(status_code=400, detail="Provide crawl_id, url or filename")
+    if crawl_data is None:
+        raise HTTPException(status_code=404, detail="Crawl not found")
+    return crawl_data
+
+
+def check_duplicates_policy(policy: str):
+    if policy not in DUPLICATE_POLICIES:
+        raise HTTPException(status_code=400, detail=f"duplicates must be one of {', '.join(DUPLICATE_POLICIES)}")
+
+
+def check_token_budget(budget: Optional[int]):
+    if budget is not None and budget <= 0:
+        raise HTTPException(status_code=400, detail="token_budget must be positive")
+
+
+def near_duplicate(match) -> dict:
+    return {"url": match.url, "crawl_id": match.crawl_id, "distance": match.distance}
+
+
+#how often a site crawl stream looks for newly finished pages, and how many it reads at once
+SITE_STREAM_POLL = 0.5
+SITE_STREAM_BATCH = 500
+NDJSON = "application/x-ndjson"
 #=============================================================
 # Crawler page
 #=============================================================
-@app.post("/crawl_product")
-def crawl_product_page(request: CrawlRequest):
+@crawl_routes.post("/crawl_product")
+async def crawl_product_page(request: CrawlRequest):
+    #fetched on the event loop like a batch, waits for the host (robots.txt, pacing, Retry-After) hold no worker thread
+    batch = BatchCrawler(get_http_client(), pool=extraction_pool, cache=html_cache,
+                         include_timings=request.include_timings)
     try:
-        crawler = ProductCrawler(request.url)
-        result = crawler.build()
-        
-        if "error" in result:                          
-            raise HTTPException(status_code=400, detail=result["error"])
-        
-        file_path = generate_filename(request.url)
-        
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-        
-        return {                                        
-            "message": "Crawl successful",
-            "saved_to": file_path,
-            "data": result
-        }
-    except HTTPException:
-        raise
+        result = await batch.crawl_page(request.url)
+    except RobotsDisallowed as e:
+        raise HTTPException(status_code=403, detail=str(e))
     except Exception as e:
+        ERRORS.inc("crawl")
         raise HTTPException(status_code=500, detail=str(e))
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    crawl_id, match = await asyncio.to_thread(duplicate_index.record, crawl_store, result)
+    response = {
+        "message": "Crawl successful",
+        "crawl_id": crawl_id,
+        "data": project(result, parse_fields(request.fields))
+    }
+    if match is not None:
+        response["near_duplicate"] = near_duplicate(match)
+    return FastJSONResponse(response)
+#=============================================================
+# Batch crawl
+#=============================================================
+async def batch_entries(request: BatchCrawlRequest):
+    #one entry per page, as each page completes
+    batch = BatchCrawler(get_http_client(), request.max_concurrency, request.per_host_concurrency,
+                         pool=extraction_pool, cache=html_cache, include_timings=request.include_timings)
+    paths = parse_fields(request.fields)
+    #each page is saved as soon as it completes
+    async for url, result in batch.crawl_all(request.urls):
+        if "error" in result:
+            yield {"url": url, "error": result["error"]}
+            continue
+        crawl_id, match = await asyncio.to_thread(duplicate_index.record, crawl_store, result, request.duplicates)
+        if crawl_id is None:
+            yield {"url": url, "duplicate_of": near_duplicate(match)}
+            continue
+        entry = {"url": url, "crawl_id": crawl_id}
+        if match is not None:
+            entry["near_duplicate"] = near_duplicate(match)
+        if "timings" in result:
+            entry["timings"] = result["timings"]
+        if paths is not None:
+            entry["data"] = project(result, paths)
+        yield entry
+
+def batch_outcome(entry: dict) -> str:
+    return "failed" if "error" in entry else "duplicates" if "duplicate_of" in entry else "crawled"
+
+async def stream_batch(entries):
+    counts = {"crawled": 0, "duplicates": 0, "failed": 0}
+    async for entry in entries:
+        counts[batch_outcome(entry)] += 1
+        yield ndjson_line(entry)
+    yield ndjson_line({"message": "Batch crawl finished", **counts})
+
+@crawl_routes.post("/crawl_batch")
+async def crawl_batch(request: BatchCrawlRequest):
+    check_duplicates_policy(request.duplicates)
+    if request.stream:
+        return StreamingResponse(stream_batch(batch_entries(request)), media_type=NDJSON)
+    results = [entry async for entry in batch_entries(request)]
+    outcomes = [batch_outcome(entry) for entry in results]
+    return FastJSONResponse({
+        "message": "Batch crawl finished",
+        "crawled": outcomes.count("crawled"),
+        "duplicates": outcomes.count("duplicates"),
+        "failed": outcomes.count("failed"),
+        "results": results
+    })
+#=============================================================
+# Site crawl
+#=============================================================
+@crawl_routes.post("/crawl_site")
+async def crawl_site(request: SiteCrawlRequest):
+    if not (request.url or request.sitemap):
+        raise HTTPException(status_code=400, detail="Provide url or sitemap")
+    check_duplicates_policy(request.duplicates)
+    site_id = site_frontier.create(request.url, request.sitemap, request.max_depth, request.max_pages,
+                                   request.duplicates)
+    start_site_crawl(site_id, request.max_concurrency, request.per_host_concurrency)
+    return {
+        "message": "Site crawl started",
+        "site_id": site_id
+    }
+
+@crawl_routes.get("/crawl_site/{site_id}")
+def site_crawl_status(site_id: int):
+    site = site_frontier.site(site_id)
+    if site is None:
+        raise HTTPException(status_code=404, detail="Site crawl not found")
+    return site
+
+@crawl_routes.get("/crawl_site/{site_id}/pages")
+def site_crawl_pages(site_id: int, state: Optional[str] = None, page_type: Optional[str] = None,
+                     limit: int = 100, offset: int = 0):
+    return {
+        "pages": site_frontier.pages(site_id, state, page_type, limit, offset)
+    }
+
+async def site_lines(site_id: int, paths, after: int):
+    #finished pages in the order they finished, until the crawl stops. With paths, product pages carry
+    #their projected stored crawl
+    fields = top_level(paths, LARGE_FIELDS)
+    while True:
+        #read before the pages, so no page finishing in between is missed
+        stopped = site_frontier.site(site_id)["status"] not in ("pending", "running")
+        pages = await asyncio.to_thread(site_frontier.finished_pages, site_id, after, SITE_STREAM_BATCH)
+        for page in pages:
+            if paths is not None and page["crawl_id"] is not None:
+                crawl_data = await asyncio.to_thread(crawl_store.get, page["crawl_id"], fields)
+                page["data"] = project(crawl_data, paths) if crawl_data else None
+            after = page["seq"]
+            yield ndjson_line(page)
+        if not pages:
+            if stopped:
+                break
+            await asyncio.sleep(SITE_STREAM_POLL)
+    yield ndjson_line({"message": "Site crawl stopped", "site": site_frontier.site(site_id)})
+
+@crawl_routes.get("/crawl_site/{site_id}/stream")
+def stream_site_crawl(site_id: int, fields: Optional[str] = None, after: int = 0):
+    #NDJSON of pages as they finish. after: the seq of the last page received, to continue a dropped stream
+    if site_frontier.site(site_id) is None:
+        raise HTTPException(status_code=404, detail="Site crawl not found")
+    return StreamingResponse(site_lines(site_id, parse_fields(fields), after), media_type=NDJSON)
+
+@crawl_routes.post("/crawl_site/{site_id}/resume")
+async def resume_site_crawl(site_id: int, max_pages: Optional[int] = None):
+    #max_pages raises the page budget of a crawl that reached it
+    site = site_frontier.site(site_id)
+    if site is None:
+        raise HTTPException(status_code=404, detail="Site crawl not found")
+    if max_pages is not None:
+        site_frontier.update_site(site_id, max_pages=max_pages)
+    if site_id not in site_tasks:
+        start_site_crawl(site_id)
+    return {
+        "message": "Site crawl running",
+        "site_id": site_id
+    }
+#=============================================================
+# Stored crawls
+#=============================================================
+@app.get("/crawls")
+def list_crawls(url: Optional[str] = None, domain: Optional[str] = None, since: Optional[str] = None,
+                until: Optional[str] = None, min_score: Optional[float] = None,
+                max_score: Optional[float] = None, limit: int = 100):
+    return {
+        "crawls": crawl_store.list_crawls(url, domain, since, until, min_score, max_score, limit)
+    }
+
+def stored_fields(include_text: bool, paths) -> tuple:
+    #large fields to load: the ones a projection asks for, or the default set
+    if paths is not None:
+        return tuple(top_level(paths, LARGE_FIELDS))
+    return ("schema_data", "links", "clean_text") if include_text else ("schema_data", "links")
+
+@app.get("/crawls/latest")
+def latest_crawl(url: str, include_text: bool = False, fields: Optional[str] = None):
+    paths = parse_fields(fields)
+    crawl_data = crawl_store.latest(url, stored_fields(include_text, paths))
+    if crawl_data is None:
+        raise HTTPException(status_code=404, detail="Crawl not found")
+    return FastJSONResponse(project(crawl_data, paths))
+
+@app.get("/crawls/{crawl_id}")
+def get_crawl(crawl_id: int, include_text: bool = False, fields: Optional[str] = None):
+    paths = parse_fields(fields)
+    crawl_data = crawl_store.get(crawl_id, stored_fields(include_text, paths))
+    if crawl_data is None:
+        raise HTTPException(status_code=404, detail="Crawl not found")
+    return FastJSONResponse(project(crawl_data, paths))
+
+@app.get("/crawls/{crawl_id}/variants")
+def crawl_variants(crawl_id: int):
+    #near-duplicate pages grouped with the crawl's url
+    crawl_data = crawl_store.get(crawl_id, ())
+    if crawl_data is None:
+        raise HTTPException(status_code=404, detail="Crawl not found")
+    return {
+        "variants": duplicate_index.group_of(crawl_data["page_info"]["url"])
+    }
+
+@app.get("/duplicates")
+def duplicate_groups(domain: Optional[str] = None, min_size: int = 2, limit: int = 100):
+    #variant groups, largest first
+    return {
+        "groups": duplicate_index.groups(domain, min_size, limit)
+    }
 #=============================================================
 # scoring result
 #=============================================================
-@app.post("/score_product")
+@scoring_routes.post("/score_product")
 def score_product(request: ScoreRequest):
 
-    file_path = os.path.join(DATA_FOLDER, request.filename)
+    crawl_data = load_crawl(request)
 
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
+    score_result = score_cache.score(crawl_data)
 
-    with open(file_path, "r", encoding="utf-8") as f:
-        crawl_data = json.load(f)
-
-    scorer = AIScoringEngine(crawl_data)
-    score_result = scorer.compute_score()
+    if "crawl_id" in crawl_data:
+        crawl_store.set_score(crawl_data["crawl_id"], score_result, score_cache.rules_version())
 
     return {
-        "ai_visibility_score": score_result
+        "ai_visibility_score": project(score_result, parse_fields(request.fields))
+    }
+@scoring_routes.get("/scoring_rules")
+def scoring_rules():
+    #the rules version scores are currently computed with
+    rules = get_rules()
+    return {
+        "version": rules.version,
+        "fingerprint": rules.fingerprint,
+        "max_possible": rules.max_possible
+    }
+#=============================================================
+# Score history
+#=============================================================
+@scoring_routes.get("/history")
+def score_series(url: Optional[str] = None, domain: Optional[str] = None, since: Optional[str] = None,
+                 until: Optional[str] = None, limit: int = 1000, daily: bool = False, fill: bool = True):
+    #one point per crawl (the last `limit`), or per day aggregates with daily
+    if not (url or domain):
+        raise HTTPException(status_code=400, detail="Provide url or domain")
+    if daily:
+        return {
+            "daily": score_history.daily(url, domain, since, until)
+        }
+    return {
+        "points": score_history.series(url, domain, since, until, limit, fill)
     }
+
+@scoring_routes.get("/history/diff")
+def score_diff(from_crawl: Optional[int] = None, to_crawl: Optional[int] = None, url: Optional[str] = None,
+               since: Optional[str] = None):
+    #two crawl ids, or a url and a timestamp: what changed between its crawl then and its latest one
+    if from_crawl is not None and to_crawl is not None:
+        diff = score_history.diff(from_crawl, to_crawl)
+    elif url and since:
+        diff = score_history.changes_since(url, since)
+    else:
+        raise HTTPException(status_code=400, detail="Provide from_crawl and to_crawl, or url and since")
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Crawl not found")
+    return diff
 #=============================================================
 # LLM context builder
 #=============================================================
-@app.post("/geo_context")
+@scoring_routes.post("/geo_context")
 def geo_context(request: ScoreRequest):
 
-    file_path = os.path.join(DATA_FOLDER, request.filename)
+    check_token_budget(request.token_budget)
+    crawl_data = load_crawl(request, CONTEXT_FIELDS)
 
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found")
+    llm_context = context_cache.context(crawl_data, request.token_budget)
+
+    return {
+        "llm_context": project(llm_context, parse_fields(request.fields))
+    }
 
-    with open(file_path, "r", encoding="utf-8") as f:
-        crawl_data = json.load(f)
+def context_lines(request: ContextBatchRequest):
+    paths = parse_fields(request.fields)
+    count, last = 0, request.after
+    for crawl_id, llm_context in context_cache.bulk(crawl_store, request.crawl_ids, request.after, request.limit,
+                                                    request.token_budget):
+        if llm_context is None:
+            yield ndjson_line({"crawl_id": crawl_id, "error": "Crawl not found"})
+            continue
+        count += 1
+        last = crawl_id
+        yield ndjson_line({"crawl_id": crawl_id, "llm_context": project(llm_context, paths)})
+    #last_crawl_id continues a walk of the store as the next `after`
+    yield ndjson_line({"message": "Context batch finished", "contexts": count, "last_crawl_id": last})
 
-    scorer = AIScoringEngine(crawl_data)
-    score_result = scorer.compute_score()
+@scoring_routes.post("/geo_context/batch")
+def geo_context_batch(request: ContextBatchRequest):
+    #NDJSON, one line per crawl as its context is built, crawls are read from the store a batch at a time
+    check_token_budget(request.token_budget)
+    return StreamingResponse(context_lines(request), media_type=NDJSON)
+#=============================================================
+# Metrics
+#=============================================================
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    #Prometheus text format
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+#=============================================================
+# Background jobs
+#=============================================================
+async def crawl_job(payload: dict) -> dict:
+    batch = BatchCrawler(get_http_client(), pool=extraction_pool, cache=html_cache)
+    result = await batch.crawl(payload["url"])
+    if "error" in result:
+        return {"error": result["error"], "url": payload["url"]}
+    crawl_id, match = await asyncio.to_thread(duplicate_index.record, crawl_store, result)
+    return {
+        "crawl_id": crawl_id,
+        "page_info": result["page_info"],
+        "near_duplicate": near_duplicate(match) if match else None
+    }
 
-    context_builder = LLMContextBuilder(crawl_data, score_result)
-    llm_context = context_builder.build_context()
+@app.post("/jobs")
+def submit_job(request: JobRequest):
+    if request.kind not in JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(JOB_KINDS)}")
+    if request.kind == "crawl":
+        if not request.url:
+            raise HTTPException(status_code=400, detail="Crawl jobs need a url")
+        payload = {"url": request.url}
+        #the same page queued twice is crawled once
+        try:
+            dedup_key = "crawl:" + normalize_url(request.url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid url: {e}")
+    else:
+        payload = {k: v for k, v in (("crawl_id", request.crawl_id), ("url", request.url),
+                                     ("filename", request.filename)) if v is not None}
+        if not payload:
+            raise HTTPException(status_code=400, detail="Provide crawl_id, url or filename")
+        dedup_key = request.kind + ":" + json.dumps(payload, sort_keys=True)
+    try:
+        job_id, existing = job_queue.submit(request.kind, payload, dedup_key, request.priority,
+                                            request.callback_url)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if job_workers is not None:
+        from_thread.run_sync(job_workers.notify)
+    return {
+        "message": "Job already queued" if existing else "Job queued",
+        "job_id": job_id
+    }
 
+@app.get("/jobs")
+def job_counts():
     return {
-        "llm_context": llm_context
-    }
\ No newline at end of file
+        "jobs": job_queue.counts()
+    }
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: int):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+if SERVES_CRAWLS:
+    app.include_router(crawl_routes)
+if SERVES_SCORING:
+    app.include_router(scoring_routes)
@@ -0,0 +1,160 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, Optional, Tuple
+
+#==========================================================================
+# In-process metrics in the Prometheus text format. Recording is a
+# perf_counter() pair and a bisect under a lock, cheap enough to stay on.
+# Worker processes only time their stages into the result's "timings",
+# the API process records them here.
+#==========================================================================
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PAGE_BYTES_BUCKETS = (10e3, 50e3, 100e3, 250e3, 500e3, 1e6, 2.5e6, 5e6, 10e6)
+PAGE_NODES_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: Dict[Tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        #labels -> [per-bucket counts (last one is +Inf), sum]
+        self.series: Dict[Tuple[str, ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self.series.items())
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+STAGE_SECONDS = Histogram("crawler_stage_seconds", "Time spent per crawl, scoring and storage stage.", ("stage",))
+PAGE_BYTES = Histogram("crawler_page_bytes", "Size of fetched html pages.", buckets=PAGE_BYTES_BUCKETS)
+PAGE_NODES = Histogram("crawler_page_nodes", "Element count of parsed html pages, of those crawled with include_timings.", buckets=PAGE_NODES_BUCKETS)
+ERRORS = Counter("crawler_errors_total", "Failures per stage.", ("stage",))
+CACHE_REQUESTS = Counter("crawler_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"))
+FETCH_RETRIES = Counter("crawler_fetch_retries_total", "Fetch retries by reason.", ("reason",))
+
+REGISTRY = (STAGE_SECONDS, PAGE_BYTES, PAGE_NODES, ERRORS, CACHE_REQUESTS, FETCH_RETRIES)
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+class Timings:
+    #per-page stage timings in ms, filled in wherever the page is extracted.
+    #stage errors are counted in the process they happen in
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            ERRORS.inc(name)
+            raise
+        finally:
+            self.stages[name] = round((time.perf_counter() - start) * 1000, 3)
+
+
+class NoTimings:
+    #stands in for Timings when a page's stages are not timed
+    stages = None
+
+    def stage(self, name: str):
+        return nullcontext()
+
+
+@contextmanager
+def timed(stage: str):
+    #times a stage of the API process itself straight into the histogram
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+
+
+def count_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+def record_crawl(result: dict, keep_timings: bool = False) -> dict:
+    #records a crawl result's timings, page size and node count, and drops them from it unless asked for
+    timings: Optional[dict] = result.get("timings") if keep_timings else result.pop("timings", None)
+    if result.get("error"):
+        ERRORS.inc("crawl")
+    if not timings:
+        return result
+    for name, value in timings.items():
+        if name == "page_bytes":
+            PAGE_BYTES.observe(value)
+        elif name == "page_nodes":
+            PAGE_NODES.observe(value)
+        else:
+            STAGE_SECONDS.observe(value / 1000, name)
+    return result
@@ -0,0 +1,227 @@
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+#==========================================================================
+# Near-duplicate pages (colour variants, tracking parameters, mirrors) by
+# 64-bit SimHash over word shingles of clean_text plus the product name and
+# brand. Pages within NEAR_DUPLICATE_DISTANCE differing bits are variants.
+# The index splits every fingerprint into DISTANCE + 1 bands: two
+# fingerprints that close agree exactly on at least one band, so a lookup
+# is one indexed equality query per band instead of a scan of every page
+#==========================================================================
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get("NEAR_DUPLICATE_DISTANCE", "3"))
+BANDS = NEAR_DUPLICATE_DISTANCE + 1
+BAND_BITS = 64 // BANDS
+SHINGLE_WORDS = 3
+#pages with less text than this get no fingerprint, they would all look alike
+MIN_WORDS = 20
+#product name and brand words count this many times as much as one shingle
+PRODUCT_WEIGHT = 2
+#upper bound on rows read per band, keeps a degenerate bucket from turning a lookup into a scan
+MAX_CANDIDATES = 500
+
+#what a batch or site crawl does with a page that is a near-duplicate of a stored page of another url
+DUPLICATE_POLICIES = ("keep", "skip", "collapse")
+
+WORD = re.compile(r"\w+")
+
+
+class Match(NamedTuple):
+    url: str
+    crawl_id: Optional[int]
+    group_id: int
+    distance: int
+
+
+def simhash(features: dict) -> int:
+    #features: feature string -> weight
+    #numpy is only needed where pages are extracted
+    import numpy as np
+    digests = b"".join(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest() for feature in features)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(-1, 64)
+    weights = np.fromiter(features.values(), dtype=np.float64, count=len(features))
+    votes = (bits * 2.0 - 1.0).T @ weights
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+def page_fingerprint(clean_text: str, product: dict = None) -> Optional[int]:
+    words = WORD.findall((clean_text or "").lower())
+    if len(words) < MIN_WORDS:
+        return None
+    features = {}
+    for i in range(len(words) - SHINGLE_WORDS + 1):
+        shingle = " ".join(words[i:i + SHINGLE_WORDS])
+        features[shingle] = features.get(shingle, 0) + 1
+    for field in ("name", "brand"):
+        for word in WORD.findall(str((product or {}).get(field) or "").lower()):
+            features["product:" + word] = features.get("product:" + word, 0) + PRODUCT_WEIGHT
+    return simhash(features)
+
+
+def fingerprint_hex(fingerprint: Optional[int]) -> Optional[str]:
+    return None if fingerprint is None else f"{fingerprint:016x}"
+
+
+def result_fingerprint(result: dict) -> Optional[int]:
+    #the one computed at extraction, or computed now for crawls stored before fingerprints existed
+    stored = result.get("page_info", {}).get("simhash")
+    if stored:
+        return int(stored, 16)
+    return page_fingerprint(result.get("clean_text", ""), result.get("product"))
+
+
+def distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def signed(value: int) -> int:
+    #SQLite integers are signed 64 bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def bands(fingerprint: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(fingerprint >> (BAND_BITS * i)) & mask for i in range(BANDS)]
+
+
+class NearDuplicateIndex:
+    #latest fingerprint of every url, grouped into variant groups
+    def __init__(self, path: str, max_distance: int = NEAR_DUPLICATE_DISTANCE):
+        self.max_distance = min(max_distance, NEAR_DUPLICATE_DISTANCE)
+        self.lock = threading.Lock()
+        #held across lookup, save and insert so two variants crawled at once are not both kept
+        self.record_lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        band_columns = "".join(f"band{i} INTEGER NOT NULL,\n" for i in range(BANDS))
+        band_indexes = "".join(f"CREATE INDEX IF NOT EXISTS fingerprints_band{i} ON fingerprints (band{i});\n"
+                               for i in range(BANDS))
+        self.db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL UNIQUE,
+                domain TEXT NOT NULL,
+                crawl_id INTEGER,
+                fingerprint INTEGER NOT NULL,
+                group_id INTEGER,
+                {band_columns}
+                updated_at REAL NOT NULL
+            );
+            {band_indexes}
+            CREATE INDEX IF NOT EXISTS fingerprints_group ON fingerprints (group_id);
+            CREATE INDEX IF NOT EXISTS fingerprints_domain ON fingerprints (domain, group_id);
+        """)
+        self.db.commit()
+
+    def find(self, fingerprint: int, exclude_url: str = None, limit: int = 10) -> List[Match]:
+        #stored pages of other urls within max_distance, closest first
+        queries = " UNION ".join(
+            f"SELECT * FROM (SELECT url, crawl_id, group_id, fingerprint FROM fingerprints WHERE band{i} = ?"
+            f" LIMIT {MAX_CANDIDATES})" for i in range(BANDS))
+        with self.lock:
+            rows = self.db.execute(queries, bands(fingerprint)).fetchall()
+        matches = []
+        for url, crawl_id, group_id, other in rows:
+            gap = distance(fingerprint, other & ((1 << 64) - 1))
+            if gap <= self.max_distance and url != exclude_url:
+                matches.append(Match(url, crawl_id, group_id, gap))
+        #stored crawls before collapsed variants that only point at them
+        matches.sort(key=lambda match: (match.distance, match.crawl_id is None, match.url))
+        return matches[:limit]
+
+    def add(self, url: str, fingerprint: int, crawl_id: int = None, group_id: int = None) -> int:
+        #a url is in the index once, with its latest fingerprint. Returns its group, a new one when group_id is None
+        values = (urlparse(url).netloc, crawl_id, signed(fingerprint), *bands(fingerprint), time.time())
+        band_names = ", ".join(f"band{i}" for i in range(BANDS))
+        with self.lock:
+            row = self.db.execute("SELECT id FROM fingerprints WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                row_id = self.db.execute(
+                    f"INSERT INTO fingerprints (url, domain, crawl_id, fingerprint, {band_names}, updated_at)"
+                    f" VALUES (?, ?, ?, ?, {', '.join('?' * BANDS)}, ?)", (url, *values)).lastrowid
+            else:
+                row_id = row[0]
+                columns = ", ".join(f"{name} = ?" for name in ("domain", "crawl_id", "fingerprint",
+                                                                 *band_names.split(", "), "updated_at"))
+                self.db.execute(f"UPDATE fingerprints SET {columns} WHERE id = ?", (*values, row_id))
+            group_id = group_id or row_id
+            self.db.execute("UPDATE fingerprints SET group_id = ? WHERE id = ?", (group_id, row_id))
+            self.db.commit()
+        return group_id
+
+    def group_of(self, url: str) -> List[dict]:
+        #every variant in the group of a url
+        with self.lock:
+            row = self.db.execute("SELECT group_id FROM fingerprints WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return []
+            rows = self.db.execute("SELECT url, crawl_id, fingerprint FROM fingerprints WHERE group_id = ?"
+                                   " ORDER BY id", (row[0],)).fetchall()
+        return [{"url": url, "crawl_id": member, "simhash": fingerprint_hex(fingerprint & ((1 << 64) - 1))}
+                for url, member, fingerprint in rows]
+
+    def groups(self, domain: str = None, min_size: int = 2, limit: int = 100) -> List[dict]:
+        #variant groups with at least min_size urls, largest first
+        where, params = ("WHERE domain = ?", [domain]) if domain else ("", [])
+        with self.lock:
+            groups = self.db.execute(
+                f"SELECT group_id, COUNT(*) AS size FROM fingerprints {where} GROUP BY group_id"
+                " HAVING size >= ? ORDER BY size DESC, group_id LIMIT ?", (*params, min_size, limit)).fetchall()
+            members = {}
+            for group_id, _ in groups:
+                members[group_id] = [{"url": url, "crawl_id": crawl_id} for url, crawl_id in self.db.execute(
+                    "SELECT url, crawl_id FROM fingerprints WHERE group_id = ? ORDER BY id", (group_id,))]
+        return [{"group_id": group_id, "size": size, "variants": members[group_id]} for group_id, size in groups]
+
+    def record(self, store, result: dict, policy: str = "keep") -> Tuple[Optional[int], Optional[Match]]:
+        #saves result in the crawl store unless the policy drops it as a near-duplicate of another url.
+        #returns (crawl id or None when dropped, closest match)
+        url = result.get("page_info", {}).get("url", "")
+        fingerprint = result_fingerprint(result)
+        if fingerprint is None:
+            return store.save(result), None
+        with self.record_lock:
+            matches = self.find(fingerprint, exclude_url=url, limit=1)
+            match = matches[0] if matches else None
+            if match is not None and policy == "skip":
+                return None, match
+            crawl_id = None if match is not None and policy == "collapse" else store.save(result)
+            self.add(url, fingerprint, crawl_id, match.group_id if match else None)
+        return crawl_id, match
+
+    def backfill(self, store, batch: int = 500) -> int:
+        #indexes the latest crawl of every url in a crawl store that is not in the index yet, newest first
+        indexed = 0
+        before = None
+        while True:
+            rows = store.crawl_urls(before, batch)
+            if not rows:
+                return indexed
+            for crawl_id, url in rows:
+                if self.contains(url):
+                    continue
+                fingerprint = result_fingerprint(store.get(crawl_id, ("clean_text",)))
+                if fingerprint is not None:
+                    matches = self.find(fingerprint, exclude_url=url, limit=1)
+                    self.add(url, fingerprint, crawl_id, matches[0].group_id if matches else None)
+                    indexed += 1
+            before = rows[-1][0]
+
+    def contains(self, url: str) -> bool:
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM fingerprints WHERE url = ?", (url,)).fetchone() is not None
+
+
+if __name__ == "__main__":
+    #python near_duplicates.py <data folder> fingerprints crawls stored before the index existed
+    from crawl_store import CrawlStore
+    folder = sys.argv[1] if len(sys.argv) > 1 else "data"
+    index = NearDuplicateIndex(os.path.join(folder, "fingerprints.sqlite"))
+    print(f"indexed {index.backfill(CrawlStore(os.path.join(folder, 'crawls.sqlite')))} crawls")
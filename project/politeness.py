@@ -0,0 +1,287 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from metrics import FETCH_RETRIES
+
+#==========================================================================
+# Per-host politeness shared by every fetch in the process: a token bucket
+# per host (capped by robots.txt crawl-delay), cached robots.txt rules,
+# Retry-After aware backoff on throttling and jittered retries of
+# transient failures. The host's rate halves on every throttled response
+# and climbs back step by step while responses succeed.
+#==========================================================================
+HOST_RATE = float(os.environ.get("HOST_RATE", "4"))
+HOST_BURST = int(os.environ.get("HOST_BURST", "4"))
+#the adaptive rate never goes below this
+MIN_HOST_RATE = 0.1
+MAX_RETRIES = int(os.environ.get("FETCH_RETRIES", "3"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+#a server asking for a longer pause than this gets its throttled response back instead of a retry
+MAX_RETRY_AFTER = 120.0
+ROBOTS_TTL = 24 * 3600
+#one caller fetches a host's robots.txt, the others poll until it is in (or the claim runs out)
+ROBOTS_CLAIM = 30.0
+ROBOTS_POLL = 0.05
+RESPECT_ROBOTS = os.environ.get("RESPECT_ROBOTS", "1") != "0"
+
+THROTTLE_STATUS = frozenset([429, 503])
+TRANSIENT_STATUS = frozenset([429, 500, 502, 503, 504])
+
+
+class RobotsDisallowed(Exception):
+    pass
+
+
+def host_of(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    #Retry-After is either delta seconds or an HTTP date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    #full jitter: uniform between 0 and the exponential cap
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class HostState:
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        #no request starts before this (Retry-After, backoff)
+        self.blocked_until = 0.0
+        self.robots: Optional[RobotFileParser] = None
+        self.robots_expires = 0.0
+        self.robots_claimed_until = 0.0
+
+    def take(self) -> float:
+        #0 when a token was taken, otherwise how long until one can be. Waiters check again after
+        #sleeping, so a rate that recovers meanwhile is used at once
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def set_crawl_delay(self, delay: Optional[float]):
+        if delay:
+            self.max_rate = min(self.max_rate, 1 / float(delay))
+            self.rate = min(self.rate, self.max_rate)
+            self.burst = 1
+            self.tokens = min(self.tokens, 1.0)
+
+    def throttled(self, pause: float):
+        self.rate = max(MIN_HOST_RATE, self.rate / 2)
+        #no burst right after the pause
+        self.tokens = min(self.tokens, 0.0)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+
+    def succeeded(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class PolitenessScheduler:
+    def __init__(self, user_agent: str, rate: float = HOST_RATE, burst: int = HOST_BURST,
+                 max_retries: int = MAX_RETRIES, respect_robots: bool = RESPECT_ROBOTS,
+                 robots_ttl: float = ROBOTS_TTL):
+        self.user_agent = user_agent
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.respect_robots = respect_robots
+        self.robots_ttl = robots_ttl
+        self.hosts: Dict[str, HostState] = {}
+        #guards every HostState, held only for bookkeeping, never while waiting
+        self.lock = threading.Lock()
+
+    def host(self, url: str) -> HostState:
+        key = host_of(url)
+        with self.lock:
+            state = self.hosts.get(key)
+            if state is None:
+                state = self.hosts[key] = HostState(self.rate, self.burst)
+            return state
+
+    def take(self, url: str) -> float:
+        state = self.host(url)
+        with self.lock:
+            return state.take()
+
+    async def wait_turn_async(self, url: str):
+        wait = self.take(url)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self.take(url)
+
+    def wait_turn(self, url: str):
+        wait = self.take(url)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.take(url)
+
+    # ------------------------------------------------------------------
+    #  robots.txt
+    # ------------------------------------------------------------------
+    def robots_claim(self, url: str) -> Optional[bool]:
+        #True: the caller fetches robots.txt now, False: another caller is fetching it, None: rules are usable
+        if not self.respect_robots:
+            return None
+        state = self.host(url)
+        now = time.monotonic()
+        with self.lock:
+            if now < state.robots_expires:
+                return None
+            if now < state.robots_claimed_until:
+                #stale rules are good enough while they are refreshed
+                return False if state.robots is None else None
+            state.robots_claimed_until = now + ROBOTS_CLAIM
+            return True
+
+    def set_robots(self, url: str, status: Optional[int], text: str = ""):
+        #4xx means no rules; 5xx or no answer allows everything too, but is asked again sooner
+        parser = RobotFileParser()
+        if status == 200:
+            parser.parse(text.splitlines())
+        else:
+            parser.allow_all = True
+        state = self.host(url)
+        ttl = self.robots_ttl if status is not None and status < 500 else min(self.robots_ttl, 3600)
+        with self.lock:
+            state.robots = parser
+            state.robots_expires = time.monotonic() + ttl
+            state.robots_claimed_until = 0.0
+            state.set_crawl_delay(parser.crawl_delay(self.user_agent) if status == 200 else None)
+
+    def allowed(self, url: str) -> bool:
+        state = self.host(url)
+        return not self.respect_robots or state.robots is None or state.robots.can_fetch(self.user_agent, url)
+
+    # ------------------------------------------------------------------
+    #  responses
+    # ------------------------------------------------------------------
+    def retry_delay(self, url: str, status: Optional[int], retry_after: Optional[str], attempt: int) -> Optional[float]:
+        #None when the response is final, otherwise how long the host is paused before the retry.
+        #status None is a connection error or timeout
+        state = self.host(url)
+        if status is not None and status not in TRANSIENT_STATUS:
+            with self.lock:
+                state.succeeded()
+            return None
+        throttled = status in THROTTLE_STATUS
+        pause = retry_after_seconds(retry_after) if throttled else None
+        if pause is None:
+            pause = backoff_delay(attempt)
+        #a throttled host slows down for every caller, even when this request gives up
+        with self.lock:
+            if throttled:
+                state.throttled(min(pause, MAX_RETRY_AFTER))
+        if attempt >= self.max_retries or pause > MAX_RETRY_AFTER:
+            return None
+        FETCH_RETRIES.inc("throttled" if throttled else "error" if status else "connection")
+        with self.lock:
+            state.blocked_until = max(state.blocked_until, time.monotonic() + pause)
+        return pause
+
+    # ------------------------------------------------------------------
+    #  fetching
+    # ------------------------------------------------------------------
+    async def fetch_async(self, client, url: str, headers: dict = None, limit=None,
+                          stream: bool = False) -> Tuple[object, int]:
+        #httpx client; limit is held only while a request is on the wire, not while waiting for the host.
+        #returns (response, load time in ms of the last attempt). With stream only the headers are read,
+        #the caller reads the body and closes the response
+        import httpx
+        limit = limit or nullcontext()
+        claim = self.robots_claim(url)
+        while claim is False:
+            await asyncio.sleep(ROBOTS_POLL)
+            claim = self.robots_claim(url)
+        if claim:
+            robots_url = host_of(url) + "/robots.txt"
+            try:
+                async with limit:
+                    response = await client.get(robots_url)
+                self.set_robots(url, response.status_code, response.text)
+            except Exception:
+                self.set_robots(url, None)
+        if not self.allowed(url):
+            raise RobotsDisallowed(f"Disallowed by robots.txt: {url}")
+        attempt = 0
+        while True:
+            await self.wait_turn_async(url)
+            start = time.time()
+            try:
+                async with limit:
+                    response = await client.send(client.build_request("GET", url, headers=headers), stream=stream)
+            except httpx.TransportError:
+                if self.retry_delay(url, None, None, attempt) is None:
+                    raise
+                attempt += 1
+                continue
+            load_time = int((time.time() - start) * 1000)
+            if self.retry_delay(url, response.status_code, response.headers.get("Retry-After"), attempt) is None:
+                return response, load_time
+            await response.aclose()
+            attempt += 1
+
+    def fetch(self, session, url: str, headers: dict = None, timeout: float = None,
+              stream: bool = False) -> Tuple[object, int]:
+        #requests session, blocking version of fetch_async
+        import requests
+        claim = self.robots_claim(url)
+        while claim is False:
+            time.sleep(ROBOTS_POLL)
+            claim = self.robots_claim(url)
+        if claim:
+            robots_url = host_of(url) + "/robots.txt"
+            try:
+                response = session.get(robots_url, headers={"User-Agent": self.user_agent}, timeout=timeout)
+                self.set_robots(url, response.status_code, response.text)
+            except Exception:
+                self.set_robots(url, None)
+        if not self.allowed(url):
+            raise RobotsDisallowed(f"Disallowed by robots.txt: {url}")
+        attempt = 0
+        while True:
+            self.wait_turn(url)
+            start = time.time()
+            try:
+                response = session.get(url, headers=headers, timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                #the transport failures fetch_async retries, a bad url or too many redirects is raised at once
+                if self.retry_delay(url, None, None, attempt) is None:
+                    raise
+                attempt += 1
+                continue
+            load_time = int((time.time() - start) * 1000)
+            if self.retry_delay(url, response.status_code, response.headers.get("Retry-After"), attempt) is None:
+                return response, load_time
+            response.close()
+            attempt += 1
@@ -0,0 +1,23 @@
+from typing import Iterable, Set
+
+#==========================================================================
+# schema.org type matching shared by the crawler and the scorer. Kept
+# free of lxml so a scoring process can read types without the parser
+#==========================================================================
+
+
+def schema_types(item: dict) -> Set[str]:
+    #@type as a string or a list, with or without the schema.org prefix
+    types = item.get("@type")
+    if not isinstance(types, list):
+        types = [types]
+    return {t.rsplit("/", 1)[-1].rsplit(":", 1)[-1] for t in types if isinstance(t, str)}
+
+
+def item_types(items: Iterable) -> Set[str]:
+    #the types of every dict item of a schema_data list
+    types = set()
+    for item in items or ():
+        if isinstance(item, dict):
+            types |= schema_types(item)
+    return types
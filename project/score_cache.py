@@ -0,0 +1,96 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from metrics import count_cache, timed
+from serialization import dumps, loads
+from scoring import AIScoringEngine, get_rules
+
+#scores kept in memory in front of the persisted cache
+SCORE_CACHE_MEMORY_SIZE = 4096
+
+#the crawl fields AIScoringEngine reads, nothing else changes a score
+SCORING_INPUTS = ("product", "content", "trust_signals", "schema_data", "meta")
+
+
+def scoring_rules_version() -> str:
+    #any edit to the scoring rules file gives a new fingerprint, so old scores are never served
+    return get_rules().fingerprint
+
+
+def crawl_content_hash(crawl_data: dict) -> str:
+    inputs = {name: crawl_data.get(name) for name in SCORING_INPUTS}
+    encoded = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    #memoized compute_score() results keyed by crawl content hash and scoring rules version
+    def __init__(self, path: str, memory_size: int = SCORE_CACHE_MEMORY_SIZE, rules_version: str = None):
+        #a fixed version pins the cache, otherwise it follows the live rules file
+        self.fixed_version = rules_version
+        self.memory_size = memory_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS scores (
+                content_hash TEXT NOT NULL,
+                rules_version TEXT NOT NULL,
+                score TEXT NOT NULL,
+                PRIMARY KEY (content_hash, rules_version)
+            )""")
+        #scores from older rules can never be hit again
+        self.db.execute("DELETE FROM scores WHERE rules_version != ?", (self.rules_version(),))
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def rules_version(self) -> str:
+        return self.fixed_version or scoring_rules_version()
+
+    def get(self, content_hash: str, rules_version: str = None):
+        key = (content_hash, rules_version or self.rules_version())
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+            row = self.db.execute("SELECT score FROM scores WHERE content_hash = ? AND rules_version = ?",
+                                  key).fetchone()
+            if row is None:
+                return None
+            score = loads(row[0])
+            self._remember(key, score)
+            return score
+
+    def put(self, content_hash: str, score: dict, rules_version: str = None):
+        key = (content_hash, rules_version or self.rules_version())
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO scores VALUES (?, ?, ?)",
+                            (*key, dumps(score)))
+            self.db.commit()
+            self._remember(key, score)
+
+    def score(self, crawl_data: dict) -> dict:
+        content_hash = crawl_content_hash(crawl_data)
+        #one rules snapshot per call, a reload mid-score cannot mix versions
+        rules = get_rules()
+        rules_version = self.fixed_version or rules.fingerprint
+        score = self.get(content_hash, rules_version)
+        count_cache("score", score is not None)
+        if score is not None:
+            self.hits += 1
+            return score
+        self.misses += 1
+        with timed("score"):
+            score = AIScoringEngine(crawl_data, rules).compute_score()
+        self.put(content_hash, score, rules_version)
+        return score
+
+    def _remember(self, key: tuple, score: dict):
+        self.memory[key] = score
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
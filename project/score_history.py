@@ -0,0 +1,108 @@
+from typing import List, Optional
+
+from crawl_store import SCORING_FIELDS, CrawlStore
+from score_cache import ScoreCache
+from scoring import get_rules
+
+#==========================================================================
+# How the score of a url or domain moved across re-crawls, and what changed
+# between two crawls. Series are read from the crawl store's history
+# indexes (url or domain, timestamp, score columns), no crawl is decoded
+# unless its score is missing. Diffs rescore both crawls with the current
+# rules through the score cache, so they show content changes, not rule
+# changes
+#==========================================================================
+#product fields compared by a diff
+PRODUCT_FIELDS = ("name", "brand", "sku", "price", "currency", "availability", "rating", "review_count")
+#unscored crawls scored per series request, older points keep a null score
+MAX_FILL = 1000
+
+
+def changed(old: Optional[dict], new: Optional[dict], keys=None) -> dict:
+    #{key: {"from": old value, "to": new value}} for every key whose value differs, missing is None
+    old, new = old or {}, new or {}
+    keys = keys if keys is not None else sorted(set(old) | set(new))
+    return {key: {"from": old.get(key), "to": new.get(key)} for key in keys if old.get(key) != new.get(key)}
+
+
+def score_point(crawl: dict, score: dict) -> dict:
+    return {
+        "crawl_id": crawl.get("crawl_id"),
+        "crawl_timestamp": crawl.get("page_info", {}).get("crawl_timestamp"),
+        "final_score": score.get("final_score"),
+        "ai_readiness_pct": score.get("ai_readiness_pct"),
+        "readiness_band": score.get("readiness_band"),
+    }
+
+
+def diff_crawls(old: dict, new: dict, old_score: dict, new_score: dict) -> dict:
+    #only what changed: section scores, check points, penalties, trust signals and product fields
+    sections = [section.score_key for section in get_rules().sections]
+    breakdowns = {}
+    old_breakdowns, new_breakdowns = old_score.get("breakdowns") or {}, new_score.get("breakdowns") or {}
+    for section in sorted(set(old_breakdowns) | set(new_breakdowns)):
+        checks = changed(old_breakdowns.get(section), new_breakdowns.get(section))
+        if checks:
+            breakdowns[section] = checks
+    old_trust, new_trust = old.get("trust_signals") or {}, new.get("trust_signals") or {}
+    return {
+        "from": score_point(old, old_score),
+        "to": score_point(new, new_score),
+        "final_score_change": (new_score.get("final_score") or 0) - (old_score.get("final_score") or 0),
+        "sections": changed(old_score, new_score, sections),
+        "breakdowns": breakdowns,
+        "penalties": changed(old_score.get("penalties"), new_score.get("penalties")),
+        "trust_signals": {
+            "lost": sorted(name for name, flag in old_trust.items() if flag and not new_trust.get(name)),
+            "gained": sorted(name for name, flag in new_trust.items() if flag and not old_trust.get(name)),
+        },
+        "product": changed(old.get("product"), new.get("product"), PRODUCT_FIELDS),
+    }
+
+
+class ScoreHistory:
+    #score time series and crawl diffs over a crawl store
+    def __init__(self, store: CrawlStore, scores: ScoreCache):
+        self.store = store
+        self.scores = scores
+
+    def score(self, crawl: dict) -> dict:
+        #scores through the cache and keeps the stored score columns in step
+        score = self.scores.score(crawl)
+        self.store.set_score(crawl["crawl_id"], score, self.scores.rules_version())
+        return score
+
+    def series(self, url: str = None, domain: str = None, since: str = None, until: str = None,
+               limit: int = 1000, fill: bool = True) -> List[dict]:
+        #one point per crawl, oldest first. fill scores crawls that were stored without a score
+        points = self.store.score_series(url, domain, since, until, limit)
+        rules_version = self.scores.rules_version()
+        missing = [point for point in points if point["final_score"] is None][-MAX_FILL:] if fill else []
+        for point in missing:
+            crawl = self.store.get(point["crawl_id"], SCORING_FIELDS)
+            score = self.score(crawl)
+            point.update(final_score=score["final_score"], ai_readiness_pct=score["ai_readiness_pct"],
+                         rules_version=rules_version)
+        for point in points:
+            #scores of older rules stay as they were stored, flagged so they are not compared blindly
+            point["current_rules"] = point["rules_version"] == rules_version
+        return points
+
+    def daily(self, url: str = None, domain: str = None, since: str = None, until: str = None) -> List[dict]:
+        return self.store.daily_scores(url, domain, since, until)
+
+    def diff(self, old_id: int, new_id: int) -> Optional[dict]:
+        old = self.store.get(old_id, SCORING_FIELDS)
+        new = self.store.get(new_id, SCORING_FIELDS)
+        if old is None or new is None:
+            return None
+        result = diff_crawls(old, new, self.score(old), self.score(new))
+        result["rules_version"] = self.scores.rules_version()
+        return result
+
+    def changes_since(self, url: str, since: str) -> Optional[dict]:
+        #latest crawl of url against the one it had at `since` (or its first crawl after that)
+        latest = self.store.latest(url, ())
+        if latest is None:
+            return None
+        return self.diff(self.store.crawl_at(url, since), latest["crawl_id"])
@@ -1,269 +1,343 @@
+import hashlib
+import json
+import os
 import re
-from typing import Any
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, NamedTuple, Optional, Tuple
 
-class AIScoringEngine:
-    
-    def __init__(self, crawl_data: dict):
-        self.data     = crawl_data
-        self.product  = crawl_data.get("product", {})
-        self.content  = crawl_data.get("content", {})
-        self.trust    = crawl_data.get("trust_signals", {})
-        self.schema   = crawl_data.get("schema_data", [])
-        self.meta     = crawl_data.get("meta", {})
+from schema_org import item_types
 
-    # ------------------------------------------------------------------ 
-    #  Section 1 — Schema Completeness                     
-    # ------------------------------------------------------------------ 
-    def score_schema(self) -> dict:
-        score = 0
-        breakdown = {}
-
-        # Core identity fields
-        breakdown["name"]         = 4 if self.product.get("name") else 0
-        breakdown["price"]        = 4 if self.product.get("price") else 0
-        breakdown["currency"]     = 2 if self.product.get("currency") else 0
-        breakdown["brand"]        = 2 if self.product.get("brand") else 0
-        breakdown["availability"] = 2 if self.product.get("availability") else 0
-
-       
-        price = str(self.product.get("price", ""))
-        if re.match(r"^\d+(\.\d{1,2})?$", price):
-            breakdown["price_format_bonus"] = 2
-        else:
-            breakdown["price_format_bonus"] = 0
-
-        
-        if self.schema:
-            schema_types = [s.get("@type", "") for s in self.schema if isinstance(s, dict)]
-            breakdown["schema_markup"]  = 2 if schema_types else 0
-            breakdown["product_schema"] = 2 if "Product" in schema_types else 0
-        else:
-            breakdown["schema_markup"]  = 0
-            breakdown["product_schema"] = 0
-
-        score = sum(breakdown.values())
-        return {"score": min(score, 20), "max": 20, "breakdown": breakdown}
-
-    # ------------------------------------------------------------------ 
-    #  Section 2 — Entity Clarity                         
-    # ------------------------------------------------------------------ 
-    def score_entity_clarity(self) -> dict:
-        score = 0
-        breakdown = {}
-
-        breakdown["name"]     = 4 if self.product.get("name") else 0
-        breakdown["brand"]    = 3 if self.product.get("brand") else 0
-        breakdown["sku"]      = 2 if self.product.get("sku") else 0
-        breakdown["category"] = 2 if self.product.get("category") else 0
-        breakdown["gtin"]     = 2 if self.product.get("gtin") else 0  
-
-        
-        name = self.product.get("name", "")
-        if name:
-            word_count = len(name.split())
-            if word_count >= 4:
-                breakdown["name_quality"] = 2   
-            elif word_count >= 2:
-                breakdown["name_quality"] = 1
-            else:
-                breakdown["name_quality"] = 0   
-        score = sum(breakdown.values())
-        return {"score": min(score, 15), "max": 15, "breakdown": breakdown}
-
-    # ------------------------------------------------------------------ 
-    #  Section 3 — Content Depth                          
-    # ------------------------------------------------------------------ 
-    def score_content_depth(self) -> dict:
-        score = 0
-        breakdown = {}
-
-        word_count = self.content.get("word_count", 0)
-
- 
-        if word_count > 1500:   breakdown["word_count"] = 8
-        elif word_count > 800:  breakdown["word_count"] = 6
-        elif word_count > 400:  breakdown["word_count"] = 4
-        elif word_count > 150:  breakdown["word_count"] = 2
-        else:                   breakdown["word_count"] = 0
-
-    
-        headings = self.content.get("headings", [])
-        if len(headings) >= 8:   breakdown["headings"] = 4
-        elif len(headings) >= 4: breakdown["headings"] = 2
-        elif len(headings) >= 1: breakdown["headings"] = 1
-        else:                    breakdown["headings"] = 0
-
-    
-        features = self.content.get("features", [])
-        if len(features) >= 6:   breakdown["features"] = 4
-        elif len(features) >= 3: breakdown["features"] = 2
-        elif len(features) >= 1: breakdown["features"] = 1
-        else:                    breakdown["features"] = 0
-
-        
-        specs = self.content.get("specifications", {})
-        if len(specs) >= 8:   breakdown["specifications"] = 5
-        elif len(specs) >= 4: breakdown["specifications"] = 3
-        elif len(specs) >= 1: breakdown["specifications"] = 1
-        else:                 breakdown["specifications"] = 0
-
-     
-        images = self.content.get("images", [])
-        images_with_alt = [i for i in images if isinstance(i, dict) and i.get("alt")]
-        if images_with_alt:
-            breakdown["image_alt_text"] = 2
-        else:
-            breakdown["image_alt_text"] = 0
-
-    
-        breakdown["faq"] = 2 if self.content.get("faq") else 0
-
-        score = sum(breakdown.values())
-        return {"score": min(score, 25), "max": 25, "breakdown": breakdown}
-
-    # ------------------------------------------------------------------ 
-    #  Section 4 — Trust Signals                          
-    # ------------------------------------------------------------------ 
-    def score_trust(self) -> dict:
-        score = 0
-        breakdown = {}
-
-        weighted_signals = {
-    "has_return_policy": 3,
-    "has_warranty_info": 3,
-    "has_shipping_info": 2,
-    "mentions_secure_payment": 2,
-    "has_contact_page": 2,
-    "mentions_reviews": 3,
-    "uses_https": 1
-}
+#rules file in use, swap it for another versioned rule set with SCORING_RULES
+RULES_PATH = os.environ.get(
+    "SCORING_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_rules.json"))
+#how often the rules file is checked for changes (hot reload)
+RULES_RELOAD_INTERVAL = 1.0
+#part of every rules fingerprint, bumped when the same rules score differently so cached scores are dropped.
+#2: @type lists and schema.org URLs count as their types
+SCORER_VERSION = 2
 
-        for signal, weight in weighted_signals.items():
-            value = self.trust.get(signal)
-            if value:
-                
-                if signal == "reviews_count":
-                    count = int(value) if str(value).isdigit() else 0
-                    if count >= 100:   breakdown[signal] = weight
-                    elif count >= 20:  breakdown[signal] = weight - 1
-                    elif count >= 5:   breakdown[signal] = weight - 2
-                    else:              breakdown[signal] = 1
-                else:
-                    breakdown[signal] = weight
-            else:
-                breakdown[signal] = 0
-
-        score = sum(breakdown.values())
-        return {"score": min(score, 20), "max": 20, "breakdown": breakdown}
-
-    # ------------------------------------------------------------------ 
-    #  Section 5 — AI Extractability                       
-    # ------------------------------------------------------------------ 
-    def score_extractability(self) -> dict:
-        score = 0
-        breakdown = {}
+PRICE_FORMAT = re.compile(r"^\d+(\.\d{1,2})?$")
+#a penalty without "below" applies when its feature is
+PENALTY_WHEN = ("missing", "present")
 
-        breakdown["schema_present"]  = 4 if self.schema else 0
 
+EMPTY = {}
 
-        headings = self.content.get("headings", [])
-        h_types   = [h.get("level") for h in headings if isinstance(h, dict)]
-        breakdown["heading_hierarchy"] = 2 if ("h1" in h_types and "h2" in h_types) else (1 if headings else 0)
 
+def path_getter(path: str):
+    #compiled field lookup for a dotted path, missing levels give None
+    parts = path.split(".")
+    if len(parts) == 1:
+        return lambda r: r.get(parts[0])
+    if len(parts) == 2:
+        first, second = parts
+        return lambda r: (r.get(first) or EMPTY).get(second)
 
-        specs = self.content.get("specifications", {})
-        if len(specs) >= 5:   breakdown["specs_table"] = 4
-        elif len(specs) >= 1: breakdown["specs_table"] = 2
-        else:                 breakdown["specs_table"] = 0
+    def get(record):
+        value = record
+        for part in parts:
+            value = (value or EMPTY).get(part)
+        return value
+    return get
 
 
-        breakdown["meta_title"]       = 2 if self.meta.get("title") else 0
-        breakdown["meta_description"] = 2 if self.meta.get("description") else 0
+def _schema_types(record):
+    #@type of every item, a list of types or schema.org URLs included
+    return item_types(record.get("schema_data"))
 
 
-        breakdown["canonical_url"] = 2 if self.meta.get("canonical") else 0
+def _name_words(record):
+    name = record.get("product", {}).get("name", "")
+    return len(name.split()) if name else 0
 
 
-        breakdown["hreflang"] = 4 if self.meta.get("hreflang") else 0
+def _heading_levels(record):
+    return [h.get("level") for h in record.get("content", {}).get("headings", []) if isinstance(h, dict)]
 
-        score = sum(breakdown.values())
-        return {"score": min(score, 20), "max": 20, "breakdown": breakdown}
 
-    # ------------------------------------------------------------------ 
-    #  PENALTIES          
-    # ------------------------------------------------------------------ 
-    def _compute_penalties(self) -> dict:
+#features that need more than a field lookup, rules refer to them by name
+DERIVED_FEATURES = {
+    "price_format": lambda r: bool(PRICE_FORMAT.match(str(r.get("product", {}).get("price", "")))),
+    "name_words": _name_words,
+    "schema_types": lambda r: bool(_schema_types(r)),
+    "product_schema": lambda r: "Product" in _schema_types(r),
+    "h1_and_h2": lambda r: {"h1", "h2"} <= set(_heading_levels(r)),
+    "images_with_alt": lambda r: any(isinstance(i, dict) and i.get("alt")
+                                     for i in r.get("content", {}).get("images", [])),
+}
+
+
+def feature_extractor(spec: str):
+    #"present:<path>", "count:<path>", "value:<path>" or a DERIVED_FEATURES name
+    if spec in DERIVED_FEATURES:
+        return DERIVED_FEATURES[spec]
+    kind, _, path = spec.partition(":")
+    parts = path.split(".")
+    if kind == "present" and len(parts) == 2:
+        #the common case, kept to a single call per record
+        first, second = parts
+        return lambda r: bool((r.get(first) or EMPTY).get(second))
+    get = path_getter(path)
+    if kind == "present":
+        return lambda r: bool(get(r))
+    if kind == "count":
+        return lambda r: len(get(r) or ())
+    if kind == "value":
+        return lambda r: get(r) or 0
+    raise ValueError(f"Unknown scoring feature: {spec}")
+
+
+class Check(NamedTuple):
+    #points = table[number of thresholds passed], thresholds ascending.
+    #checks with options instead score the points of the first truthy (feature, points) option
+    key: str
+    feature: int
+    thresholds: Tuple[float, ...]
+    table: Tuple[Any, ...]
+    strict: bool
+    only_if: Optional[int]
+    options: Tuple[Tuple[int, Any], ...] = ()
+
+    def scorer(self):
+        #the check as a function of a features row, looking the value up in its threshold table
+        table, thresholds, feature = self.table, self.thresholds, self.feature
+        if self.options:
+            options = self.options
+
+            def first(row):
+                for option, points in options:
+                    if row[option]:
+                        return points
+                return 0
+            return first
+        if len(thresholds) == 1:
+            #a bool indexes the two entry table
+            threshold = thresholds[0]
+            if self.strict:
+                return lambda row: table[row[feature] > threshold]
+            return lambda row: table[row[feature] >= threshold]
+        #strict thresholds are passed by values above them, the others by values at or above them
+        passed = bisect_left if self.strict else bisect_right
+        return lambda row: table[passed(thresholds, row[feature])]
+
+
+class Section(NamedTuple):
+    name: str
+    score_key: str
+    max: int
+    checks: Tuple[Check, ...]
+
+
+class CompiledRules:
+    #a rules file compiled once into feature extractors and threshold tables, a flat list of checks
+    #looked up per record: features_of(record) then score_row(features)
+    def __init__(self, spec: dict):
+        self.spec = spec
+        self.version = str(spec["version"])
+        canonical = json.dumps([SCORER_VERSION, spec], sort_keys=True, ensure_ascii=False)
+        #version plus content, so editing a file without bumping the version still changes it
+        self.fingerprint = f"{self.version}-{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:12]}"
+        self.feature_specs = []
+        self.extractors = []
+
+        sections = []
+        for section in spec["sections"]:
+            checks = tuple(self._compile_check(check) for check in section["checks"])
+            sections.append(Section(section["name"], section["score_key"], section["max"], checks))
+        self.sections = tuple(sections)
+        self.max_possible = sum(section.max for section in self.sections)
+        self.penalties = tuple(self._compile_penalty(penalty) for penalty in spec["penalties"])
+        bands = sorted(spec["bands"], key=lambda band: band[0])
+        self.band_check = Check("readiness_band", -1, tuple(b[0] for b in bands[1:]),
+                                tuple(b[1] for b in bands), False, None)
+        #(max, (key, scorer, only_if) per check) per section and (key, scorer) per penalty
+        self.plan = tuple((section.max,
+                           tuple((check.key, check.scorer(), check.only_if) for check in section.checks))
+                          for section in self.sections)
+        self.penalty_plan = tuple((check.key, check.scorer()) for check in self.penalties)
+
+    def features_of(self, record: dict) -> tuple:
+        #every feature the checks read, by feature index
+        return tuple(extract(record) for extract in self.extractors)
+
+    def score_row(self, row: tuple):
+        #((section score, breakdown) per section, penalties) of one features_of() row. Checks with
+        #only_if are left out of the breakdown where the condition fails, penalties only when not 0
+        results = []
+        for maximum, checks in self.plan:
+            breakdown = {key: score(row) for key, score, only_if in checks if only_if is None or row[only_if]}
+            results.append((min(sum(breakdown.values()), maximum), breakdown))
         penalties = {}
+        for key, score in self.penalty_plan:
+            points = score(row)
+            if points:
+                penalties[key] = points
+        return tuple(results), penalties
+
+    def _feature(self, spec: str) -> int:
+        if spec not in self.feature_specs:
+            self.feature_specs.append(spec)
+            self.extractors.append(feature_extractor(spec))
+        return self.feature_specs.index(spec)
+
+    def _compile_check(self, check: dict) -> Check:
+        only_if = self._feature(check["only_if"]) if "only_if" in check else None
+        if "first" in check:
+            options = tuple((self._feature(o["feature"]), o["points"]) for o in check["first"])
+            return Check(check["key"], -1, (), (0,), False, only_if, options)
+        feature = self._feature(check["feature"])
+        if "tiers" in check:
+            tiers = sorted(check["tiers"], key=lambda tier: tier[0])
+            return Check(check["key"], feature, tuple(t[0] for t in tiers),
+                         (0,) + tuple(t[1] for t in tiers), check.get("strict", False), only_if)
+        return Check(check["key"], feature, (1,), (0, check["points"]), False, only_if)
+
+    def _compile_penalty(self, penalty: dict) -> Check:
+        #"below": the feature's value is under a threshold, otherwise "when" the feature is missing (default) or present
+        feature = self._feature(penalty["feature"])
+        if "below" in penalty:
+            if "when" in penalty:
+                raise ValueError(f"Penalty {penalty['key']} has both below and when")
+            return Check(penalty["key"], feature, (penalty["below"],), (penalty["points"], 0), False, None)
+        when = penalty.get("when", "missing")
+        if when not in PENALTY_WHEN:
+            raise ValueError(f"Unknown penalty condition: {when}")
+        table = (penalty["points"], 0) if when == "missing" else (0, penalty["points"])
+        return Check(penalty["key"], feature, (1,), table, False, None)
+
+    def band(self, pct: float) -> str:
+        return self.band_check.table[bisect_right(self.band_check.thresholds, pct)]
+
+
+class RulesFile:
+    #compiled rules for one file, recompiled when the file changes on disk
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.checked_at = 0.0
+        self.rules = None
+
+    def get(self) -> CompiledRules:
+        now = time.monotonic()
+        if self.rules is not None and now - self.checked_at < RULES_RELOAD_INTERVAL:
+            return self.rules
+        with self.lock:
+            self.checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime != self.mtime:
+                    self.mtime = mtime
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self.rules = CompiledRules(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError, IndexError):
+                #a broken edit, or the file missing while it is replaced, keeps the previously compiled rules active
+                if self.rules is None:
+                    raise
+            return self.rules
+
+
+_rules_files = {}
+
+
+def get_rules(path: str = None) -> CompiledRules:
+    path = path or RULES_PATH
+    if path not in _rules_files:
+        _rules_files[path] = RulesFile(path)
+    return _rules_files[path].get()
+
+
+class AIScoringEngine:
+
+    def __init__(self, crawl_data: dict, rules: CompiledRules = None):
+        self.data     = crawl_data
+        self.product  = crawl_data.get("product", {})
+        self.content  = crawl_data.get("content", {})
+        self.trust    = crawl_data.get("trust_signals", {})
+        self.schema   = crawl_data.get("schema_data", [])
+        self.meta     = crawl_data.get("meta", {})
+        #weights and thresholds come from the compiled rules file, see scoring_rules.json
+        self.rules    = rules or get_rules()
+        self.row      = self.rules.features_of(crawl_data)
+
+    def _section(self, name: str) -> dict:
+        results, _ = self.rules.score_row(self.row)
+        for section, (score, breakdown) in zip(self.rules.sections, results):
+            if section.name == name:
+                return {"score": score, "max": section.max, "breakdown": breakdown}
+        raise KeyError(name)
 
-        if not self.product.get("price"):
-            penalties["missing_price"] = -5
+    # ------------------------------------------------------------------
+    #  Section 1 — Schema Completeness
+    # ------------------------------------------------------------------
+    def score_schema(self) -> dict:
+        return self._section("schema")
+
+    # ------------------------------------------------------------------
+    #  Section 2 — Entity Clarity
+    # ------------------------------------------------------------------
+    def score_entity_clarity(self) -> dict:
+        return self._section("entity")
 
-        if not self.product.get("name"):
-            penalties["missing_product_name"] = -10
+    # ------------------------------------------------------------------
+    #  Section 3 — Content Depth
+    # ------------------------------------------------------------------
+    def score_content_depth(self) -> dict:
+        return self._section("content")
+
+    # ------------------------------------------------------------------
+    #  Section 4 — Trust Signals
+    # ------------------------------------------------------------------
+    def score_trust(self) -> dict:
+        return self._section("trust")
 
-        if not self.schema:
-            penalties["no_schema_markup"] = -5
+    # ------------------------------------------------------------------
+    #  Section 5 — AI Extractability
+    # ------------------------------------------------------------------
+    def score_extractability(self) -> dict:
+        return self._section("extractability")
 
-        word_count = self.content.get("word_count", 0)
-        if word_count < 100:
-            penalties["thin_content"] = -8
+    # ------------------------------------------------------------------
+    #  PENALTIES
+    # ------------------------------------------------------------------
+    def _compute_penalties(self) -> dict:
+        return self.rules.score_row(self.row)[1]
 
-        return penalties
+    # ------------------------------------------------------------------
+    #  GEO READINESS BAND
+    # ------------------------------------------------------------------
+    def _readiness_band(self, pct: float) -> str:
+        return self.rules.band(pct)
 
     # ------------------------------------------------------------------
-    #  GEO READINESS BAND                                                 
-    # ------------------------------------------------------------------ 
-    @staticmethod
-    def _readiness_band(pct: float) -> str:
-        if pct >= 85: return "Excellent — AI/GEO Ready"
-        if pct >= 70: return "Good — Minor Gaps"
-        if pct >= 50: return "Fair — Needs Improvement"
-        if pct >= 30: return "Poor — Significant Issues"
-        return        "Critical — Not AI-Ready"
-
-    # ------------------------------------------------------------------ 
-    #  MASTER COMPUTE                                                      
-    # ------------------------------------------------------------------ 
+    #  MASTER COMPUTE
+    # ------------------------------------------------------------------
     def compute_score(self) -> dict:
-        schema      = self.score_schema()
-        entity      = self.score_entity_clarity()
-        content     = self.score_content_depth()
-        trust       = self.score_trust()
-        extract     = self.score_extractability()
-        penalties   = self._compute_penalties()
-
-        raw_total  = (schema["score"] + entity["score"] + content["score"]
-                      + trust["score"] + extract["score"])
+        rules = self.rules
+        results, penalties = rules.score_row(self.row)
+
+        raw_total  = sum(score for score, _ in results)
         penalty_total = sum(penalties.values())
-        max_score     = schema["max"] + entity["max"] + content["max"] + trust["max"] + extract["max"]
+        max_score     = rules.max_possible
 
         final_score  = max(0, raw_total + penalty_total)
         percentage   = round((final_score / max_score) * 100, 2)
 
-        return {
-            
-            "schema_score":          schema["score"],
-            "entity_score":          entity["score"],
-            "content_score":         content["score"],
-            "trust_score":           trust["score"],
-            "extractability_score":  extract["score"],
-            
+        score = {section.score_key: result[0] for section, result in zip(rules.sections, results)}
+        score.update({
             "penalties":             penalties,
             "penalty_total":         penalty_total,
-            
+
             "raw_score":             raw_total,
             "final_score":           final_score,
             "max_possible":          max_score,
             "ai_readiness_pct":      percentage,
-            
-            
+
+
             "readiness_band":        self._readiness_band(percentage),
-            
-            "breakdowns": {
-                "schema":         schema["breakdown"],
-                "entity":         entity["breakdown"],
-                "content":        content["breakdown"],
-                "trust":          trust["breakdown"],
-                "extractability": extract["breakdown"],
-            }
-        }
\ No newline at end of file
+
+            "breakdowns": {section.name: result[1] for section, result in zip(rules.sections, results)}
+        })
+        return score
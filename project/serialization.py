@@ -0,0 +1,115 @@
+import json
+import os
+import zlib
+from typing import Iterable, List, Optional, Union
+
+#==========================================================================
+# JSON encoding for responses and stored rows, and field projection.
+# orjson when it is installed (several times faster, compact, utf-8 bytes
+# straight away), the json module with compact separators otherwise.
+# Values orjson refuses (ints over 64 bits, NaN in stored rows) go
+# through the json module. Stored crawl sections are compressed with
+# zstd (zlib without zstandard), each section on its own so a reader
+# only decompresses the sections it loads
+#==========================================================================
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#compression of stored crawl sections: zstd, zlib (always available) or none
+STORAGE_COMPRESSION = os.environ.get("STORAGE_COMPRESSION", "zstd" if zstandard is not None else "zlib")
+if STORAGE_COMPRESSION not in ("zstd", "zlib", "none"):
+    raise ValueError(f"STORAGE_COMPRESSION must be zstd, zlib or none, not {STORAGE_COMPRESSION!r}")
+if STORAGE_COMPRESSION == "zstd" and zstandard is None:
+    raise ValueError("STORAGE_COMPRESSION=zstd needs the zstandard package")
+ZSTD_LEVEL = 3
+ZLIB_LEVEL = 6
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+#sections shorter than this stay plain json, a compressed frame would not be smaller
+MIN_COMPRESS_BYTES = 64
+
+
+def dumps_bytes(value) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def dumps(value) -> str:
+    return dumps_bytes(value).decode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def pack(value) -> Union[str, bytes]:
+    #stored form of a crawl section: compressed json bytes, or json text when it is not compressed
+    data = dumps_bytes(value)
+    if STORAGE_COMPRESSION == "none" or len(data) < MIN_COMPRESS_BYTES:
+        return data.decode("utf-8")
+    if STORAGE_COMPRESSION == "zstd":
+        return zstandard.compress(data, ZSTD_LEVEL)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def unpack(stored: Union[str, bytes]):
+    #json text (rows written before compression, or small sections), zstd or zlib compressed json
+    if isinstance(stored, bytes):
+        if stored[:4] == ZSTD_MAGIC:
+            if zstandard is None:
+                raise RuntimeError("crawl data is zstd compressed, install zstandard to read it")
+            stored = zstandard.decompress(stored)
+        else:
+            stored = zlib.decompress(stored)
+    return loads(stored)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[List[str]]]:
+    #"product,page_info.url,score.breakdowns.trust" -> [["product"], ["page_info", "url"], ...], None for all
+    if not fields:
+        return None
+    paths = [field.strip().split(".") for field in fields.split(",") if field.strip()]
+    return paths or None
+
+
+def project(data: dict, paths: Optional[List[List[str]]]) -> dict:
+    #the parts of data named by paths, nested like data. Paths that do not exist are left out
+    if paths is None:
+        return data
+    projected = {}
+    for path in paths:
+        value = data
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+    return projected
+
+
+def top_level(paths: Optional[List[List[str]]], names: Iterable[str]) -> Iterable[str]:
+    #the names that a projection reaches into, all of them without one
+    return [name for name in names if paths is None or any(path[0] == name for path in paths)]
+
+
+def ndjson_line(value) -> bytes:
+    return dumps_bytes(value) + b"\n"
@@ -0,0 +1,396 @@
+import argparse
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from batch import BatchCrawler, MAX_CONCURRENCY, PER_HOST_CONCURRENCY, create_http_client
+from crawl_store import CrawlStore
+from metrics import record_crawl
+from near_duplicates import DUPLICATE_POLICIES, NearDuplicateIndex
+from streaming import MAX_PAGE_BYTES, read_raw_async
+
+#defaults for one site crawl, both can be set per crawl
+SITE_MAX_DEPTH = 3
+SITE_MAX_PAGES = 1000
+#sitemap files read at most per crawl, a sitemap index can point to many
+MAX_SITEMAPS = 500
+
+#query parameters that never change the page
+TRACKING_PARAMS = frozenset(["gclid", "fbclid", "msclkid", "yclid", "mc_cid", "mc_eid", "ref", "_ga"])
+
+
+
+@lru_cache(maxsize=None)
+def sitemap_parser():
+    #lxml is only loaded by processes that read sitemaps
+    import lxml.etree
+    return lxml.etree.XMLParser(recover=True, resolve_entities=False, no_network=True, huge_tree=True)
+
+
+def normalize_url(url: str) -> str:
+    #one spelling per page: lowercase scheme and host, no default port, fragment or tracking parameters,
+    #sorted query
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    netloc = host if port is None or (scheme, port) in (("http", 80), ("https", 443)) else f"{host}:{port}"
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def normalize_urls(urls: Iterable[str]) -> List[str]:
+    #normalize_url of each url, one that cannot be parsed (bad port, broken IPv6 literal) is skipped
+    normalized = []
+    for url in urls:
+        try:
+            normalized.append(normalize_url(url))
+        except ValueError:
+            continue
+    return normalized
+
+
+def site_host(url: str) -> str:
+    #www.shop.com and shop.com are the same site
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def parse_sitemap(body: bytes, max_bytes: int = MAX_PAGE_BYTES) -> Tuple[List[str], List[str]]:
+    #(page urls, child sitemap urls) of a sitemap or sitemap index, gzipped or not. A gzipped sitemap is
+    #inflated to max_bytes at most, the urls in a cut off document are still read
+    if body[:2] == b"\x1f\x8b":
+        body = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body, max_bytes)
+    import lxml.etree
+    root = lxml.etree.fromstring(body, sitemap_parser())
+    pages, sitemaps = [], []
+    if root is None:
+        return pages, sitemaps
+    for loc in root.iter("{*}loc"):
+        parent = loc.getparent()
+        url = (loc.text or "").strip()
+        if not url or parent is None:
+            continue
+        if lxml.etree.QName(parent).localname == "sitemap":
+            sitemaps.append(url)
+        else:
+            pages.append(url)
+    return pages, sitemaps
+
+
+class SiteFrontier:
+    #deduplicated frontier and checkpoint of site crawls in SQLite, every page state is committed as it changes
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS sites (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                seed_url TEXT,
+                sitemap_url TEXT,
+                host TEXT NOT NULL,
+                max_depth INTEGER NOT NULL,
+                max_pages INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                seeded INTEGER NOT NULL DEFAULT 0,
+                duplicates TEXT NOT NULL DEFAULT 'keep',
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS frontier (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                site_id INTEGER NOT NULL REFERENCES sites (id),
+                url TEXT NOT NULL,
+                depth INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                page_type TEXT,
+                crawl_id INTEGER,
+                error TEXT,
+                done_seq INTEGER,
+                UNIQUE (site_id, url)
+            );
+            CREATE INDEX IF NOT EXISTS frontier_next ON frontier (site_id, state, depth, id);
+        """)
+        #sites tables created before near-duplicate handling
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(sites)")]
+        if "duplicates" not in columns:
+            self.db.execute("ALTER TABLE sites ADD COLUMN duplicates TEXT NOT NULL DEFAULT 'keep'")
+        #and frontier tables created before finished pages could be streamed
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(frontier)")]
+        if "done_seq" not in columns:
+            self.db.execute("ALTER TABLE frontier ADD COLUMN done_seq INTEGER")
+        self.db.execute("CREATE INDEX IF NOT EXISTS frontier_done ON frontier (site_id, done_seq)")
+        self.db.commit()
+
+    def create(self, seed_url: Optional[str], sitemap_url: Optional[str], max_depth: int, max_pages: int,
+               duplicates: str = "keep") -> int:
+        #duplicates: near_duplicates.DUPLICATE_POLICIES, what happens to variants of pages already stored
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO sites (seed_url, sitemap_url, host, max_depth, max_pages, status, duplicates,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, ?, 'pending', ?, ?, ?)",
+                (seed_url, sitemap_url, site_host(seed_url or sitemap_url), max_depth, max_pages, duplicates,
+                 now, now))
+            self.db.commit()
+            return cursor.lastrowid
+
+    def site(self, site_id: int) -> Optional[dict]:
+        with self.lock:
+            cursor = self.db.execute("SELECT * FROM sites WHERE id = ?", (site_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            site = dict(zip((column[0] for column in cursor.description), row))
+            site["pages"] = dict(self.db.execute(
+                "SELECT state, COUNT(*) FROM frontier WHERE site_id = ? GROUP BY state", (site_id,)).fetchall())
+        return site
+
+    def sites_with_status(self, *statuses: str) -> List[int]:
+        placeholders = ",".join("?" * len(statuses))
+        with self.lock:
+            return [row[0] for row in self.db.execute(
+                f"SELECT id FROM sites WHERE status IN ({placeholders}) ORDER BY id", statuses)]
+
+    def update_site(self, site_id: int, **values):
+        columns = ", ".join(f"{name} = ?" for name in values)
+        with self.lock:
+            self.db.execute(f"UPDATE sites SET {columns}, updated_at = ? WHERE id = ?",
+                            (*values.values(), time.time(), site_id))
+            self.db.commit()
+
+    def add(self, site_id: int, urls: Iterable[str], depth: int) -> int:
+        #already known urls are ignored, whatever their state
+        with self.lock:
+            before = self.db.total_changes
+            self.db.executemany("INSERT OR IGNORE INTO frontier (site_id, url, depth) VALUES (?, ?, ?)",
+                                ((site_id, url, depth) for url in urls))
+            self.db.commit()
+            return self.db.total_changes - before
+
+    def claim(self, site_id: int, limit: int) -> List[Tuple[str, int]]:
+        #next pending urls, shallowest first
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, url, depth FROM frontier WHERE site_id = ? AND state = 'pending'"
+                " ORDER BY depth, id LIMIT ?", (site_id, limit)).fetchall()
+            self.db.executemany("UPDATE frontier SET state = 'in_progress' WHERE id = ?",
+                                ((row[0],) for row in rows))
+            self.db.commit()
+        return [(url, depth) for _, url, depth in rows]
+
+    def finish(self, site_id: int, url: str, state: str, page_type: str = None, crawl_id: int = None,
+               error: str = None):
+        #done_seq numbers the pages of a site in the order they finish
+        with self.lock:
+            self.db.execute(
+                "UPDATE frontier SET state = ?, page_type = ?, crawl_id = ?, error = ?,"
+                " done_seq = (SELECT COALESCE(MAX(done_seq), 0) + 1 FROM frontier WHERE site_id = ?)"
+                " WHERE site_id = ? AND url = ?",
+                (state, page_type, crawl_id, error, site_id, site_id, url))
+            self.db.commit()
+
+    def release(self, site_id: int):
+        #pages that were in flight when the crawl stopped are crawled again on resume
+        with self.lock:
+            self.db.execute("UPDATE frontier SET state = 'pending' WHERE site_id = ? AND state = 'in_progress'",
+                            (site_id,))
+            self.db.commit()
+
+    def visited(self, site_id: int) -> int:
+        with self.lock:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM frontier WHERE site_id = ? AND state IN ('done', 'duplicate', 'failed')",
+                (site_id,)).fetchone()[0]
+
+    def has_pending(self, site_id: int) -> bool:
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM frontier WHERE site_id = ? AND state = 'pending' LIMIT 1",
+                                   (site_id,)).fetchone() is not None
+
+    def pages(self, site_id: int, state: str = None, page_type: str = None, limit: int = 100,
+              offset: int = 0) -> List[dict]:
+        clauses, params = ["site_id = ?"], [site_id]
+        for clause, value in (("state = ?", state), ("page_type = ?", page_type)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT url, depth, state, page_type, crawl_id, error FROM frontier"
+                f" WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ? OFFSET ?", (*params, limit, offset)).fetchall()
+        keys = ("url", "depth", "state", "page_type", "crawl_id", "error")
+        return [dict(zip(keys, row)) for row in rows]
+
+
+    def finished_pages(self, site_id: int, after: int = 0, limit: int = 500) -> List[dict]:
+        #pages finished after the one numbered `after`, in the order they finished
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT done_seq, url, depth, state, page_type, crawl_id, error FROM frontier"
+                " WHERE site_id = ? AND done_seq > ? ORDER BY done_seq LIMIT ?", (site_id, after, limit)).fetchall()
+        keys = ("seq", "url", "depth", "state", "page_type", "crawl_id", "error")
+        return [dict(zip(keys, row)) for row in rows]
+
+
+class SiteCrawler:
+    #crawls one site from its frontier: every page is classified, product pages are extracted and stored.
+    #with a NearDuplicateIndex, product pages that are variants of stored pages follow the site's duplicates policy
+    def __init__(self, batch: BatchCrawler, frontier: SiteFrontier, store: CrawlStore, site_id: int,
+                 duplicates: NearDuplicateIndex = None):
+        self.batch = batch
+        self.frontier = frontier
+        self.store = store
+        self.duplicates = duplicates
+        self.site_id = site_id
+        self.site = frontier.site(site_id)
+        self.concurrency = batch.max_concurrency
+
+    async def run(self) -> dict:
+        self.frontier.update_site(self.site_id, status="running")
+        self.frontier.release(self.site_id)
+        try:
+            if not self.site["seeded"]:
+                await self.seed()
+            await self.crawl()
+        except asyncio.CancelledError:
+            #left as running, the crawl resumes from its checkpoint
+            raise
+        except Exception:
+            self.frontier.update_site(self.site_id, status="failed")
+            raise
+        status = "finished" if not self.frontier.has_pending(self.site_id) else "budget_reached"
+        self.frontier.update_site(self.site_id, status=status)
+        return self.frontier.site(self.site_id)
+
+    async def seed(self):
+        if self.site["seed_url"]:
+            self.frontier.add(self.site_id, [normalize_url(self.site["seed_url"])], 0)
+        if self.site["sitemap_url"]:
+            await self.read_sitemaps(self.site["sitemap_url"])
+        self.frontier.update_site(self.site_id, seeded=1)
+
+    async def read_sitemaps(self, sitemap_url: str):
+        #sitemap indexes are followed breadth first, pages go into the frontier at depth 0
+        queue, seen, added = [sitemap_url], set(), 0
+        while queue and len(seen) < MAX_SITEMAPS and added < self.site["max_pages"]:
+            url = queue.pop(0)
+            if url in seen:
+                continue
+            seen.add(url)
+            try:
+                async with self.batch.host_limit(url):
+                    response, _ = await self.batch.scheduler.fetch_async(
+                        self.batch.client, url, limit=self.batch.global_limit, stream=True)
+                    #read up to the page size cap like any page
+                    body, _ = await read_raw_async(response)
+                if response.status_code != 200:
+                    continue
+                pages, sitemaps = parse_sitemap(body)
+            except Exception:
+                continue
+            pages = [page for page in normalize_urls(pages) if site_host(page) == self.site["host"]]
+            added += self.frontier.add(self.site_id, pages[:self.site["max_pages"] - added], 0)
+            queue.extend(sitemaps)
+
+    async def crawl(self):
+        #counted once, then kept up to date in memory
+        self.visited = self.frontier.visited(self.site_id)
+        running = set()
+        try:
+            while True:
+                budget = self.site["max_pages"] - self.visited - len(running)
+                free = min(budget, self.concurrency - len(running))
+                if free > 0:
+                    for url, depth in self.frontier.claim(self.site_id, free):
+                        running.add(asyncio.ensure_future(self.visit(url, depth)))
+                if not running:
+                    return
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        finally:
+            #pages cut off here stay in_progress and are released on resume
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    async def visit(self, url: str, depth: int):
+        try:
+            await self.process(url, depth)
+        finally:
+            self.visited += 1
+
+    async def process(self, url: str, depth: int):
+        try:
+            async with self.batch.page_slot():
+                crawler, load_time = await self.batch.fetch(url)
+                survey = await self.batch.survey(crawler, load_time)
+            if "error" in survey:
+                self.frontier.finish(self.site_id, url, "failed", error=survey["error"])
+                return
+            if depth < self.site["max_depth"]:
+                links = set(normalize_urls(survey["links"]))
+                self.frontier.add(self.site_id, [link for link in links if site_host(link) == self.site["host"]],
+                                  depth + 1)
+            crawl_id, state = None, "done"
+            if survey["result"] is not None:
+                result = record_crawl(survey["result"])
+                if self.duplicates is None:
+                    crawl_id = await asyncio.to_thread(self.store.save, result)
+                else:
+                    crawl_id, match = await asyncio.to_thread(self.duplicates.record, self.store, result,
+                                                              self.site["duplicates"])
+                    #a dropped variant points at the stored page it duplicates
+                    if crawl_id is None:
+                        crawl_id, state = match.crawl_id, "duplicate"
+            self.frontier.finish(self.site_id, url, state, survey["page_type"], crawl_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.frontier.finish(self.site_id, url, "failed", error=str(e) or type(e).__name__)
+
+
+async def run_site_crawl(frontier: SiteFrontier, store: CrawlStore, site_id: int,
+                         max_concurrency: int = MAX_CONCURRENCY, per_host_concurrency: int = PER_HOST_CONCURRENCY,
+                         pool=None, duplicates: NearDuplicateIndex = None) -> dict:
+    async with create_http_client(max_concurrency) as client:
+        batch = BatchCrawler(client, max_concurrency, per_host_concurrency, pool=pool)
+        return await SiteCrawler(batch, frontier, store, site_id, duplicates).run()
+
+
+if __name__ == "__main__":
+    #python site_crawl.py --seed https://shop.example.com/  |  --sitemap <url>  |  --resume <site id>
+    parser = argparse.ArgumentParser(description="crawl a whole site from a seed url or sitemap")
+    parser.add_argument("--seed")
+    parser.add_argument("--sitemap")
+    parser.add_argument("--resume", type=int, help="continue an interrupted site crawl")
+    parser.add_argument("--max-depth", type=int, default=SITE_MAX_DEPTH)
+    parser.add_argument("--max-pages", type=int, default=SITE_MAX_PAGES)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--duplicates", default="keep", choices=DUPLICATE_POLICIES,
+                        help="what to do with near-duplicates of stored pages")
+    parser.add_argument("--data", default="data")
+    args = parser.parse_args()
+    if not (args.seed or args.sitemap or args.resume):
+        parser.error("one of --seed, --sitemap or --resume is required")
+
+    os.makedirs(args.data, exist_ok=True)
+    site_frontier = SiteFrontier(os.path.join(args.data, "sites.sqlite"))
+    crawl_store = CrawlStore(os.path.join(args.data, "crawls.sqlite"))
+    duplicate_index = NearDuplicateIndex(os.path.join(args.data, "fingerprints.sqlite"))
+    site = args.resume or site_frontier.create(args.seed, args.sitemap, args.max_depth, args.max_pages,
+                                               args.duplicates)
+    print(f"site crawl {site}")
+    print(asyncio.run(run_site_crawl(site_frontier, crawl_store, site, args.concurrency,
+                                     duplicates=duplicate_index)))
@@ -0,0 +1,151 @@
+import codecs
+import os
+import re
+from typing import Optional, Tuple
+
+#bodies are cut off after this many bytes, the page is still extracted and marked truncated
+MAX_PAGE_BYTES = int(float(os.environ.get("MAX_PAGE_MB", "5")) * 1024 * 1024)
+#bytes looked at for a <meta charset> before decoding starts
+SNIFF_BYTES = 4096
+CHUNK_SIZE = 64 * 1024
+
+#anything else is not read at all
+HTML_CONTENT_TYPES = frozenset(["text/html", "application/xhtml+xml", "text/plain", ""])
+
+BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+HEADER_CHARSET = re.compile(r"charset\s*=\s*[\"']?([\w.:-]+)", re.I)
+META_CHARSET = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.I)
+XML_ENCODING = re.compile(rb"^<\?xml[^>]+encoding\s*=\s*[\"']([\w.:-]+)", re.I)
+
+
+def known_codec(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+class BodyReader:
+    #reads a response body chunk by chunk up to max_bytes, decoding as it goes.
+    #encoding: BOM, then the Content-Type charset, then <meta charset> in the first bytes, then utf-8
+    def __init__(self, content_type: Optional[str], max_bytes: int = MAX_PAGE_BYTES):
+        self.content_type = (content_type or "").split(";")[0].strip().lower()
+        match = HEADER_CHARSET.search(content_type or "")
+        self.header_encoding = known_codec(match.group(1)) if match else None
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.truncated = False
+        self.encoding = None
+        self.decoder = None
+        self.head = b""
+        self.parts = []
+
+    def rejected(self) -> Optional[str]:
+        #reason not to read the body at all
+        if self.content_type not in HTML_CONTENT_TYPES:
+            return f"Unsupported content type: {self.content_type}"
+        return None
+
+    def feed(self, chunk: bytes) -> bool:
+        #False once the cap is reached, the caller stops reading and closes the response
+        room = self.max_bytes - self.size
+        if len(chunk) > room:
+            chunk = chunk[:room]
+            self.truncated = True
+        self.size += len(chunk)
+        self.consume(chunk)
+        return not self.truncated
+
+    def consume(self, chunk: bytes):
+        if self.decoder is None:
+            self.head += chunk
+            if len(self.head) >= SNIFF_BYTES or self.truncated:
+                self._start_decoding()
+        elif chunk:
+            self.parts.append(self.decoder.decode(chunk))
+
+    def _start_decoding(self):
+        for bom, encoding in BOMS:
+            if self.head.startswith(bom):
+                self.encoding = encoding
+                break
+        else:
+            sniffed = META_CHARSET.search(self.head[:SNIFF_BYTES]) or XML_ENCODING.search(self.head[:SNIFF_BYTES])
+            self.encoding = (self.header_encoding
+                             or known_codec(sniffed.group(1).decode("ascii", "ignore") if sniffed else None)
+                             or "utf-8")
+        self.decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        self.parts.append(self.decoder.decode(self.head))
+        self.head = b""
+
+    def text(self) -> str:
+        if self.decoder is None:
+            self._start_decoding()
+        #a character cut in half by the cap is dropped rather than replaced
+        if not self.truncated:
+            self.parts.append(self.decoder.decode(b"", final=True))
+        return "".join(self.parts)
+
+    def info(self) -> dict:
+        return {
+            "content_type": self.content_type,
+            "encoding": self.encoding,
+            "bytes": self.size,
+            "truncated": self.truncated,
+        }
+
+
+class RawBodyReader(BodyReader):
+    #the same cap for bodies kept as bytes whatever their content type (sitemaps, gzipped or not)
+    def rejected(self) -> Optional[str]:
+        return None
+
+    def consume(self, chunk: bytes):
+        self.parts.append(chunk)
+
+    def content(self) -> bytes:
+        return b"".join(self.parts)
+
+
+def read_body(response, max_bytes: int = MAX_PAGE_BYTES) -> Tuple[str, dict]:
+    #(html, fetch info) of a streamed requests response, which is closed afterwards
+    reader = BodyReader(response.headers.get("Content-Type"), max_bytes)
+    try:
+        rejected = reader.rejected()
+        if rejected:
+            return "", {**reader.info(), "rejected": rejected}
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if not reader.feed(chunk):
+                break
+        return reader.text(), reader.info()
+    finally:
+        response.close()
+
+
+async def read_body_async(response, max_bytes: int = MAX_PAGE_BYTES) -> Tuple[str, dict]:
+    #same for a streamed httpx response
+    reader = BodyReader(response.headers.get("Content-Type"), max_bytes)
+    try:
+        rejected = reader.rejected()
+        if rejected:
+            return "", {**reader.info(), "rejected": rejected}
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            if not reader.feed(chunk):
+                break
+        return reader.text(), reader.info()
+    finally:
+        await response.aclose()
+
+
+async def read_raw_async(response, max_bytes: int = MAX_PAGE_BYTES) -> Tuple[bytes, dict]:
+    #(body bytes, fetch info) of a streamed httpx response up to max_bytes, closed afterwards
+    reader = RawBodyReader(response.headers.get("Content-Type"), max_bytes)
+    try:
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            if not reader.feed(chunk):
+                break
+        return reader.content(), reader.info()
+    finally:
+        await response.aclose()
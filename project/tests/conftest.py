@@ -0,0 +1,146 @@
+import os
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#read when the modules are imported: no robots.txt requests, no pacing and no retries unless a test
+#builds its own scheduler, extraction in a thread
+os.environ.setdefault("RESPECT_ROBOTS", "0")
+os.environ.setdefault("HOST_RATE", "1000")
+os.environ.setdefault("HOST_BURST", "1000")
+os.environ.setdefault("FETCH_RETRIES", "0")
+os.environ.setdefault("EXTRACTION_WORKERS", "0")
+#a small size cap, the truncation tests serve bodies over it
+os.environ.setdefault("MAX_PAGE_MB", "0.25")
+
+PRODUCT_PAGE = """<html><head><title>Trail Runner 2</title>
+<meta name="description" content="Lightweight trail running shoe">
+<script type="application/ld+json">{"@context": "https://schema.org", "@type": "Product", "name": "Trail Runner 2",
+"offers": {"@type": "Offer", "price": "129.00", "priceCurrency": "EUR"}}</script></head>
+<body><h1>Trail Runner 2</h1><p class="price">129.00 EUR</p>
+<ul><li>Grippy outsole for wet rock</li><li>Breathable mesh upper</li></ul>
+<p>A light shoe for long days in the mountains, with a rock plate and a soft midsole.</p></body></html>"""
+
+
+def response(status=200, body=b"", headers=None, delay=0.0):
+    #one answer of a stub route. body: str, bytes, or an iterable of byte chunks sent without a Content-Length
+    return {"status": status, "body": body, "headers": headers or {}, "delay": delay}
+
+
+def endless_body(chunks, chunk_size=64 * 1024):
+    #a streamed html body of chunks paragraphs, for bodies far over the size cap
+    chunk = b"<p>" + b"x" * (chunk_size - 7) + b"</p>"
+    for _ in range(chunks):
+        yield chunk
+
+
+class StubServer:
+    #threaded http server on a free local port. A route answers with its responses in turn, repeating
+    #the last one; the query string is ignored. Tracks hits per path and the most requests waiting
+    #for their response at once
+    def __init__(self):
+        self.routes = {}
+        self.hits = {}
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.server.daemon_threads = True
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        return self.base + path
+
+    def route(self, path: str, *responses):
+        self.routes[path] = list(responses) or [response()]
+
+    def next_response(self, path: str):
+        with self.lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+            responses = self.routes.get(path)
+            if not responses:
+                return response(404, "not found")
+            return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                answer = stub.next_response(self.path.split("?")[0])
+                with stub.lock:
+                    stub.waiting += 1
+                    stub.peak_waiting = max(stub.peak_waiting, stub.waiting)
+                time.sleep(answer["delay"])
+                with stub.lock:
+                    stub.waiting -= 1
+                body = answer["body"]
+                if isinstance(body, str):
+                    body = body.encode("utf-8")
+                headers = {"Content-Type": "text/html; charset=utf-8", **answer["headers"]}
+                try:
+                    self.send_response(answer["status"])
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    if isinstance(body, bytes):
+                        self.send_header("Content-Length", str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+                        return
+                    #streamed body, the connection is closed at the end
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.close_connection = True
+                    for chunk in body:
+                        self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    #the client stopped reading, as it does at the size cap
+                    self.close_connection = True
+
+        return Handler
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def closed_port_url():
+    #a local port nothing listens on
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/gone"
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory):
+    #the app with its data folder in a temporary directory, startup and shutdown hooks run
+    from fastapi.testclient import TestClient
+    os.environ["DATA_FOLDER"] = str(tmp_path_factory.mktemp("api"))
+    import main
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+
+import batch
+from batch import BatchCrawler, create_http_client, interleave_hosts
+from conftest import PRODUCT_PAGE, response
+from crawler import ProductCrawler
+
+
+def serve_products(stub, count, delay=0.0):
+    for i in range(count):
+        stub.route(f"/p/{i}", response(body=PRODUCT_PAGE.replace("Trail Runner 2", f"Trail Runner {i}"),
+                                       delay=delay))
+    return [stub.url(f"/p/{i}") for i in range(count)]
+
+
+def test_max_concurrency_bounds_requests_in_flight(api, stub):
+    urls = serve_products(stub, 8, delay=0.2)
+    body = api.post("/crawl_batch", json={"urls": urls, "max_concurrency": 2, "per_host_concurrency": 8}).json()
+    assert body["crawled"] + body["duplicates"] == 8
+    assert stub.peak_waiting == 2
+
+
+def test_per_host_concurrency_bounds_requests_in_flight(api, stub):
+    urls = serve_products(stub, 8, delay=0.2)
+    body = api.post("/crawl_batch", json={"urls": urls, "max_concurrency": 8, "per_host_concurrency": 3}).json()
+    assert body["crawled"] + body["duplicates"] == 8
+    assert stub.peak_waiting == 3
+
+
+def test_failed_pages_are_reported_per_url(api, stub, closed_port_url):
+    urls = serve_products(stub, 2)
+    stub.route("/missing", response(404, "not found"))
+    stub.route("/image", response(body=b"\x89PNG", headers={"Content-Type": "image/png"}))
+    failing = [stub.url("/missing"), stub.url("/image"), closed_port_url]
+    body = api.post("/crawl_batch", json={"urls": urls + failing}).json()
+    assert body["failed"] == 3
+    assert body["crawled"] + body["duplicates"] == 2
+    errors = {entry["url"]: entry["error"] for entry in body["results"] if "error" in entry}
+    assert set(errors) == set(failing)
+    assert "404" in errors[stub.url("/missing")]
+    assert "image/png" in errors[stub.url("/image")]
+
+
+def test_streamed_batch_ends_with_totals(api, stub):
+    urls = serve_products(stub, 3) + [stub.url("/missing")]
+    lines = api.post("/crawl_batch", json={"urls": urls, "stream": True}).text.splitlines()
+    assert len(lines) == 5
+    assert '"failed":1' in lines[-1].replace(" ", "")
+
+
+def test_concurrency_limits_are_validated(api):
+    for field, value in (("max_concurrency", 0), ("per_host_concurrency", -1), ("max_concurrency", 10 ** 6)):
+        rejected = api.post("/crawl_batch", json={"urls": ["http://127.0.0.1/"], field: value})
+        assert rejected.status_code == 422
+
+
+def test_crawl_product_errors(api, stub, closed_port_url):
+    stub.route("/missing", response(404, "not found"))
+    assert api.post("/crawl_product", json={"url": stub.url("/missing")}).status_code == 400
+    assert api.post("/crawl_product", json={"url": closed_port_url}).status_code == 500
+    stub.route("/p", response(body=PRODUCT_PAGE))
+    crawled = api.post("/crawl_product", json={"url": stub.url("/p"), "fields": "product.name"}).json()
+    assert crawled["data"] == {"product": {"name": "Trail Runner 2"}}
+
+
+class HeldPages:
+    #pages fetched and not yet extracted, counted as the batch reads bodies and extracts them
+    def __init__(self, monkeypatch, extract_delay):
+        self.lock = threading.Lock()
+        self.held = self.peak = 0
+        read_body_async, extract = batch.read_body_async, ProductCrawler.extract
+
+        async def counted_read(response):
+            body = await read_body_async(response)
+            with self.lock:
+                self.held += 1
+                self.peak = max(self.peak, self.held)
+            return body
+
+        def slow_extract(crawler, load_time, **kwargs):
+            time.sleep(extract_delay)
+            with self.lock:
+                self.held -= 1
+            return extract(crawler, load_time, **kwargs)
+
+        monkeypatch.setattr(batch, "read_body_async", counted_read)
+        monkeypatch.setattr(ProductCrawler, "extract", slow_extract)
+
+
+def crawl(urls, **kwargs):
+    async def run():
+        async with create_http_client() as client:
+            return [result async for _, result in BatchCrawler(client, **kwargs).crawl_all(urls)]
+    return asyncio.run(run())
+
+
+def test_pages_in_flight_are_bounded_until_extracted(stub, monkeypatch):
+    pages = HeldPages(monkeypatch, extract_delay=0.05)
+    results = crawl(serve_products(stub, 12), max_concurrency=3, per_host_concurrency=3)
+    assert len(results) == 12 and not any("error" in result for result in results)
+    assert pages.peak <= 3
+
+
+def test_hosts_are_interleaved():
+    urls = ["http://a/1", "http://a/2", "http://a/3", "http://b/1", "http://c/1", "http://c/2"]
+    assert interleave_hosts(urls) == ["http://a/1", "http://b/1", "http://c/1", "http://a/2", "http://c/2",
+                                      "http://a/3"]
+
+
+class SlowPool:
+    #stands in for ExtractionPool: its slots, extraction in a thread
+    def __init__(self, slots):
+        self.slots = asyncio.Semaphore(slots)
+
+    async def extract(self, crawler, load_time, count_nodes=False):
+        return await asyncio.to_thread(crawler.extract, load_time, timings=True, count_nodes=count_nodes)
+
+
+def test_pool_slots_bound_pages_before_they_are_fetched(stub, monkeypatch):
+    pages = HeldPages(monkeypatch, extract_delay=0.05)
+    results = crawl(serve_products(stub, 12), max_concurrency=10, per_host_concurrency=10, pool=SlowPool(2))
+    assert len(results) == 12 and not any("error" in result for result in results)
+    assert pages.peak <= 2
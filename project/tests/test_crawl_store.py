@@ -0,0 +1,99 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import PRODUCT_PAGE
+from crawl_store import LARGE_FIELDS, CrawlStore
+from crawler import ProductCrawler
+from serialization import unpack
+
+PROJECT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def crawl_result(url, timestamp="2026-03-01T10:00:00"):
+    result = ProductCrawler.from_html(url, PRODUCT_PAGE).extract(0)
+    result["page_info"]["crawl_timestamp"] = timestamp
+    return result
+
+
+def test_large_fields_are_stored_apart_and_loaded_on_request(tmp_path):
+    store = CrawlStore(str(tmp_path / "crawls.sqlite"))
+    result = crawl_result("https://shop.example.com/p/1")
+    crawl_id = store.save(result)
+    row = store.db.execute("SELECT data FROM crawls WHERE id = ?", (crawl_id,)).fetchone()[0]
+    assert set(unpack(row)) == set(result) - set(LARGE_FIELDS)
+    assert store.get(crawl_id) == {**result, "crawl_id": crawl_id}
+    assert store.get(crawl_id, ()) == {**{k: v for k, v in result.items() if k not in LARGE_FIELDS},
+                                       "crawl_id": crawl_id}
+    assert set(store.get(crawl_id, ("links",))) - set(result) == {"crawl_id"}
+    assert "clean_text" not in store.get(crawl_id, ("links",))
+    assert store.load_field(crawl_id, "clean_text") == result["clean_text"]
+
+
+def test_history_queries(tmp_path):
+    store = CrawlStore(str(tmp_path / "crawls.sqlite"))
+    url, other = "https://shop.example.com/p/1", "https://shop.example.com/p/2"
+    ids = [store.save(crawl_result(url, f"2026-03-0{day}T10:00:00")) for day in (1, 2, 3)]
+    store.save(crawl_result(other, "2026-03-02T12:00:00"))
+    store.save(crawl_result("https://elsewhere.example.com/p", "2026-03-02T12:00:00"))
+    for crawl_id, score in zip(ids, (40, 50, 60)):
+        store.set_score(crawl_id, {"final_score": score, "ai_readiness_pct": score}, "v1")
+
+    assert store.latest(url, ())["crawl_id"] == ids[-1]
+    assert [c["crawl_id"] for c in store.list_crawls(url=url)] == ids[::-1]
+    assert len(store.list_crawls(domain="shop.example.com")) == 4
+    assert [c["url"] for c in store.list_crawls(min_score=45)] == [url, url]
+    assert [p["final_score"] for p in store.score_series(url=url)] == [40, 50, 60]
+    assert [p["crawl_id"] for p in store.score_series(url=url, since="2026-03-02", limit=1)] == [ids[-1]]
+    daily = store.daily_scores(domain="shop.example.com")
+    assert [(d["date"], d["crawls"], d["scored"]) for d in daily] == [
+        ("2026-03-01", 1, 1), ("2026-03-02", 2, 1), ("2026-03-03", 1, 1)]
+    assert store.crawl_at(url, "2026-03-02T23:00:00") == ids[1]
+    assert store.crawl_at(url, "2026-02-01T00:00:00") == ids[0]
+
+
+def test_latest_crawl_endpoint(api):
+    import main
+    url = "https://shop.example.com/p/latest"
+    main.crawl_store.save(crawl_result(url, "2026-03-01T10:00:00"))
+    newest = main.crawl_store.save(crawl_result(url, "2026-03-02T10:00:00"))
+    latest = api.get("/crawls/latest", params={"url": url}).json()
+    assert latest["crawl_id"] == newest
+    assert "links" in latest and "clean_text" not in latest
+    assert "clean_text" in api.get("/crawls/latest", params={"url": url, "include_text": True}).json()
+    assert api.get("/crawls/latest", params={"url": url, "fields": "product.name"}).json() == {
+        "product": {"name": "Trail Runner 2"}}
+    assert api.get("/crawls/latest", params={"url": url + "/none"}).status_code == 404
+
+
+def test_migration_cli_imports_json_files(tmp_path):
+    for i in range(3):
+        result = crawl_result(f"https://shop.example.com/p/{i}")
+        (tmp_path / f"crawl_{i}.json").write_text(json.dumps(result), encoding="utf-8")
+    (tmp_path / "notes.json").write_text("{}", encoding="utf-8")
+
+    def migrate(*args):
+        return subprocess.run([sys.executable, os.path.join(PROJECT, "crawl_store.py"), str(tmp_path), *args],
+                              capture_output=True, text=True, check=True).stdout
+
+    assert "imported 3 crawl files" in migrate()
+    #a second run skips what is in the store, then removes the imported files
+    assert "imported 0 crawl files" in migrate("--remove-imported", "--vacuum")
+    assert (tmp_path / "notes.json").exists()
+    assert not list(tmp_path.glob("crawl_*.json"))
+    store = CrawlStore(str(tmp_path / "crawls.sqlite"))
+    assert store.find_by_file("crawl_1.json")["page_info"]["url"] == "https://shop.example.com/p/1"
+
+
+def test_stores_are_opened_on_startup_in_the_data_folder(tmp_path):
+    folder, cwd = tmp_path / "stores", tmp_path / "cwd"
+    cwd.mkdir()
+    run = lambda code: subprocess.run([sys.executable, "-c", code], cwd=cwd, check=True,
+                                      env={**os.environ, "DATA_FOLDER": str(folder), "PYTHONPATH": PROJECT})
+    run("import main")
+    assert not folder.exists()
+    run("import main\nfrom fastapi.testclient import TestClient\nwith TestClient(main.app): pass")
+    assert {"crawls.sqlite", "jobs.sqlite", "scores.sqlite"} <= set(os.listdir(folder))
+    #nothing is written relative to the working directory
+    assert os.listdir(cwd) == []
@@ -0,0 +1,131 @@
+import os
+import sys
+
+import pytest
+
+from conftest import PRODUCT_PAGE
+from crawler import ProductCrawler, page_structure
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from bench_parse import LegacyExtraction, SingleParseExtraction  # noqa: E402
+from pages import CORPUS  # noqa: E402
+
+#nested lists and tables in the page chrome: features never come from it, specifications not from nav or footer
+CHROME = """<header><h2>Acme Outdoor Store</h2>
+<nav><ul><li>Running shoes for men</li><li>Running shoes for women
+<ul><li>Trail running shoes</li><li>Road running shoes</li></ul></li></ul></nav>
+<table><tr><td>Store hours</td><td>9 to 18</td></tr><tr><td>Store phone</td><td>555 0100</td></tr></table>
+</header>"""
+FOOTER = """<footer><h4>Help</h4>
+<ul><li>Shipping and delivery</li><li>Returns and refunds</li></ul>
+<nav><table><tr><td>Company</td><td>Acme Ltd</td></tr><tr><td>Registered</td><td>Berlin</td></tr></table></nav>
+</footer>"""
+#nested lists and tables in the main content, each one a candidate of its own
+CONTENT = """<main><h1>Trail Runner 2</h1>
+<ul><li>Grippy outsole for wet rock</li>
+<li>Breathable mesh upper<ul><li>Recycled polyester yarn</li><li>Quick drying after rain</li></ul></li>
+<li>Rock plate under the forefoot</li></ul>
+<h3>Specifications</h3>
+<table><thead><tr><th>Weight</th><th>290 g</th></tr></thead>
+<tbody><tr><td>Drop</td><td>6 mm</td></tr>
+<tr><td colspan="2"><table><tr><td>Upper</td><td>Mesh</td></tr><tr><td>Outsole</td><td>Rubber</td></tr></table></td></tr>
+</tbody></table>
+<h2>Reviews</h2></main>"""
+
+
+def crawler(html=PRODUCT_PAGE):
+    return ProductCrawler.from_html("https://shop.example.com/p", html)
+
+
+def parsed(*parts):
+    page = crawler("<html><body>" + "".join(parts) + "</body></html>")
+    page.parse()
+    return page
+
+
+def test_page_info_reports_the_extraction_mode_used(monkeypatch):
+    extract_clean_text = ProductCrawler.extract_clean_text
+    monkeypatch.setattr(ProductCrawler, "extract_clean_text", lambda crawler: extract_clean_text(crawler, "never"))
+    page_info = crawler().extract(0)["page_info"]
+    assert page_info["content_extraction"] == "never"
+    assert page_info["clean_text_source"] == "raw"
+
+
+def test_headings_are_in_document_order():
+    page = parsed(CHROME, CONTENT, FOOTER)
+    headings = page.extract_headings()
+    assert [(h["level"], h["text"]) for h in headings] == [
+        ("h2", "Acme Outdoor Store"), ("h1", "Trail Runner 2"), ("h3", "Specifications"), ("h2", "Reviews"),
+        ("h4", "Help")]
+    #positions count the lists and tables in between, chrome ones included
+    assert [h["position"] for h in headings] == [0, 4, 7, 10, 11]
+
+
+def test_nested_lists_are_read_once():
+    features = parsed(CHROME, CONTENT, FOOTER).extract_features()
+    #the nested items are not part of their parent item's text and are not listed twice
+    assert features == ["Grippy outsole for wet rock", "Breathable mesh upper", "Rock plate under the forefoot",
+                        "Recycled polyester yarn", "Quick drying after rain"]
+    assert parsed(CHROME, FOOTER).extract_features() == []
+
+
+def test_nested_tables_are_read_once():
+    specs = parsed(CHROME, CONTENT, FOOTER).extract_specifications()
+    #header tables are candidates, nav and footer ones are not
+    assert specs == {"Store hours": "9 to 18", "Store phone": "555 0100", "Weight": "290 g", "Drop": "6 mm",
+                     "Upper": "Mesh", "Outsole": "Rubber"}
+    assert len(page_structure(parsed(CONTENT).tree).tables) == 2
+
+
+def test_chrome_ends_where_its_container_does():
+    #a list right after a nav with a nested list is content again
+    page = parsed(CHROME, "<ul><li>Vibram megagrip outsole</li><li>Gusseted tongue keeps grit out</li></ul>")
+    assert page.extract_features() == ["Vibram megagrip outsole", "Gusseted tongue keeps grit out"]
+
+
+@pytest.fixture(scope="module", params=sorted(CORPUS))
+def corpus_page(request):
+    #a benchmark page through the old BeautifulSoup extractors and the single-parse ones
+    html = CORPUS[request.param]()
+    legacy, single = LegacyExtraction(html), SingleParseExtraction(html)
+    legacy.parse()
+    single.parse()
+    return request.param, legacy, single
+
+
+def test_single_parse_matches_the_old_extractors(corpus_page):
+    _, legacy, single = corpus_page
+    assert single.metadata() == legacy.metadata()
+    products = [item for item in single.crawler.extract_schema() if item.get("@type") == "Product"]
+    assert products == legacy.schema()
+    headings, features, specs = single.structure()
+    #the new results carry more (positions, link lists, extra trust signals), what both have is the same
+    assert ([{"level": h["level"], "text": h["text"]} for h in headings], features, specs) == legacy.structure()
+    internal, external = single.links()
+    assert ({link["url"]: link["anchor_text"] for link in internal},
+            {link["url"]: link["anchor_text"] for link in external}) == legacy.links()
+    trust = single.trust()
+    assert {key: trust[key] for key in legacy.trust()} == legacy.trust()
+
+
+def test_clean_text_always_mode_matches_the_old_extractor(corpus_page):
+    _, legacy, single = corpus_page
+    assert single.crawler.extract_clean_text("always") == legacy.clean_text()
+
+
+def test_clean_text_adaptive_mode(corpus_page):
+    name, legacy, single = corpus_page
+    text, words = single.crawler.extract_clean_text("adaptive")
+    if name != "list_heavy":
+        assert (text, words) == legacy.clean_text()
+        return
+    #the one corpus page that differs. Readability's article is under READABLE_SHARE of the page text, so
+    #the old extractor kept the raw text of the whole page. The main block holds over MAIN_BLOCK_SHARE of
+    #it and adaptive mode keeps that: the same text without the title, the nav links and the footer
+    legacy_text, legacy_words = legacy.clean_text()
+    chrome = ("Acme Runner Shoe | Acme Store Home About us Contact",
+              "Secure payment. Cash on delivery available. Call +91 98765 43210 or write to care@example.com."
+              " 30 day return policy. Footer table ignored rows")
+    assert single.crawler.clean_text_source == "main_block"
+    assert legacy_text == f"{chrome[0]} {text} {chrome[1]}"
+    assert legacy_words - words == len(" ".join(chrome).split())
@@ -0,0 +1,73 @@
+import asyncio
+import os
+
+from batch import BatchCrawler, create_http_client
+from conftest import PRODUCT_PAGE, response
+from html_cache import HtmlCache
+
+
+def product(name):
+    return PRODUCT_PAGE.replace("Trail Runner 2", name)
+
+
+def crawl(cache, *urls):
+    #one page after the other, so the cache sees them in that order
+    async def run():
+        async with create_http_client() as client:
+            crawler = BatchCrawler(client, cache=cache)
+            return [await crawler.crawl_page(url) for url in urls]
+    return asyncio.run(run())
+
+
+def cached_urls(cache):
+    return {url for url, in cache.db.execute("SELECT url FROM entries")}
+
+
+def test_not_modified_page_reuses_the_extraction(tmp_path, stub):
+    stub.route("/p", response(body=product("Trail Runner 7"), headers={"ETag": '"v1"'}), response(304))
+    cache = HtmlCache(str(tmp_path))
+    first, second = crawl(cache, stub.url("/p"), stub.url("/p"))
+    assert "cache_status" not in first["page_info"]
+    assert second["page_info"]["cache_status"] == "not_modified"
+    assert second["product"]["name"] == "Trail Runner 7"
+    assert cache.conditional_headers(cache.get(stub.url("/p"))) == {"If-None-Match": '"v1"'}
+
+
+def test_same_body_is_reused_and_a_changed_one_extracted(tmp_path, stub):
+    stub.route("/p", response(body=product("Trail Runner 7")), response(body=product("Trail Runner 7")),
+               response(body=product("Trail Runner 8")))
+    cache = HtmlCache(str(tmp_path))
+    _, unchanged, changed = crawl(cache, stub.url("/p"), stub.url("/p"), stub.url("/p"))
+    assert unchanged["page_info"]["cache_status"] == "unchanged"
+    assert "cache_status" not in changed["page_info"]
+    assert changed["product"]["name"] == "Trail Runner 8"
+    #the replaced body is dropped, only the current one is stored
+    assert cache.db.execute("SELECT COUNT(*) FROM bodies").fetchone()[0] == 1
+    assert cache.stored_bytes == os.path.getsize(cache.object_path(changed["page_info"]["content_hash"]))
+
+
+def test_expired_entries_are_swept(tmp_path, stub):
+    for name in ("a", "b", "c"):
+        stub.route(f"/{name}", response(body=product(f"Runner {name}")))
+    cache = HtmlCache(str(tmp_path), ttl=60)
+    expired, kept = crawl(cache, stub.url("/a"), stub.url("/b"))
+    cache.db.execute("UPDATE entries SET fetched_at = fetched_at - 120 WHERE url = ?", (stub.url("/a"),))
+    cache.last_expiry = 0
+    crawl(cache, stub.url("/c"))
+    assert cached_urls(cache) == {stub.url("/b"), stub.url("/c")}
+    assert not os.path.exists(cache.object_path(expired["page_info"]["content_hash"]))
+    assert os.path.exists(cache.object_path(kept["page_info"]["content_hash"]))
+
+
+def test_least_recently_used_pages_are_evicted_over_the_budget(tmp_path, stub):
+    for name in ("a", "b", "c"):
+        stub.route(f"/{name}", response(body=product(f"Runner {name}")))
+    cache = HtmlCache(str(tmp_path))
+    crawl(cache, stub.url("/a"), stub.url("/b"))
+    #room for two and a half bodies, /a is used again before /c comes in
+    cache.max_bytes = cache.stored_bytes * 5 // 4
+    assert crawl(cache, stub.url("/a"))[0]["page_info"]["cache_status"] == "unchanged"
+    crawl(cache, stub.url("/c"))
+    assert cached_urls(cache) == {stub.url("/a"), stub.url("/c")}
+    assert cache.stored_bytes <= cache.max_bytes
+    assert cache.stored_bytes == sum(size for size, in cache.db.execute("SELECT size FROM bodies"))
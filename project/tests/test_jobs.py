@@ -0,0 +1,90 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import job_queue
+from job_queue import CALLBACK_ATTEMPTS, JobQueue, JobWorkers, QueueFull
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite"), max_queued=3)
+
+
+def test_identical_pending_jobs_are_merged(queue):
+    job_id, existing = queue.submit("crawl", {"url": "https://a/p"}, "crawl:https://a/p")
+    assert not existing
+    #a more urgent duplicate is merged into the queued job and moves it up
+    assert queue.submit("crawl", {"url": "https://a/p"}, "crawl:https://a/p", priority=5) == (job_id, True)
+    assert queue.get(job_id)["priority"] == 5
+    #the partial unique index holds it for running jobs too
+    queue.claim()
+    with pytest.raises(sqlite3.IntegrityError):
+        queue.db.execute("INSERT INTO jobs (kind, payload, dedup_key, created_at) VALUES ('crawl', '{}', ?, 0)",
+                         ("crawl:https://a/p",))
+    assert queue.submit("crawl", {"url": "https://a/p"}, "crawl:https://a/p") == (job_id, True)
+    #once finished, the same page can be queued again
+    queue.finish(job_id, {"ok": True})
+    assert queue.submit("crawl", {"url": "https://a/p"}, "crawl:https://a/p")[1] is False
+
+
+def test_jobs_are_claimed_by_priority_then_age(queue):
+    low, _ = queue.submit("score", {}, "score:1")
+    high, _ = queue.submit("score", {}, "score:2", priority=2)
+    later_low, _ = queue.submit("score", {}, "score:3")
+    assert queue.get(later_low)["position"] == 2
+    with pytest.raises(QueueFull):
+        queue.submit("score", {}, "score:4")
+    assert [queue.claim()[0] for _ in range(3)] == [high, low, later_low]
+    assert queue.claim() is None
+
+
+def test_running_jobs_are_requeued_on_start(queue):
+    job_id, _ = queue.submit("score", {"n": 1}, "score:1")
+    other, _ = queue.submit("context", {}, "context:1")
+    #claimed by a process that stopped before finishing them
+    queue.claim()
+    queue.claim()
+
+    async def handle(payload):
+        return {"doubled": payload["n"] * 2}
+
+    async def run():
+        workers = JobWorkers(queue, {"score": handle}, concurrency=1)
+        workers.start()
+        try:
+            while queue.get(job_id)["state"] != "done":
+                await asyncio.sleep(0.01)
+        finally:
+            await workers.stop()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    job = queue.get(job_id)
+    assert job["result"] == {"doubled": 2} and job["attempts"] == 2
+    #kinds this process does not run are left to the process that does
+    assert queue.get(other)["state"] == "running"
+
+
+def test_failed_callback_is_not_waited_on_after_the_last_attempt(queue, stub, monkeypatch):
+    waits = []
+    monkeypatch.setattr(job_queue, "backoff_delay", lambda attempt: waits.append(attempt) or 0)
+    #the stub server answers POST with 501
+    job_id, _ = queue.submit("score", {}, "score:1", callback_url=stub.url("/hook"))
+    queue.finish(job_id, {"ok": True})
+
+    async def send():
+        workers = JobWorkers(queue, {})
+        await workers.send_callbacks(job_id)
+        await workers.stop()
+
+    asyncio.run(send())
+    assert waits == list(range(CALLBACK_ATTEMPTS - 1))
+    assert "501" in queue.get(job_id)["callbacks"][0]["error"]
+
+
+def test_crawl_job_with_a_malformed_url_is_rejected(api):
+    for url in ("https://shop.example.com:99999/p", "https://[::1/p"):
+        rejected = api.post("/jobs", json={"kind": "crawl", "url": url})
+        assert rejected.status_code == 400
+        assert "Invalid url" in rejected.json()["detail"]
@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+from llm_context import LLMContextBuilder, register_tokenizer, token_counter
+
+WORDS = ("trail", "runner", "shoe", "grip", "outsole", "mesh", "upper", "midsole", "rock", "plate", "light",
+         "waterproof", "the", "with", "for", "and", "mountains", "29.5", "cm", "EUR", "(men's)", "—", "x-ray")
+
+
+def crawl_data(seed):
+    rng = random.Random(seed)
+    sentence = lambda: " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40))).capitalize() + "."
+    return {
+        "product": {"name": "Trail Runner 2", "brand": "Acme"},
+        "page_info": {"title": "Trail Runner 2 by Acme"},
+        "content": {
+            "features": [sentence() for _ in range(rng.randint(0, 10))],
+            "specifications": {f"spec {i}": sentence() for i in range(rng.randint(0, 8))},
+        },
+        "clean_text": " ".join(sentence() for _ in range(rng.randint(0, 80))),
+    }
+
+
+@pytest.fixture(params=["approx", "tiktoken", "chars"])
+def tokenizer(request):
+    if request.param == "tiktoken":
+        pytest.importorskip("tiktoken")
+    if request.param == "chars":
+        #a registered tokenizer much finer than the others, one token per character
+        register_tokenizer("chars", lambda: len)
+    return request.param
+
+
+@pytest.mark.parametrize("budget", [8, 40, 120, 300])
+def test_excerpt_stays_within_the_token_budget(tokenizer, budget):
+    count = token_counter(tokenizer)
+    for seed in range(40):
+        excerpt = LLMContextBuilder(crawl_data(seed), {}, budget=budget, tokenizer=tokenizer).get_excerpt()
+        assert count(excerpt) <= budget
+
+
+def test_excerpt_uses_most_of_the_budget():
+    data = crawl_data(1)
+    data["clean_text"] = " ".join(f"The Trail Runner 2 grips on wet rock number {i}." for i in range(200))
+    excerpt = LLMContextBuilder(data, {}, budget=200, tokenizer="approx").get_excerpt()
+    assert 150 <= token_counter("approx")(excerpt) <= 200
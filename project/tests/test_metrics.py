@@ -0,0 +1,26 @@
+from conftest import PRODUCT_PAGE, response
+from crawler import ProductCrawler
+
+
+def extract(**kwargs):
+    return ProductCrawler.from_html("https://shop.example.com/p", PRODUCT_PAGE).extract(0, **kwargs)
+
+
+def test_stages_are_timed_only_when_asked_for():
+    assert "timings" not in extract()
+    timings = extract(timings=True)["timings"]
+    assert {"parse", "schema", "clean_text", "page_bytes"} <= set(timings)
+    #the element count is one more walk of the tree, it needs asking for on its own
+    assert "page_nodes" not in timings
+    assert extract(timings=True, count_nodes=True)["timings"]["page_nodes"] > 10
+
+
+def test_crawl_product_includes_timings_when_asked(api, stub):
+    #two pages, a reused page from the html cache has no timings of its own
+    stub.route("/plain", response(body=PRODUCT_PAGE))
+    stub.route("/timed", response(body=PRODUCT_PAGE))
+    plain = api.post("/crawl_product", json={"url": stub.url("/plain")}).json()["data"]
+    assert "timings" not in plain
+    timed = api.post("/crawl_product", json={"url": stub.url("/timed"), "include_timings": True}).json()["data"]
+    assert timed["timings"]["page_nodes"] > 10
+    assert "crawler_stage_seconds" in api.get("/metrics").text
@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+from conftest import PRODUCT_PAGE
+from crawl_store import CrawlStore
+from crawler import ProductCrawler
+from near_duplicates import NEAR_DUPLICATE_DISTANCE, NearDuplicateIndex, distance
+
+DESCRIPTION = ("<p>A light shoe for long days in the mountains with a rock plate, a soft midsole, a grippy outsole "
+               "for wet rock and a breathable mesh upper that dries quickly after a river crossing.</p>")
+
+
+def test_band_lookup_finds_every_pair_within_the_distance(tmp_path):
+    rng = random.Random(7)
+    index = NearDuplicateIndex(str(tmp_path / "fingerprints.sqlite"))
+    fingerprints = {}
+    for i in range(150):
+        base = rng.getrandbits(64)
+        fingerprints[f"https://a/{i}"] = base
+        #variants from identical up to a bit past the distance
+        for j in range(3):
+            flips = rng.sample(range(64), rng.randint(0, NEAR_DUPLICATE_DISTANCE + 1))
+            fingerprints[f"https://a/{i}/{j}"] = base ^ sum(1 << bit for bit in flips)
+    for url, fingerprint in fingerprints.items():
+        index.add(url, fingerprint)
+    for url, fingerprint in fingerprints.items():
+        expected = {other for other, value in fingerprints.items()
+                    if other != url and distance(fingerprint, value) <= NEAR_DUPLICATE_DISTANCE}
+        found = index.find(fingerprint, exclude_url=url, limit=len(fingerprints))
+        assert {match.url for match in found} == expected
+        assert [match.distance for match in found] == sorted(match.distance for match in found)
+
+
+def crawl_result(url, colour):
+    html = PRODUCT_PAGE.replace("</body>", DESCRIPTION.replace("light shoe", f"light {colour} shoe") + "</body>")
+    return ProductCrawler.from_html(url, html).extract(0)
+
+
+@pytest.fixture
+def stores(tmp_path):
+    return CrawlStore(str(tmp_path / "crawls.sqlite")), NearDuplicateIndex(str(tmp_path / "fingerprints.sqlite"))
+
+
+def stored_urls(store):
+    return [crawl["url"] for crawl in store.list_crawls()]
+
+
+def test_keep_stores_variants_in_one_group(stores):
+    store, index = stores
+    first, _ = index.record(store, crawl_result("https://shop/p?colour=red", "red"), "keep")
+    second, match = index.record(store, crawl_result("https://shop/p?colour=blue", "blue"), "keep")
+    assert match.url == "https://shop/p?colour=red" and match.crawl_id == first
+    assert second is not None and len(stored_urls(store)) == 2
+    assert [v["crawl_id"] for v in index.group_of("https://shop/p?colour=blue")] == [first, second]
+
+
+def test_skip_drops_variants(stores):
+    store, index = stores
+    first, _ = index.record(store, crawl_result("https://shop/p?colour=red", "red"), "skip")
+    crawl_id, match = index.record(store, crawl_result("https://shop/p?colour=blue", "blue"), "skip")
+    assert crawl_id is None and match.crawl_id == first
+    assert stored_urls(store) == ["https://shop/p?colour=red"]
+    assert not index.contains("https://shop/p?colour=blue")
+
+
+def test_collapse_lists_variants_without_storing_them(stores):
+    store, index = stores
+    first, _ = index.record(store, crawl_result("https://shop/p?colour=red", "red"), "collapse")
+    crawl_id, match = index.record(store, crawl_result("https://shop/p?colour=blue", "blue"), "collapse")
+    assert crawl_id is None and match.crawl_id == first
+    assert stored_urls(store) == ["https://shop/p?colour=red"]
+    assert [(v["url"], v["crawl_id"]) for v in index.group_of("https://shop/p?colour=red")] == [
+        ("https://shop/p?colour=red", first), ("https://shop/p?colour=blue", None)]
+    #a later variant joins the same group, whichever member is closest
+    index.record(store, crawl_result("https://shop/p?colour=green", "green"), "collapse")
+    assert len(index.group_of("https://shop/p?colour=green")) == 3
+    assert index.groups()[0]["size"] == 3
+
+
+def test_different_products_are_not_grouped(stores):
+    store, index = stores
+    index.record(store, crawl_result("https://shop/p/1", "red"), "skip")
+    other = ProductCrawler.from_html("https://shop/p/2", PRODUCT_PAGE.replace(
+        "</body>", "<p>" + " ".join(f"word{i}" for i in range(60)) + "</p></body>")).extract(0)
+    crawl_id, match = index.record(store, other, "skip")
+    assert crawl_id is not None and match is None
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+import requests
+
+from conftest import PRODUCT_PAGE, response
+from politeness import MAX_RETRY_AFTER, PolitenessScheduler, RobotsDisallowed
+
+
+def scheduler(**kwargs):
+    return PolitenessScheduler("test-agent", **{"rate": 100, "burst": 100, "max_retries": 2,
+                                                "respect_robots": False, **kwargs})
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retry_after_pauses_the_host(stub, status):
+    stub.route("/p", response(status, "slow down", {"Retry-After": "1"}), response(body=PRODUCT_PAGE))
+    polite = scheduler()
+    start = time.monotonic()
+    with requests.Session() as session:
+        fetched, _ = polite.fetch(session, stub.url("/p"), timeout=5)
+    assert fetched.status_code == 200
+    assert stub.hits["/p"] == 2
+    assert time.monotonic() - start >= 0.9
+    #halved by the throttled response, one step back up after the retry succeeded
+    assert polite.host(stub.url("/")).rate == 50 + 100 / 20
+
+
+def test_retry_after_pauses_the_host_async(stub):
+    stub.route("/p", response(429, "slow down", {"Retry-After": "1"}), response(body=PRODUCT_PAGE))
+    polite = scheduler()
+
+    async def fetch():
+        async with httpx.AsyncClient() as client:
+            start = time.monotonic()
+            fetched, _ = await polite.fetch_async(client, stub.url("/p"))
+            return fetched.status_code, time.monotonic() - start
+
+    status, elapsed = asyncio.run(fetch())
+    assert status == 200
+    assert stub.hits["/p"] == 2
+    assert elapsed >= 0.9
+
+
+def test_paused_host_holds_back_other_requests(stub):
+    stub.route("/p", response(429, "slow down", {"Retry-After": "1"}))
+    polite = scheduler(max_retries=0)
+    with requests.Session() as session:
+        fetched, _ = polite.fetch(session, stub.url("/p"), timeout=5)
+    assert fetched.status_code == 429
+    #the request gave up, the host stays paused for the next one
+    assert 0.5 < polite.take(stub.url("/other")) <= 1
+
+
+def test_retry_after_over_the_limit_is_not_waited_for(stub):
+    stub.route("/p", response(503, "maintenance", {"Retry-After": str(int(MAX_RETRY_AFTER) + 60)}))
+    polite = scheduler()
+    start = time.monotonic()
+    with requests.Session() as session:
+        fetched, _ = polite.fetch(session, stub.url("/p"), timeout=5)
+    assert fetched.status_code == 503
+    assert stub.hits["/p"] == 1
+    assert time.monotonic() - start < 0.5
+
+
+def test_robots_disallow(stub):
+    stub.route("/robots.txt", response(body="User-agent: *\nDisallow: /private", headers={"Content-Type": "text/plain"}))
+    stub.route("/private/p", response(body=PRODUCT_PAGE))
+    polite = scheduler(respect_robots=True)
+    with requests.Session() as session:
+        with pytest.raises(RobotsDisallowed):
+            polite.fetch(session, stub.url("/private/p"), timeout=5)
+    assert "/private/p" not in stub.hits
+
+
+def test_only_transport_errors_are_retried(stub, closed_port_url):
+    stub.route("/loop", response(302, "", {"Location": "/loop"}))
+    polite = scheduler(max_retries=1)
+    with requests.Session() as session:
+        with pytest.raises(requests.ConnectionError):
+            polite.fetch(session, closed_port_url, timeout=5)
+        with pytest.raises(requests.TooManyRedirects):
+            polite.fetch(session, stub.url("/loop"), timeout=5)
+    #the refused connection paused its host for a retry, the redirect loop was followed once
+    assert polite.host(closed_port_url).blocked_until > 0
+    assert stub.hits["/loop"] == requests.models.DEFAULT_REDIRECT_LIMIT + 1
@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+import scoring
+from score_cache import ScoreCache
+from scoring import get_rules
+
+CRAWL = {"product": {"name": "Trail Runner 2", "brand": "Acme"}, "content": {"word_count": 400}}
+
+
+@pytest.fixture
+def rules_path(tmp_path, monkeypatch):
+    #a rules file of its own, reloaded on every call
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(get_rules().spec), encoding="utf-8")
+    monkeypatch.setattr(scoring, "RULES_PATH", str(path))
+    monkeypatch.setattr(scoring, "RULES_RELOAD_INTERVAL", 0)
+    return path
+
+
+def touch(path, spec=None):
+    #rewrites the rules file with a new mtime, so it is recompiled
+    if spec is not None:
+        path.write_text(json.dumps(spec), encoding="utf-8")
+    mtime = os.stat(path).st_mtime + 10
+    os.utime(path, (mtime, mtime))
+
+
+def test_rules_edit_misses_the_cache(tmp_path, rules_path):
+    cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+    first = cache.score(CRAWL)
+    assert cache.score(CRAWL) == first
+    assert (cache.hits, cache.misses) == (1, 1)
+    touch(rules_path, {**get_rules().spec, "bands": [[50, "pass"], [0, "fail"]]})
+    assert cache.score(CRAWL)["readiness_band"] in ("pass", "fail")
+    assert cache.misses == 2
+
+
+def test_scorer_version_misses_the_cache(tmp_path, rules_path, monkeypatch):
+    cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+    cache.score(CRAWL)
+    version = cache.rules_version()
+    monkeypatch.setattr(scoring, "SCORER_VERSION", scoring.SCORER_VERSION + 1)
+    touch(rules_path)
+    assert cache.rules_version() != version
+    cache.score(CRAWL)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_startup_purges_scores_of_other_versions(tmp_path):
+    path = str(tmp_path / "scores.sqlite")
+    old = ScoreCache(path, rules_version="old")
+    old.put("a", {"final_score": 1})
+    assert ScoreCache(path, rules_version="old").get("a") == {"final_score": 1}
+    current = ScoreCache(path, rules_version="new")
+    assert current.db.execute("SELECT COUNT(*) FROM scores").fetchone()[0] == 0
+    assert current.get("a", "old") is None
@@ -0,0 +1,86 @@
+import json
+import random
+
+import pytest
+
+import scoring
+from bulk_scoring import score_many
+from scoring import AIScoringEngine, CompiledRules, RulesFile, get_rules
+
+
+def record(rng):
+    text = lambda: rng.choice(("", "Acme", "Acme Runner Shoe Model"))
+    return {
+        "product": {"name": text(), "brand": text(), "sku": text(), "price": rng.choice((None, "19.99", "₹ 1,999"))},
+        "content": {
+            "word_count": rng.choice((0, 99, 100, 150, 151, 800, 801, 3000)),
+            "headings": [{"level": rng.choice(("h1", "h2", "h3"))} for _ in range(rng.randint(0, 9))],
+            "specifications": {f"spec {i}": "value" for i in range(rng.randint(0, 9))},
+        },
+        "trust_signals": {"has_return_policy": rng.random() < 0.5},
+        "schema_data": rng.choice(([], [{"@type": "Product"}])),
+    }
+
+
+def test_single_and_bulk_scores_agree():
+    records = [record(random.Random(seed)) for seed in range(300)]
+    assert score_many(records) == [AIScoringEngine(r).compute_score() for r in records]
+
+
+def test_tiers_and_strict_thresholds():
+    breakdown = lambda words: AIScoringEngine({"content": {"word_count": words}}).score_content_depth()["breakdown"]
+    #word_count tiers are strict: 150 words is not over 150
+    assert breakdown(150)["word_count"] == 0
+    assert breakdown(151)["word_count"] == 2
+    assert breakdown(5000)["word_count"] == 8
+
+
+def test_rules_are_used_by_the_engine():
+    spec = {**get_rules().spec, "bands": [[50, "pass"], [0, "fail"]]}
+    engine = AIScoringEngine({}, CompiledRules(spec))
+    assert engine.compute_score()["readiness_band"] == "fail"
+
+
+def test_penalty_when_missing_or_present():
+    spec = dict(get_rules().spec)
+    spec["penalties"] = [
+        {"key": "no_brand", "feature": "present:product.brand", "when": "missing", "points": -3},
+        {"key": "no_sku", "feature": "present:product.sku", "points": -2},
+        {"key": "placeholder_gtin", "feature": "present:product.gtin", "when": "present", "points": -4},
+    ]
+    rules = CompiledRules(spec)
+    penalties = lambda product: AIScoringEngine({"product": product}, rules).compute_score()["penalties"]
+    assert penalties({}) == {"no_brand": -3, "no_sku": -2}
+    assert penalties({"brand": "Acme", "sku": "A1", "gtin": "000"}) == {"placeholder_gtin": -4}
+    assert score_many([{"product": {"gtin": "000"}}], rules)[0]["penalties"] == {
+        "no_brand": -3, "no_sku": -2, "placeholder_gtin": -4}
+
+
+def test_readiness_band_uses_the_engine_rules():
+    spec = {**get_rules().spec, "bands": [[50, "pass"], [0, "fail"]]}
+    engine = AIScoringEngine({}, CompiledRules(spec))
+    assert engine._readiness_band(60) == "pass"
+    assert engine._readiness_band(49.99) == "fail"
+
+
+def test_schema_types_are_normalised():
+    schema = lambda *items: AIScoringEngine({"schema_data": list(items)}).score_schema()["breakdown"]
+    for item in ({"@type": "Product"}, {"@type": ["Product", "Thing"]}, {"@type": "https://schema.org/Product"},
+                 {"@type": "schema:Product"}):
+        assert schema(item)["product_schema"] == 2
+        assert score_many([{"schema_data": [item]}])[0]["breakdowns"]["schema"]["product_schema"] == 2
+    assert schema({"@type": "Organization"})["product_schema"] == 0
+    assert schema({"name": "untyped"})["schema_markup"] == 0
+
+
+def test_rules_file_that_disappears_keeps_the_compiled_rules(tmp_path, monkeypatch):
+    monkeypatch.setattr(scoring, "RULES_RELOAD_INTERVAL", 0)
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(get_rules().spec), encoding="utf-8")
+    rules_file = RulesFile(str(path))
+    rules = rules_file.get()
+    #replaced by a rename, or deleted by mistake: the rules already compiled stay active
+    path.unlink()
+    assert rules_file.get() is rules
+    with pytest.raises(FileNotFoundError):
+        RulesFile(str(path)).get()
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+import serialization
+from conftest import PRODUCT_PAGE, response
+from crawl_store import CrawlStore
+from crawler import ProductCrawler
+from serialization import MIN_COMPRESS_BYTES, ZSTD_MAGIC, pack, parse_fields, project, top_level, unpack
+
+RESULT = {
+    "page_info": {"url": "https://shop/p", "title": "Trail Runner 2", "status_code": 200},
+    "product": {"name": "Trail Runner 2", "offers": {"price": "129.00", "currency": "EUR"}},
+    "links": {"internal": [], "external": []},
+}
+
+
+def test_fields_are_parsed_into_paths():
+    assert parse_fields(None) is None
+    assert parse_fields(" , ") is None
+    assert parse_fields("product, page_info.url,product.offers.price") == [
+        ["product"], ["page_info", "url"], ["product", "offers", "price"]]
+
+
+def test_nested_projection():
+    assert project(RESULT, None) is RESULT
+    assert project(RESULT, parse_fields("page_info.url,product.offers.price")) == {
+        "page_info": {"url": "https://shop/p"}, "product": {"offers": {"price": "129.00"}}}
+    assert project(RESULT, parse_fields("links,product.name")) == {
+        "links": RESULT["links"], "product": {"name": "Trail Runner 2"}}
+    #the projection does not change the result it was taken from
+    assert RESULT["product"]["offers"] == {"price": "129.00", "currency": "EUR"}
+
+
+def test_unknown_fields_are_left_out():
+    assert project(RESULT, parse_fields("nope,product.nope,page_info.url.deeper")) == {}
+    assert project(RESULT, parse_fields("nope,product.name")) == {"product": {"name": "Trail Runner 2"}}
+
+
+def test_top_level_names_reached_by_a_projection():
+    names = ("clean_text", "schema_data", "links")
+    assert top_level(None, names) == list(names)
+    assert top_level(parse_fields("links.internal,product"), names) == ["links"]
+
+
+def test_batch_streams_one_json_line_per_page(api, stub):
+    for i in range(3):
+        stub.route(f"/ndjson/{i}", response(body=PRODUCT_PAGE.replace("Trail Runner 2", f"Trail Runner {i}")))
+    urls = [stub.url(f"/ndjson/{i}") for i in range(3)] + [stub.url("/ndjson/missing")]
+    with api.stream("POST", "/crawl_batch", json={"urls": urls, "stream": True,
+                                                 "fields": "product.name,page_info.status_code"}) as streamed:
+        assert streamed.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in streamed.iter_lines() if line]
+    pages, totals = lines[:-1], lines[-1]
+    assert totals == {"message": "Batch crawl finished", "crawled": 3, "duplicates": 0, "failed": 1}
+    assert {page["url"] for page in pages} == set(urls)
+    names = {page["data"]["product"]["name"] for page in pages if "data" in page}
+    assert names == {"Trail Runner 0", "Trail Runner 1", "Trail Runner 2"}
+    assert all(page["data"] == {"product": {"name": page["data"]["product"]["name"]},
+                                "page_info": {"status_code": 200}} for page in pages if "data" in page)
+
+
+SECTION = {"clean_text": "A light shoe for long days in the mountains. " * 40, "price": 129.0, "tags": ["trail"]}
+
+
+@pytest.mark.parametrize("compression", ["zstd", "zlib", "none"])
+def test_sections_round_trip(monkeypatch, compression):
+    monkeypatch.setattr(serialization, "STORAGE_COMPRESSION", compression)
+    stored = pack(SECTION)
+    assert unpack(stored) == SECTION
+    assert isinstance(stored, str) == (compression == "none")
+    assert (stored[:4] == ZSTD_MAGIC) == (compression == "zstd")
+    #small sections stay plain json whatever the compression
+    assert pack({"a": 1}) == '{"a":1}'
+    assert len(serialization.dumps_bytes({"a": 1})) < MIN_COMPRESS_BYTES
+
+
+def test_sections_of_either_compression_are_read(monkeypatch):
+    monkeypatch.setattr(serialization, "STORAGE_COMPRESSION", "zlib")
+    zlib_row = pack(SECTION)
+    monkeypatch.setattr(serialization, "STORAGE_COMPRESSION", "zstd")
+    zstd_row = pack(SECTION)
+    assert unpack(zlib_row) == unpack(zstd_row) == SECTION
+    #without zstandard the zlib fallback still reads its own rows, zstd ones fail loudly
+    monkeypatch.setattr(serialization, "zstandard", None)
+    assert unpack(zlib_row) == SECTION
+    with pytest.raises(RuntimeError):
+        unpack(zstd_row)
+
+
+def test_compact_compresses_rows_stored_as_text(tmp_path, monkeypatch):
+    monkeypatch.setattr(serialization, "STORAGE_COMPRESSION", "none")
+    store = CrawlStore(str(tmp_path / "crawls.sqlite"))
+    html = PRODUCT_PAGE.replace("</body>", "<p>" + "Long description of the shoe. " * 200 + "</p></body>")
+    results = [ProductCrawler.from_html(f"https://shop/p/{i}", html).extract(0) for i in range(3)]
+    ids = [store.save(result) for result in results]
+    large_text = ("SELECT (SELECT COUNT(*) FROM crawls WHERE typeof(data) = 'text'"
+                  " AND length(CAST(data AS BLOB)) >= :n) + (SELECT COUNT(*) FROM crawl_fields"
+                  " WHERE typeof(value) = 'text' AND length(CAST(value AS BLOB)) >= :n)")
+    sections = store.db.execute(large_text, {"n": MIN_COMPRESS_BYTES}).fetchone()[0]
+    assert sections >= 6
+    monkeypatch.setattr(serialization, "STORAGE_COMPRESSION", "zstd")
+    stats = store.compact(batch=2)
+    assert stats["sections"] == sections
+    assert stats["bytes_after"] < stats["bytes_before"]
+    #sections under the threshold stay text, every other one is compressed
+    assert store.db.execute(large_text, {"n": MIN_COMPRESS_BYTES}).fetchone()[0] == 0
+    assert [store.get(crawl_id) for crawl_id in ids] == [{**r, "crawl_id": i} for r, i in zip(results, ids)]
+    assert store.compact()["sections"] == 0
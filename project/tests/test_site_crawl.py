@@ -0,0 +1,63 @@
+import asyncio
+import gzip
+
+import httpx
+
+from conftest import PRODUCT_PAGE, endless_body, response
+from crawl_store import CrawlStore
+from site_crawl import SiteFrontier, normalize_urls, parse_sitemap, run_site_crawl
+from streaming import CHUNK_SIZE, MAX_PAGE_BYTES, read_raw_async
+
+
+def sitemap(urls, padding=0):
+    entries = "".join(f"<url><loc>{url}</loc></url>" for url in urls)
+    return (f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}'
+            + " " * padding + '<url><loc>https://shop.example.com/last</loc></url></urlset>').encode("utf-8")
+
+
+def test_gzipped_sitemap_is_inflated_up_to_the_cap():
+    #20 MB of xml in a few KB of gzip: read to the cap, the urls before it are kept
+    urls = [f"https://shop.example.com/p/{i}" for i in range(3)]
+    body = gzip.compress(sitemap(urls, padding=20 * 1024 * 1024))
+    assert len(body) < MAX_PAGE_BYTES // 10
+    pages, sitemaps = parse_sitemap(body)
+    assert pages == urls
+    assert sitemaps == []
+    assert parse_sitemap(gzip.compress(sitemap(urls)))[0] == urls + ["https://shop.example.com/last"]
+
+
+def test_sitemap_body_is_read_up_to_the_cap(stub):
+    stub.route("/sitemap.xml", response(body=endless_body(4 * MAX_PAGE_BYTES // CHUNK_SIZE),
+                                        headers={"Content-Type": "application/xml"}))
+
+    async def read():
+        async with httpx.AsyncClient() as client:
+            fetched = await client.send(client.build_request("GET", stub.url("/sitemap.xml")), stream=True)
+            return await read_raw_async(fetched)
+
+    body, info = asyncio.run(read())
+    assert len(body) == MAX_PAGE_BYTES
+    assert info["truncated"]
+
+
+
+def test_malformed_urls_are_skipped():
+    urls = ["https://Shop.example.com/p/1?utm_source=x", "https://shop.example.com:99999/p/2",
+            "https://[::1/p/3", "https://shop.example.com:abc/p/4", "https://shop.example.com/p/5"]
+    assert normalize_urls(urls) == ["https://shop.example.com/p/1", "https://shop.example.com/p/5"]
+
+
+def test_site_crawl_survives_malformed_sitemap_entries_and_links(stub, tmp_path):
+    #a bad port in the sitemap and a broken IPv6 href on a page are dropped, the rest is crawled
+    linking = PRODUCT_PAGE.replace("</body>", '<a href="http://[::1/broken">x</a><a href="/p/1">next</a></body>')
+    stub.route("/p/0", response(body=linking))
+    stub.route("/p/1", response(body=PRODUCT_PAGE.replace("Trail Runner 2", "Trail Runner 3")))
+    stub.route("/sitemap.xml", response(body=sitemap([stub.url("/p/0"), "http://127.0.0.1:99999/x"]),
+                                        headers={"Content-Type": "application/xml"}))
+    frontier = SiteFrontier(str(tmp_path / "sites.sqlite"))
+    site_id = frontier.create(None, stub.url("/sitemap.xml"), 2, 10, "keep")
+    asyncio.run(run_site_crawl(frontier, CrawlStore(str(tmp_path / "crawls.sqlite")), site_id))
+    assert frontier.site(site_id)["status"] == "finished"
+    pages = {page["url"]: page for page in frontier.pages(site_id)}
+    assert set(pages) == {stub.url("/p/0"), stub.url("/p/1")}
+    assert all(page["state"] == "done" for page in pages.values())
@@ -0,0 +1,63 @@
+import tracemalloc
+
+import requests
+
+from conftest import PRODUCT_PAGE, endless_body, response
+from streaming import CHUNK_SIZE, MAX_PAGE_BYTES, BodyReader, read_body
+
+
+def oversized_page(size):
+    #the product page padded with paragraphs past size bytes
+    paragraph = "<p>Plenty of words about the shoe to make the page long.</p>\n"
+    padding = paragraph * (size // len(paragraph) + 1)
+    return PRODUCT_PAGE.replace("</body>", padding + "</body>")
+
+
+def test_reader_stops_at_the_cap():
+    reader = BodyReader("text/html", max_bytes=10)
+    assert reader.feed(b"<p>12345")
+    assert not reader.feed(b"67890</p>")
+    assert reader.text() == "<p>1234567"
+    assert reader.info()["bytes"] == 10
+    assert reader.info()["truncated"]
+
+
+def test_character_cut_by_the_cap_is_dropped():
+    reader = BodyReader("text/html; charset=utf-8", max_bytes=4)
+    reader.feed("<p>é</p>".encode("utf-8"))
+    assert reader.text() == "<p>"
+
+
+def test_crawl_product_marks_truncated_pages(api, stub):
+    stub.route("/big", response(body=oversized_page(2 * MAX_PAGE_BYTES)))
+    stub.route("/small", response(body=PRODUCT_PAGE))
+    big = api.post("/crawl_product", json={"url": stub.url("/big"), "fields": "page_info"}).json()
+    assert big["data"]["page_info"]["truncated"]
+    assert big["data"]["page_info"]["bytes_downloaded"] == MAX_PAGE_BYTES
+    small = api.post("/crawl_product", json={"url": stub.url("/small"), "fields": "page_info"}).json()
+    assert not small["data"]["page_info"]["truncated"]
+    assert small["data"]["page_info"]["bytes_downloaded"] == len(PRODUCT_PAGE.encode("utf-8"))
+
+
+def test_crawl_batch_marks_truncated_pages(api, stub):
+    stub.route("/big", response(body=endless_body(4 * MAX_PAGE_BYTES // CHUNK_SIZE)))
+    body = api.post("/crawl_batch", json={"urls": [stub.url("/big")], "fields": "page_info"}).json()
+    page_info = body["results"][0]["data"]["page_info"]
+    assert page_info["truncated"]
+    assert page_info["bytes_downloaded"] == MAX_PAGE_BYTES
+
+
+def test_peak_memory_stays_near_the_cap(stub):
+    #a body 40 times the cap is read only up to the cap, memory does not grow with the body
+    stub.route("/huge", response(body=endless_body(40 * MAX_PAGE_BYTES // CHUNK_SIZE)))
+    with requests.Session() as session:
+        tracemalloc.start()
+        try:
+            html, info = read_body(session.get(stub.url("/huge"), stream=True, timeout=10))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    assert info["truncated"]
+    assert len(html) == MAX_PAGE_BYTES
+    assert peak < 4 * MAX_PAGE_BYTES
+
@@ -0,0 +1,94 @@
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+#==========================================================================
+# Trust keyword tables, keyed by the page language (<html lang>).
+# "en" is always applied, a page in another language adds its own table
+# on top. Keywords are matched lowercased, anywhere in the page text.
+#==========================================================================
+TRUST_KEYWORDS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "en": {
+        "has_return_policy":       ("return policy", "returns"),
+        "has_refund_policy":       ("refund policy", "refunds"),
+        "has_warranty_info":       ("warranty",),
+        "has_shipping_info":       ("shipping", "delivery"),
+        "has_cancellation_policy": ("cancellation",),
+        "mentions_secure_payment": ("secure payment", "100% secure", "ssl"),
+        "has_cod_option":          ("cash on delivery", "cod"),
+        "mentions_reviews":        ("review", "ratings"),
+        "mentions_testimonials":   ("testimonial",),
+        "official_store_claim":    ("official store", "authorized seller"),
+    },
+}
+
+#matched against the text of the page's links
+LINK_KEYWORDS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "en": {
+        "has_contact_page": ("contact",),
+        "has_about_page":   ("about",),
+    },
+}
+
+#any run of 9+ digits, spaces and dashes starting with a digit, as the old r"\+?\d[\d\s-]{8,}" did
+PHONE = re.compile(r"\d[\d\s-]{8}")
+#what may follow the "@" of an email address
+EMAIL_DOMAIN = re.compile(r"[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+EMAIL_LOCAL_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789._%+-")
+
+
+def page_language(lang: Optional[str]) -> str:
+    #"de-AT" -> "de"
+    return (lang or "").strip().lower().replace("_", "-").split("-")[0]
+
+
+class KeywordMatcher:
+    #signal -> keywords table compiled once, each signal stops at its first hit
+    def __init__(self, tables: Iterable[Dict[str, Tuple[str, ...]]]):
+        merged: Dict[str, list] = {}
+        for table in tables:
+            for signal, keywords in table.items():
+                merged.setdefault(signal, []).extend(k.lower() for k in keywords)
+        self.signals = tuple((signal, self._minimal(keywords)) for signal, keywords in merged.items())
+
+    @staticmethod
+    def _minimal(keywords) -> Tuple[str, ...]:
+        #a keyword containing another keyword of the same signal can never decide the match
+        unique = sorted(set(keywords), key=len)
+        kept = []
+        for keyword in unique:
+            if not any(shorter in keyword for shorter in kept):
+                kept.append(keyword)
+        return tuple(kept)
+
+    def match(self, text: str) -> Dict[str, bool]:
+        #str.__contains__ is a C-level substring search, measured faster here than one
+        #compiled alternation or an Aho-Corasick automaton over the same text
+        return {signal: any(keyword in text for keyword in keywords) for signal, keywords in self.signals}
+
+
+def mentions_phone(text: str) -> bool:
+    return PHONE.search(text) is not None
+
+
+def mentions_email(text: str) -> bool:
+    #only positions right after an "@" can start a match, the rest of the text is never scanned by the regex
+    at = text.find("@", 1)
+    while at != -1:
+        if text[at - 1] in EMAIL_LOCAL_CHARS and EMAIL_DOMAIN.match(text, at + 1):
+            return True
+        at = text.find("@", at + 1)
+    return False
+
+
+_matchers: Dict[Tuple[str, str], KeywordMatcher] = {}
+
+
+def keyword_matcher(kind: str, language: str = "") -> KeywordMatcher:
+    #matchers are compiled once per keyword table and language
+    key = (kind, language)
+    matcher = _matchers.get(key)
+    if matcher is None:
+        tables = TRUST_KEYWORDS if kind == "text" else LINK_KEYWORDS
+        languages = ["en"] + ([language] if language != "en" and language in tables else [])
+        matcher = _matchers[key] = KeywordMatcher(tables[lang] for lang in languages)
+    return matcher